@@ -0,0 +1,63 @@
+"""
+Быстрые рендереры ответов API.
+
+JSON собирается через orjson (в несколько раз быстрее стандартного json),
+значения, которые orjson не знает или форматирует иначе (Decimal, даты,
+ленивые строки), передаются кодировщику DRF, поэтому ответ совпадает с
+JSONRenderer. MessagePack отдается клиентам, приславшим
+`Accept: application/msgpack`. Обе библиотеки необязательны: без orjson
+работает обычный JSONRenderer, без msgpack рендерер не подключается
+(см. REST_FRAMEWORK в настройках).
+"""
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson необязателен
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - msgpack необязателен
+    msgpack = None
+
+# Кодировщик DRF для типов, которых нет в orjson и msgpack
+_encoder = encoders.JSONEncoder()
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson с тем же форматом ответа"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if orjson is None or indent is not None or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        content = orjson.dumps(data, default=_encoder.default, option=ORJSON_OPTIONS)
+        # Как и DRF, экранируем U+2028/U+2029, чтобы JSON оставался валидным JS
+        if b"\xe2\x80\xa8" in content or b"\xe2\x80\xa9" in content:
+            content = content.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+                b"\xe2\x80\xa9", b"\\u2029"
+            )
+        return content
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Ответ в MessagePack (Accept: application/msgpack)"""
+
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=_encoder.default, use_bin_type=True)
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+from importlib.util import find_spec
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -51,6 +53,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Сжатие стоит первым, чтобы обрабатывать уже готовый ответ
+    "football_mini_app.middleware.CompressionMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -95,6 +99,38 @@ DATABASES = {
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
+AUTH_USER_MODEL = "users.User"
+
+HAS_MSGPACK = find_spec("msgpack") is not None
+
+REST_FRAMEWORK = {
+    "DEFAULT_AUTHENTICATION_CLASSES": [
+        "users.authentication.TelegramInitDataAuthentication",
+        "rest_framework.authentication.SessionAuthentication",
+        "rest_framework.authentication.BasicAuthentication",
+    ],
+    # JSON через orjson; MessagePack — если установлен msgpack
+    "DEFAULT_RENDERER_CLASSES": [
+        "football_mini_app.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+        *(["football_mini_app.renderers.MessagePackRenderer"] if HAS_MSGPACK else []),
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "football_mini_app.parsers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+        *(["football_mini_app.parsers.MessagePackParser"] if HAS_MSGPACK else []),
+    ],
+}
+
+# Ответы меньше порога (в байтах) не сжимаются
+COMPRESSION_MIN_SIZE = 1024
+
+# Токен бота для проверки подписи initData Telegram WebApp
+TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN", "")
+# Принимать только подписанную initData, без telegram_id в параметрах
+TELEGRAM_AUTH_REQUIRED = False
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+from importlib.util import find_spec
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -64,6 +66,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Сжатие стоит первым, чтобы обрабатывать уже готовый ответ
+    "football_mini_app.middleware.CompressionMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -108,6 +112,57 @@ DATABASES = {
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
+AUTH_USER_MODEL = "users.User"
+
+HAS_MSGPACK = find_spec("msgpack") is not None
+
+REST_FRAMEWORK = {
+    "DEFAULT_AUTHENTICATION_CLASSES": [
+        "users.authentication.TelegramInitDataAuthentication",
+        "rest_framework.authentication.SessionAuthentication",
+        "rest_framework.authentication.BasicAuthentication",
+    ],
+    # JSON через orjson; MessagePack — если установлен msgpack
+    "DEFAULT_RENDERER_CLASSES": [
+        "football_mini_app.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+        *(["football_mini_app.renderers.MessagePackRenderer"] if HAS_MSGPACK else []),
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "football_mini_app.parsers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+        *(["football_mini_app.parsers.MessagePackParser"] if HAS_MSGPACK else []),
+    ],
+}
+
+# Ответы меньше порога (в байтах) не сжимаются
+COMPRESSION_MIN_SIZE = 1024
+
+# Общий для всех процессов gunicorn кэш: снимки JSON товаров, фасеты,
+# счетчики попаданий. Redis, если задан REDIS_URL (нужен пакет redis),
+# иначе файлы на диске сервера
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.environ.get("CACHE_DIR", BASE_DIR / "cache"),
+            "OPTIONS": {"MAX_ENTRIES": 50000},
+        }
+    }
+
+# Токен бота для проверки подписи initData Telegram WebApp
+TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN", "")
+# Принимать только подписанную initData, без telegram_id в параметрах
+TELEGRAM_AUTH_REQUIRED = False
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
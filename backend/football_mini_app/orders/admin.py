@@ -5,6 +5,7 @@ from django.utils.safestring import mark_safe
 from django.contrib import messages
 from django.db import transaction
 from .models import Order, OrderItem
+from . import stats
 
 
 class OrderItemInline(admin.TabularInline):
@@ -120,13 +121,23 @@ class OrderAdmin(admin.ModelAdmin):
     confirm_orders.short_description = "Подтвердить выбранные заказы"
 
     def ship_orders(self, request, queryset):
-        updated = queryset.filter(status="confirmed").update(status="shipped")
+        orders = queryset.filter(status="confirmed")
+        with transaction.atomic():
+            user_ids = list(orders.values_list("user_id", flat=True))
+            updated = orders.update(status="shipped")
+            # update() идет в обход save(): пересчитываем сводки пользователей
+            stats.refresh(user_ids)
         messages.success(request, f"Обновлено {updated} заказов в статус 'Отправлен'")
 
     ship_orders.short_description = "Отметить как отправленные"
 
     def deliver_orders(self, request, queryset):
-        updated = queryset.filter(status="shipped").update(status="delivered")
+        orders = queryset.filter(status="shipped")
+        with transaction.atomic():
+            user_ids = list(orders.values_list("user_id", flat=True))
+            updated = orders.update(status="delivered")
+            # update() идет в обход save(): пересчитываем сводки пользователей
+            stats.refresh(user_ids)
         messages.success(request, f"Обновлено {updated} заказов в статус 'Доставлен'")
 
     deliver_orders.short_description = "Отметить как доставленные"
@@ -0,0 +1,90 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.core.management.base import BaseCommand
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+
+from orders.views import OrderViewSet
+from products.models import CartItem, Product
+from users.models import User
+
+
+class Rollback(Exception):
+    """Откат всех данных замера"""
+
+
+class Command(BaseCommand):
+    help = "Замерить время оформления заказа из корзины разного размера"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lines",
+            type=int,
+            nargs="+",
+            default=[1, 10, 100],
+            help="Количество позиций в корзине",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=20, help="Повторов на каждый размер"
+        )
+
+    def handle(self, *args, **options):
+        view = OrderViewSet.as_view({"post": "create_from_cart"})
+        # Разрешенный домен: ссылки на фото строятся через request.get_host()
+        factory = APIRequestFactory(SERVER_NAME=settings.ALLOWED_HOSTS[0])
+
+        self.stdout.write(
+            f"{'позиций':>8} {'запросов':>9} {'медиана, мс':>12} {'p95, мс':>9}"
+        )
+        for lines in options["lines"]:
+            timings = []
+            queries = 0
+            for _ in range(options["repeat"]):
+                try:
+                    with transaction.atomic():
+                        user = self.fill_cart(lines)
+                        request = factory.post(
+                            "/api/orders/create_from_cart/",
+                            {
+                                "telegram_id": user.telegram_id,
+                                "shipping_address": "bench",
+                                "phone_number": "0",
+                            },
+                            format="json",
+                        )
+                        with CaptureQueriesContext(connection) as context:
+                            started = time.perf_counter()
+                            response = view(request)
+                            timings.append(time.perf_counter() - started)
+                        if response.status_code != 201:
+                            raise RuntimeError(response.data)
+                        queries = len(context.captured_queries)
+                        raise Rollback
+                except Rollback:
+                    pass
+
+            timings.sort()
+            median = statistics.median(timings) * 1000
+            p95 = timings[int(len(timings) * 0.95) - 1] * 1000
+            self.stdout.write(f"{lines:>8} {queries:>9} {median:>12.2f} {p95:>9.2f}")
+
+    def fill_cart(self, lines):
+        user = User.objects.create(telegram_id=-int(time.time_ns() % 10**12))
+        products = Product.objects.bulk_create(
+            Product(
+                team=f"bench {index}",
+                brand="bench",
+                price=1000,
+                size="M",
+                color="bench",
+                stock_quantity=10,
+            )
+            for index in range(lines)
+        )
+        CartItem.objects.bulk_create(
+            CartItem(user=user, product=product, quantity=1) for product in products
+        )
+        return user
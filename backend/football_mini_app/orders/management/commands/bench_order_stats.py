@@ -0,0 +1,83 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from orders import stats
+from orders.models import Order
+from users.models import User
+
+
+class Rollback(Exception):
+    """Откат всех данных замера"""
+
+
+def legacy_stats(user_id):
+    """Прежний расчет: все заказы в Python и еще три COUNT"""
+    orders = Order.objects.filter(user_id=user_id)
+    return {
+        "total_orders": orders.count(),
+        "total_spent": sum(order.total_amount for order in orders),
+        "pending_orders": orders.filter(status="pending").count(),
+        "completed_orders": orders.filter(status="delivered").count(),
+    }
+
+
+class Command(BaseCommand):
+    help = "Сравнить способы расчета статистики заказов пользователя"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--orders", type=int, default=10000, help="Заказов у пользователя"
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=20, help="Повторов каждого способа"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                user_id = self.create_orders(options["orders"])
+                stats.rebuild(user_id)
+
+                expected = stats.aggregate_stats(user_id)
+                methods = [
+                    ("python", legacy_stats),
+                    ("aggregate", stats.aggregate_stats),
+                    ("rollup", stats.get_stats),
+                ]
+                self.stdout.write(f"{'способ':>10} {'медиана, мс':>12} {'p95, мс':>9}")
+                for name, method in methods:
+                    timings = []
+                    for _ in range(options["repeat"]):
+                        started = time.perf_counter()
+                        result = method(user_id)
+                        timings.append(time.perf_counter() - started)
+                    if result != expected:
+                        raise RuntimeError(f"{name}: {result} != {expected}")
+                    timings.sort()
+                    median = statistics.median(timings) * 1000
+                    p95 = timings[int(len(timings) * 0.95) - 1] * 1000
+                    self.stdout.write(f"{name:>10} {median:>12.2f} {p95:>9.2f}")
+                raise Rollback
+        except Rollback:
+            pass
+
+    def create_orders(self, count):
+        user = User.objects.create(telegram_id=-int(time.time_ns() % 10**12))
+        statuses = [status for status, _ in Order.STATUS_CHOICES]
+        # bulk_create обходит сигналы, поэтому сводка строится после вставки
+        Order.objects.bulk_create(
+            (
+                Order(
+                    user=user,
+                    order_number=f"BENCH-{user.pk}-{index}",
+                    status=statuses[index % len(statuses)],
+                    total_amount=1000 + index % 7,
+                )
+                for index in range(count)
+            ),
+            batch_size=1000,
+        )
+        return user.pk
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0002_alter_order_options_alter_orderitem_options_and_more"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrderStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "total_orders",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Всего заказов"
+                    ),
+                ),
+                (
+                    "total_spent",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=12,
+                        verbose_name="Общая сумма",
+                    ),
+                ),
+                (
+                    "pending_orders",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Ожидают подтверждения"
+                    ),
+                ),
+                (
+                    "completed_orders",
+                    models.PositiveIntegerField(default=0, verbose_name="Доставлено"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="Дата обновления"),
+                ),
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="order_stats",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Статистика заказов",
+                "verbose_name_plural": "Статистика заказов",
+            },
+        ),
+    ]
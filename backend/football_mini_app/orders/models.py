@@ -1,10 +1,18 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
-from products.models import Product
+from products.models import Product, ProductRelatedQuerySet
 import uuid
 from django.utils import timezone
 
 
+class OrderQuerySet(models.QuerySet):
+    def with_items(self):
+        # Элементы заказа вместе с товарами и их изображениями
+        return self.prefetch_related(
+            models.Prefetch("items", queryset=OrderItem.objects.with_product())
+        )
+
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ("pending", "Ожидает подтверждения"),
@@ -44,10 +52,25 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
 
+    objects = OrderQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        order = super().from_db(db, field_names, values)
+        # Значения из БД нужны, чтобы пересчитать статистику при изменении
+        order._stats_snapshot = order.stats_values()
+        return order
+
+    def stats_values(self):
+        return self.__dict__.get("status"), self.__dict__.get("total_amount")
+
     def save(self, *args, **kwargs):
         if not self.order_number:
             self.order_number = f"ORD-{uuid.uuid4().hex[:8].upper()}"
-        super().save(*args, **kwargs)
+        # Статистика пользователя обновляется сигналом в этой же транзакции
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+        self._stats_snapshot = self.stats_values()
 
     def __str__(self):
         return f"Заказ {self.order_number} от {self.user}"
@@ -79,9 +102,43 @@ class OrderItem(models.Model):
         default=timezone.now,
     )
 
+    objects = ProductRelatedQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.quantity}x {self.product.team} ({self.selected_size})"
 
     class Meta:
         verbose_name = "Элемент заказа"
         verbose_name_plural = "Элементы заказа"
+
+
+class OrderStats(models.Model):
+    """
+    Сводная статистика заказов пользователя.
+
+    Обновляется в той же транзакции, что и заказ (см. orders/signals.py),
+    поэтому эндпоинт статистики читает одну строку вместо всех заказов.
+    """
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        related_name="order_stats",
+        on_delete=models.CASCADE,
+        verbose_name="Пользователь",
+    )
+    total_orders = models.PositiveIntegerField(default=0, verbose_name="Всего заказов")
+    total_spent = models.DecimalField(
+        max_digits=12, decimal_places=2, default=0, verbose_name="Общая сумма"
+    )
+    pending_orders = models.PositiveIntegerField(
+        default=0, verbose_name="Ожидают подтверждения"
+    )
+    completed_orders = models.PositiveIntegerField(default=0, verbose_name="Доставлено")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+    def __str__(self):
+        return f"Статистика заказов {self.user}"
+
+    class Meta:
+        verbose_name = "Статистика заказов"
+        verbose_name_plural = "Статистика заказов"
@@ -0,0 +1,103 @@
+"""
+Статистика заказов пользователя.
+
+`aggregate_stats` считает все показатели одним запросом с условной
+агрегацией. Сводка `OrderStats` меняется на разницу при создании заказа и
+смене статуса или суммы; если разницу посчитать нельзя (обновление в обход
+save(), удаление), сводка пересчитывается агрегатом.
+"""
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Order, OrderStats
+
+# Статус -> счетчик сводки
+STATUS_COUNTERS = {
+    "pending": "pending_orders",
+    "delivered": "completed_orders",
+}
+STATS_FIELDS = ("total_orders", "total_spent", "pending_orders", "completed_orders")
+
+
+def rollup_enabled():
+    return getattr(settings, "ORDER_STATS_ROLLUP", True)
+
+
+def aggregate_stats(user_id):
+    """Все показатели одним запросом"""
+    return Order.objects.filter(user_id=user_id).aggregate(
+        total_orders=Count("id"),
+        total_spent=Coalesce(
+            Sum("total_amount"),
+            Value(Decimal("0")),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+        **{
+            counter: Count("id", filter=Q(status=status))
+            for status, counter in STATUS_COUNTERS.items()
+        },
+    )
+
+
+def get_stats(user_id):
+    if not rollup_enabled():
+        return aggregate_stats(user_id)
+    stats = OrderStats.objects.filter(user_id=user_id).first()
+    if stats is None:
+        stats = rebuild(user_id)
+    return {field: getattr(stats, field) for field in STATS_FIELDS}
+
+
+def rebuild(user_id):
+    """Пересчитать сводку пользователя по заказам"""
+    stats, _ = OrderStats.objects.update_or_create(
+        user_id=user_id, defaults=aggregate_stats(user_id)
+    )
+    return stats
+
+
+def refresh(user_ids):
+    """
+    Пересчитать существующие сводки (после update() в обход save() или
+    удаления). Новые строки не создаются: при каскадном удалении пользователя
+    его сводка удаляется вместе с заказами.
+    """
+    for user_id in set(user_ids):
+        OrderStats.objects.filter(user_id=user_id).update(**aggregate_stats(user_id))
+
+
+def order_saved(order, created):
+    """Изменить сводку на разницу между старыми и новыми значениями заказа"""
+    status, total_amount = order.stats_values()
+    if created:
+        old_status, old_amount = None, Decimal("0")
+        deltas = {"total_orders": 1}
+    else:
+        old_status, old_amount = getattr(order, "_stats_snapshot", (None, None))
+        if old_status is None or old_amount is None or status is None:
+            # Заказ загружен без этих полей: разницу не посчитать
+            rebuild(order.user_id)
+            return
+        deltas = {}
+
+    if total_amount != old_amount:
+        deltas["total_spent"] = Decimal(total_amount) - Decimal(old_amount)
+    if status != old_status:
+        if old_status in STATUS_COUNTERS:
+            deltas[STATUS_COUNTERS[old_status]] = -1
+        if status in STATUS_COUNTERS:
+            counter = STATUS_COUNTERS[status]
+            deltas[counter] = deltas.get(counter, 0) + 1
+    if not deltas:
+        return
+
+    updated = OrderStats.objects.filter(user_id=order.user_id).update(
+        **{field: F(field) + delta for field, delta in deltas.items() if delta}
+    )
+    if not updated:
+        # Сводки еще нет: создаем ее по всем заказам, включая этот
+        rebuild(order.user_id)
@@ -1,3 +1,190 @@
-from django.test import TestCase
+from io import StringIO
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from products import cart
+from products.models import CartItem, Product
+from products.tests import CatalogTestCase, QueryCountTestMixin, make_product
+from users.models import User
+from . import stats
+from .models import Order, OrderItem, OrderStats
+
+
+class OrderQueryCountTests(QueryCountTestMixin, CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(telegram_id=2002)
+
+    def add_orders(self, count):
+        for _ in range(count):
+            order = Order.objects.create(user=self.user, total_amount=10000)
+            for _ in range(2):
+                OrderItem.objects.create(
+                    order=order, product=make_product(), quantity=1, price=5000
+                )
+
+    def test_orders(self):
+        self.assertQueriesDoNotGrow("/api/orders/?telegram_id=2002", self.add_orders)
+
+    def test_order_items(self):
+        self.assertQueriesDoNotGrow(
+            "/api/order-items/?telegram_id=2002", self.add_orders
+        )
+
+
+class CreateFromCartTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(telegram_id=3003)
+
+    def checkout(self, **extra):
+        return self.client.post(
+            "/api/orders/create_from_cart/",
+            {"telegram_id": 3003, "shipping_address": "Москва", "phone_number": "1"},
+            format="json",
+            **extra,
+        )
+
+    def test_checkout_reserves_stock(self):
+        product = make_product(stock_quantity=2)
+        CartItem.objects.create(user=self.user, product=product, quantity=2)
+
+        response = self.checkout()
+
+        self.assertEqual(response.status_code, 201)
+        product.refresh_from_db()
+        self.assertEqual(product.stock_quantity, 0)
+        self.assertFalse(product.is_available)
+        self.assertFalse(CartItem.objects.filter(user=self.user).exists())
+
+    def test_shortage_rolls_back(self):
+        enough = make_product(stock_quantity=5)
+        short = make_product(stock_quantity=1)
+        CartItem.objects.create(user=self.user, product=enough, quantity=1)
+        CartItem.objects.create(user=self.user, product=short, quantity=2)
+
+        response = self.checkout()
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Недостаточно", response.json()["error"])
+        self.assertEqual(Product.objects.get(pk=enough.pk).stock_quantity, 5)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartItem.objects.filter(user=self.user).count(), 2)
+
+    def test_checkout_queries_do_not_grow(self):
+        # Сводка статистики и версия корзины создаются первым заказом, а
+        # пользователь попадает в кэш первым запросом — здесь все это уже есть
+        stats.rebuild(self.user.pk)
+        cart.bump_version(self.user.pk)
+        self.client.get("/api/orders/stats/?telegram_id=3003")
+
+        def checkout_queries(lines):
+            CartItem.objects.bulk_create(
+                CartItem(user=self.user, product=make_product(), quantity=1)
+                for _ in range(lines)
+            )
+            with CaptureQueriesContext(connection) as context:
+                response = self.checkout()
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(len(response.json()["items"]), lines)
+            return len(context.captured_queries)
+
+        self.assertEqual(checkout_queries(1), checkout_queries(10))
+
+    def test_retried_checkout_creates_one_order(self):
+        product = make_product(stock_quantity=5)
+        CartItem.objects.create(user=self.user, product=product, quantity=1)
+
+        first = self.checkout(HTTP_IDEMPOTENCY_KEY="order-1")
+        second = self.checkout(HTTP_IDEMPOTENCY_KEY="order-1")
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.json()["id"], first.json()["id"])
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Product.objects.get(pk=product.pk).stock_quantity, 4)
+
+    def test_cancel_returns_stock(self):
+        product = make_product(stock_quantity=1)
+        CartItem.objects.create(user=self.user, product=product, quantity=1)
+        order_id = self.checkout().json()["id"]
+
+        response = self.client.post(
+            f"/api/orders/{order_id}/cancel/", {"telegram_id": 3003}, format="json"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        product.refresh_from_db()
+        self.assertEqual(product.stock_quantity, 1)
+        self.assertTrue(product.is_available)
+
+
+class OrderStatsTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(telegram_id=5005)
+
+    def get_stats(self):
+        response = self.client.get("/api/orders/stats/?telegram_id=5005")
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_rollup_follows_orders(self):
+        first = Order.objects.create(user=self.user, total_amount=1000)
+        Order.objects.create(user=self.user, total_amount=2500, status="shipped")
+        first = Order.objects.get(pk=first.pk)
+        first.status = "delivered"
+        first.save()
+
+        expected = {
+            "total_orders": 2,
+            "total_spent": 3500.0,
+            "pending_orders": 0,
+            "completed_orders": 1,
+        }
+        self.assertEqual(self.get_stats(), expected)
+        rollup = OrderStats.objects.get(user=self.user)
+        self.assertEqual(
+            {field: getattr(rollup, field) for field in stats.STATS_FIELDS},
+            stats.aggregate_stats(self.user.pk),
+        )
+
+    def test_stats_read_one_row(self):
+        for _ in range(5):
+            Order.objects.create(user=self.user, total_amount=100)
+        # Пользователь и строка сводки
+        with self.assertNumQueries(2):
+            self.assertEqual(self.get_stats()["pending_orders"], 5)
+
+    def test_missing_rollup_is_rebuilt(self):
+        Order.objects.create(user=self.user, total_amount=100)
+        OrderStats.objects.all().delete()
+        Order.objects.filter(user=self.user).update(status="delivered")
+
+        self.assertEqual(self.get_stats()["completed_orders"], 1)
+        self.assertTrue(OrderStats.objects.filter(user=self.user).exists())
+
+    @override_settings(ORDER_STATS_ROLLUP=False)
+    def test_aggregate_without_rollup(self):
+        Order.objects.create(user=self.user, total_amount=100)
+        Order.objects.create(user=self.user, total_amount=50, status="cancelled")
+        # Пользователь и один агрегирующий запрос
+        with self.assertNumQueries(2):
+            data = self.get_stats()
+        self.assertEqual(data["total_orders"], 2)
+        self.assertEqual(data["total_spent"], 150.0)
+        self.assertFalse(OrderStats.objects.exists())
+
+
+class BenchCheckoutTests(CatalogTestCase):
+    # Без testserver, который тестовый раннер добавляет к ALLOWED_HOSTS
+    @override_settings(ALLOWED_HOSTS=["shop.example"])
+    def test_runs_and_rolls_back(self):
+        output = StringIO()
+        call_command("bench_checkout", lines=[1, 3], repeat=2, stdout=output)
+        self.assertEqual(len(output.getvalue().splitlines()), 3)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Product.objects.exists())
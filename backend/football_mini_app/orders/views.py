@@ -5,27 +5,24 @@ from rest_framework.response import Response
 from django.db import transaction
 from decimal import Decimal
 from .models import Order, OrderItem
+from . import stats
 from .serializers import OrderSerializer, OrderItemSerializer, OrderCreateSerializer
-from products.models import CartItem, Product
-from users.models import User
+from products.models import CartItem
+from products import cart, stock
+from products.idempotency import IdempotentMixin
+from users.authentication import TelegramUserMixin
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(TelegramUserMixin, IdempotentMixin, viewsets.ModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [permissions.AllowAny]  # Разрешаем доступ для Telegram WebApp
+    idempotent_actions = ("create_from_cart",)
 
     def get_queryset(self):
-        # Получаем telegram_id из query параметров
-        telegram_id = self.request.query_params.get("telegram_id")
-        if telegram_id:
-            try:
-                # Преобразуем telegram_id в число
-                telegram_id = int(telegram_id)
-                user = User.objects.get(telegram_id=telegram_id)
-                return Order.objects.filter(user=user)
-            except (ValueError, User.DoesNotExist):
-                return Order.objects.none()
-        return Order.objects.none()
+        user = self.get_telegram_user()
+        if user is None:
+            return Order.objects.none()
+        return Order.objects.filter(user=user).with_items()
 
     def get_serializer_class(self):
         if self.action == "create":
@@ -35,16 +32,13 @@ class OrderViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=["post"])
     def create_from_cart(self, request):
         """Создать заказ из корзины"""
-        telegram_id = request.data.get("telegram_id")
         shipping_address = request.data.get("shipping_address")
         phone_number = request.data.get("phone_number")
         notes = request.data.get("notes", "")
 
-        if not telegram_id:
-            return Response(
-                {"error": "telegram_id обязателен"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
+        user = self.get_telegram_user(request.data)
+        if user is None:
+            return self.telegram_user_missing(request.data)
 
         if not shipping_address or not phone_number:
             return Response(
@@ -52,56 +46,27 @@ class OrderViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # Получаем пользователя по telegram_id
-        try:
-            # Преобразуем telegram_id в число
-            telegram_id = int(telegram_id)
-            user = User.objects.get(telegram_id=telegram_id)
-        except (ValueError, User.DoesNotExist):
-            return Response(
-                {"error": "Пользователь не найден"},
-                status=status.HTTP_404_NOT_FOUND,
-            )
-
-        # Получаем товары из корзины
-        cart_items = CartItem.objects.filter(user=user).select_related("product")
+        # Получаем товары из корзины (один запрос, дальше работаем со списком)
+        cart_items = list(CartItem.objects.filter(user=user).select_related("product"))
 
-        if not cart_items.exists():
+        if not cart_items:
             return Response(
                 {"error": "Корзина пуста"}, status=status.HTTP_400_BAD_REQUEST
             )
 
+        # Считаем стоимость заказа
+        total_amount = sum(
+            (item.product.price * item.quantity for item in cart_items),
+            Decimal("0"),
+        )
+
+        # Число запросов не зависит от размера корзины: списание остатков,
+        # заказ, вставка элементов и очистка корзины — по одному запросу
         try:
             with transaction.atomic():
-                # Проверяем доступность всех товаров
-                total_amount = Decimal("0")
-                order_items_data = []
-
-                for cart_item in cart_items:
-                    product = cart_item.product
-
-                    # Проверяем, что товар все еще доступен
-                    if not product.is_available:
-                        raise ValueError(f"Товар '{product.team}' больше недоступен")
-
-                    # Проверяем количество на складе
-                    if product.stock_quantity < cart_item.quantity:
-                        raise ValueError(
-                            f"Недостаточно товара '{product.team}' на складе"
-                        )
-
-                    # Рассчитываем стоимость
-                    item_total = product.price * cart_item.quantity
-                    total_amount += item_total
-
-                    order_items_data.append(
-                        {
-                            "product": product,
-                            "quantity": cart_item.quantity,
-                            "price": product.price,
-                            "selected_size": cart_item.selected_size,
-                        }
-                    )
+                # Условный UPDATE: при нехватке товара InsufficientStock
+                # откатывает транзакцию
+                stock.reserve((item.product, item.quantity) for item in cart_items)
 
                 # Создаем заказ
                 order = Order.objects.create(
@@ -112,30 +77,28 @@ class OrderViewSet(viewsets.ModelViewSet):
                     notes=notes,
                 )
 
-                # Создаем элементы заказа и обновляем остатки
-                for item_data in order_items_data:
-                    OrderItem.objects.create(
-                        order=order,
-                        product=item_data["product"],
-                        quantity=item_data["quantity"],
-                        price=item_data["price"],
-                        selected_size=item_data["selected_size"],
-                    )
-
-                    # Уменьшаем количество на складе
-                    product = item_data["product"]
-                    product.stock_quantity -= item_data["quantity"]
-
-                    # Если товар закончился, делаем его недоступным
-                    if product.stock_quantity <= 0:
-                        product.is_available = False
-
-                    product.save()
+                # Создаем элементы заказа
+                OrderItem.objects.bulk_create(
+                    [
+                        OrderItem(
+                            order=order,
+                            product=item.product,
+                            quantity=item.quantity,
+                            price=item.product.price,
+                            selected_size=item.selected_size,
+                        )
+                        for item in cart_items
+                    ]
+                )
 
                 # Очищаем корзину
-                cart_items.delete()
+                CartItem.objects.filter(
+                    pk__in=[item.pk for item in cart_items]
+                ).delete()
+                cart.bump_version(user.pk)
 
-                serializer = OrderSerializer(order)
+                order = Order.objects.with_items().get(pk=order.pk)
+                serializer = OrderSerializer(order, context={"request": request})
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         except ValueError as e:
@@ -144,17 +107,11 @@ class OrderViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=["post"])
     def cancel(self, request, pk=None):
         """Отменить заказ"""
-        telegram_id = request.data.get("telegram_id")
-        if not telegram_id:
-            return Response(
-                {"error": "telegram_id обязателен"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
+        user = self.get_telegram_user(request.data)
+        if user is None:
+            return self.telegram_user_missing(request.data)
 
         try:
-            # Преобразуем telegram_id в число
-            telegram_id = int(telegram_id)
-            user = User.objects.get(telegram_id=telegram_id)
             order = Order.objects.get(id=pk, user=user)
 
             if order.status != "pending":
@@ -165,15 +122,7 @@ class OrderViewSet(viewsets.ModelViewSet):
 
             with transaction.atomic():
                 # Возвращаем товары на склад
-                for item in order.items.all():
-                    product = item.product
-                    product.stock_quantity += item.quantity
-
-                    # Если товар был недоступен, делаем его снова доступным
-                    if not product.is_available and product.stock_quantity > 0:
-                        product.is_available = True
-
-                    product.save()
+                stock.release(order.items.values_list("product_id", "quantity"))
 
                 # Отменяем заказ
                 order.status = "cancelled"
@@ -189,50 +138,29 @@ class OrderViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=["get"])
     def stats(self, request):
         """Получить статистику заказов пользователя"""
-        telegram_id = request.query_params.get("telegram_id")
-        if not telegram_id:
-            return Response(
-                {"error": "telegram_id обязателен"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
-        try:
-            # Преобразуем telegram_id в число
-            telegram_id = int(telegram_id)
-            user = User.objects.get(telegram_id=telegram_id)
-            orders = Order.objects.filter(user=user)
-        except (ValueError, User.DoesNotExist):
-            return Response(
-                {"error": "Пользователь не найден"},
-                status=status.HTTP_404_NOT_FOUND,
-            )
+        user = self.get_telegram_user()
+        if user is None:
+            return self.telegram_user_missing()
 
-        total_orders = orders.count()
-        total_spent = sum(order.total_amount for order in orders)
-        pending_orders = orders.filter(status="pending").count()
-        completed_orders = orders.filter(status="delivered").count()
+        # Одна строка сводки (или один агрегирующий запрос, если она отключена)
+        user_stats = stats.get_stats(user.pk)
 
         return Response(
             {
-                "total_orders": total_orders,
-                "total_spent": float(total_spent),
-                "pending_orders": pending_orders,
-                "completed_orders": completed_orders,
+                "total_orders": user_stats["total_orders"],
+                "total_spent": float(user_stats["total_spent"]),
+                "pending_orders": user_stats["pending_orders"],
+                "completed_orders": user_stats["completed_orders"],
             }
         )
 
 
-class OrderItemViewSet(viewsets.ModelViewSet):
+class OrderItemViewSet(TelegramUserMixin, viewsets.ModelViewSet):
     serializer_class = OrderItemSerializer
     permission_classes = [permissions.AllowAny]  # Разрешаем доступ для Telegram WebApp
 
     def get_queryset(self):
-        # Получаем telegram_id из query параметров
-        telegram_id = self.request.query_params.get("telegram_id")
-        if telegram_id:
-            try:
-                user = User.objects.get(telegram_id=telegram_id)
-                return OrderItem.objects.filter(order__user=user)
-            except User.DoesNotExist:
-                return OrderItem.objects.none()
-        return OrderItem.objects.none()
+        user = self.get_telegram_user()
+        if user is None:
+            return OrderItem.objects.none()
+        return OrderItem.objects.filter(order__user=user).with_product()
@@ -1,6 +1,8 @@
 from django.contrib import admin
+from django.utils import timezone
 from django.utils.html import format_html
-from .models import Product, Image, CartItem, Favorite
+from .models import Product, Image, ImageJob, CartItem, Favorite
+from .catalog import products_changed
 
 
 class ImageInline(admin.TabularInline):
@@ -32,7 +34,7 @@ class ProductAdmin(admin.ModelAdmin):
     ]
     list_filter = ["brand", "season", "condition", "is_available", "created_at"]
     search_fields = ["team", "brand", "season", "contacts"]
-    readonly_fields = ["created_at", "updated_at"]
+    readonly_fields = ["hidden_by_channel", "created_at", "updated_at"]
     inlines = [ImageInline]
     actions = ["mark_as_available", "mark_as_unavailable"]
 
@@ -46,7 +48,10 @@ class ProductAdmin(admin.ModelAdmin):
             {"fields": ("condition", "price", "size", "color", "features")},
         ),
         ("Контакты и ссылки", {"fields": ("contacts", "hashtags", "post_url")}),
-        ("Наличие", {"fields": ("is_available", "stock_quantity")}),
+        (
+            "Наличие",
+            {"fields": ("is_available", "hidden_by_channel", "stock_quantity")},
+        ),
         (
             "Системная информация",
             {"fields": ("created_at", "updated_at"), "classes": ("collapse",)},
@@ -78,14 +83,28 @@ class ProductAdmin(admin.ModelAdmin):
 
     images_count.short_description = "Количество фото"
 
+    def save_model(self, request, obj, form, change):
+        # Наличие, выставленное вручную, сверка с каналом больше не меняет
+        if "is_available" in form.changed_data:
+            obj.hidden_by_channel = False
+        super().save_model(request, obj, form, change)
+
     def mark_as_available(self, request, queryset):
-        updated = queryset.update(is_available=True)
+        product_ids = list(queryset.values_list("id", flat=True))
+        updated = queryset.update(
+            is_available=True, hidden_by_channel=False, updated_at=timezone.now()
+        )
+        products_changed(product_ids)
         self.message_user(request, f"Обновлено {updated} товаров как доступных")
 
     mark_as_available.short_description = "Отметить как доступные"
 
     def mark_as_unavailable(self, request, queryset):
-        updated = queryset.update(is_available=False)
+        product_ids = list(queryset.values_list("id", flat=True))
+        updated = queryset.update(
+            is_available=False, hidden_by_channel=False, updated_at=timezone.now()
+        )
+        products_changed(product_ids)
         self.message_user(request, f"Обновлено {updated} товаров как недоступных")
 
     mark_as_unavailable.short_description = "Отметить как недоступные"
@@ -93,8 +112,8 @@ class ProductAdmin(admin.ModelAdmin):
 
 @admin.register(Image)
 class ImageAdmin(admin.ModelAdmin):
-    list_display = ["product", "image_preview", "created_at"]
-    list_filter = ["created_at", "product__brand"]
+    list_display = ["product", "image_preview", "status", "created_at"]
+    list_filter = ["status", "created_at", "product__brand"]
     search_fields = ["product__team", "product__brand"]
     readonly_fields = ["image_preview", "created_at"]
 
@@ -109,6 +128,13 @@ class ImageAdmin(admin.ModelAdmin):
     image_preview.short_description = "Предпросмотр"
 
 
+@admin.register(ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = ["image", "status", "attempts", "available_at", "created_at"]
+    list_filter = ["status"]
+    readonly_fields = ["image", "attempts", "error", "started_at", "created_at"]
+
+
 @admin.register(CartItem)
 class CartItemAdmin(admin.ModelAdmin):
     list_display = [
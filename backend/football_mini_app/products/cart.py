@@ -0,0 +1,193 @@
+"""
+Пакетное изменение корзины.
+
+Операции (add / increment / set / remove по товару и размеру) сначала
+сводятся к одному итоговому действию на строку корзины, затем применяются
+несколькими запросами в одной транзакции: вставки — через
+INSERT ... ON CONFLICT DO UPDATE (SQLite 3.24+ и PostgreSQL), удаления —
+одним DELETE. Остатки проверяются одним запросом по всем затронутым товарам,
+и при нехватке вся пачка откатывается.
+"""
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from .models import CartItem, CartVersion, Product
+from .stock import InsufficientStock
+
+OPERATIONS = ("add", "increment", "set", "remove")
+MAX_OPERATIONS = 100
+
+
+class CartError(ValueError):
+    """Некорректная операция с корзиной"""
+
+
+def parse_operations(raw_operations):
+    """Проверить и нормализовать операции: [(op, product_id, size, quantity)]"""
+    if not isinstance(raw_operations, list) or not raw_operations:
+        raise CartError("operations должен быть непустым списком")
+    if len(raw_operations) > MAX_OPERATIONS:
+        raise CartError(f"Не больше {MAX_OPERATIONS} операций за запрос")
+
+    operations = []
+    for raw in raw_operations:
+        if not isinstance(raw, dict):
+            raise CartError("Операция должна быть объектом")
+        op = raw.get("op")
+        if op not in OPERATIONS:
+            raise CartError(f"Неизвестная операция: {op}")
+        try:
+            product_id = int(raw.get("product"))
+            quantity = int(raw.get("quantity", 0 if op == "remove" else 1))
+        except (TypeError, ValueError):
+            raise CartError("product и quantity должны быть числами")
+        if op == "add" and quantity <= 0:
+            raise CartError("Количество для add должно быть положительным")
+        if op == "set" and quantity < 0:
+            raise CartError("Количество для set не может быть отрицательным")
+        size = str(raw.get("selected_size") or "")
+        if len(size) > CartItem._meta.get_field("selected_size").max_length:
+            raise CartError("Слишком длинный размер")
+        operations.append((op, product_id, size, quantity))
+    return operations
+
+
+def merge_operations(operations):
+    """
+    Свести операции к итоговому действию на строку (product_id, size).
+
+    Действия: ("add", n) — прибавить, создав строку при отсутствии;
+    ("increment", n) — прибавить к существующей строке; ("set", n) —
+    установить количество; ("remove", 0) — удалить строку.
+    """
+    effects = {}
+    for op, product_id, size, quantity in operations:
+        key = (product_id, size)
+        kind, current = effects.get(key, (None, 0))
+        if op == "set":
+            effects[key] = ("set", quantity) if quantity > 0 else ("remove", 0)
+        elif op == "remove":
+            effects[key] = ("remove", 0)
+        elif kind == "set":
+            effects[key] = ("set", current + quantity)
+        elif kind == "remove":
+            # После удаления строки increment ничего не меняет, add создает ее заново
+            if op == "add":
+                effects[key] = ("set", quantity)
+        elif kind == "add" or op == "add":
+            effects[key] = ("add", current + quantity)
+        else:
+            effects[key] = ("increment", current + quantity)
+    return effects
+
+
+def apply_operations(user_id, operations):
+    """Применить операции к корзине пользователя; возвращает новую версию"""
+    effects = merge_operations(operations)
+    rows = {"add": [], "set": [], "increment": []}
+    removed = []
+    for (product_id, size), (kind, quantity) in effects.items():
+        if kind == "remove":
+            removed.append((product_id, size))
+        elif quantity != 0 or kind == "set":
+            rows[kind].append((product_id, size, quantity))
+
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            upsert(user_id, rows["add"], now, increment=True)
+            upsert(user_id, rows["set"], now, increment=False)
+            increment(user_id, rows["increment"], now)
+
+            # Удаленные строки и строки, где количество стало нулевым
+            condition = Q(quantity__lte=0)
+            for product_id, size in removed:
+                condition |= Q(product_id=product_id, selected_size=size)
+            CartItem.objects.filter(user_id=user_id).filter(condition).delete()
+
+            validate_stock(user_id, {product_id for product_id, _ in effects})
+            return bump_version(user_id)
+    except IntegrityError:
+        # PostgreSQL проверяет внешний ключ сразу при вставке
+        raise CartError("Товар не найден")
+
+
+def upsert(user_id, rows, now, increment):
+    """INSERT ... ON CONFLICT DO UPDATE: прибавить или установить количество"""
+    if not rows:
+        return
+    table = connection.ops.quote_name(CartItem._meta.db_table)
+    if increment:
+        quantity = f"{table}.quantity + excluded.quantity"
+    else:
+        quantity = "excluded.quantity"
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {table} "
+            "(user_id, product_id, selected_size, quantity, created_at, updated_at) "
+            "VALUES (%s, %s, %s, %s, %s, %s) "
+            "ON CONFLICT (user_id, product_id, selected_size) DO UPDATE SET "
+            f"quantity = {quantity}, updated_at = excluded.updated_at",
+            [
+                (user_id, product_id, size, quantity_value, now, now)
+                for product_id, size, quantity_value in rows
+            ],
+        )
+
+
+def increment(user_id, rows, now):
+    """Изменить количество только в существующих строках"""
+    if not rows:
+        return
+    table = connection.ops.quote_name(CartItem._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"UPDATE {table} SET quantity = quantity + %s, updated_at = %s "
+            "WHERE user_id = %s AND product_id = %s AND selected_size = %s",
+            [
+                (quantity, now, user_id, product_id, size)
+                for product_id, size, quantity in rows
+            ],
+        )
+
+
+def validate_stock(user_id, product_ids):
+    """Один запрос: товары есть, доступны и их хватает на все размеры в корзине"""
+    products = {
+        product.pk: product
+        for product in Product.objects.filter(pk__in=product_ids)
+        .annotate(
+            in_cart=Sum("cart_items__quantity", filter=Q(cart_items__user_id=user_id))
+        )
+        .only("team", "is_available", "stock_quantity")
+    }
+    for product_id in sorted(product_ids):
+        product = products.get(product_id)
+        if product is None:
+            raise CartError("Товар не найден")
+        if not product.in_cart:
+            continue
+        if not product.is_available:
+            raise InsufficientStock(product, available=False)
+        if product.in_cart > product.stock_quantity:
+            raise InsufficientStock(product)
+
+
+def bump_version(user_id):
+    updated = CartVersion.objects.filter(user_id=user_id).update(
+        version=F("version") + 1
+    )
+    if not updated:
+        CartVersion.objects.get_or_create(user_id=user_id, defaults={"version": 1})
+    return get_version(user_id)
+
+
+def get_version(user_id):
+    version = (
+        CartVersion.objects.filter(user_id=user_id)
+        .values_list("version", flat=True)
+        .first()
+    )
+    return version or 0
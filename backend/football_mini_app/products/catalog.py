@@ -0,0 +1,38 @@
+from django.db.models import F, Max
+from django.utils import timezone
+
+from . import snapshots
+from .models import CatalogVersion, Product
+
+# Версия каталога хранится в единственной строке таблицы
+CATALOG_VERSION_ID = 1
+
+
+def get_catalog_version():
+    """Текущая версия каталога — один запрос по первичному ключу"""
+    version = CatalogVersion.objects.filter(pk=CATALOG_VERSION_ID).first()
+    if version is None:
+        # Первое обращение: дата изменения берется из самих товаров
+        last_update = Product.objects.aggregate(last=Max("updated_at"))["last"]
+        version, _ = CatalogVersion.objects.get_or_create(
+            pk=CATALOG_VERSION_ID,
+            defaults={"updated_at": last_update or timezone.now()},
+        )
+    return version
+
+
+def bump_catalog_version():
+    """Отметить изменение каталога; кэши, привязанные к версии, устаревают"""
+    updated = CatalogVersion.objects.filter(pk=CATALOG_VERSION_ID).update(
+        version=F("version") + 1, updated_at=timezone.now()
+    )
+    if not updated:
+        CatalogVersion.objects.get_or_create(
+            pk=CATALOG_VERSION_ID, defaults={"version": 1}
+        )
+
+
+def products_changed(product_ids):
+    """Изменение товаров в обход save() (queryset.update и т.п.)"""
+    snapshots.invalidate(product_ids)
+    bump_catalog_version()
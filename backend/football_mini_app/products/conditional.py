@@ -0,0 +1,55 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .catalog import get_catalog_version
+
+
+class CatalogConditionalGetMixin:
+    """
+    Условные GET-запросы для эндпоинтов каталога.
+
+    ETag строится из версии каталога и URL запроса, Last-Modified — из даты
+    последнего изменения каталога. Если клиент прислал совпадающий
+    If-None-Match (или If-Modified-Since), ответ 304 отдается до сериализации.
+    """
+
+    conditional_actions = ("list", "retrieve")
+    catalog_version = None
+
+    def dispatch(self, request, *args, **kwargs):
+        # self.action выставляется только внутри dispatch, поэтому берем из action_map
+        action = self.action_map.get(request.method.lower())
+        if request.method not in ("GET", "HEAD") or (
+            action not in self.conditional_actions
+        ):
+            return super().dispatch(request, *args, **kwargs)
+
+        version = self.catalog_version = get_catalog_version()
+        etag = self.get_catalog_etag(request, version)
+        last_modified = int(version.updated_at.timestamp())
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+
+        response.headers["ETag"] = etag
+        response.headers["Last-Modified"] = http_date(last_modified)
+        # Клиент хранит ответ, но каждый раз сверяет его с сервером
+        patch_cache_control(response, no_cache=True)
+        return response
+
+    def get_catalog_etag(self, request, version):
+        key = "|".join(
+            [
+                str(version.version),
+                request.get_full_path(),
+                request.headers.get("Accept", ""),
+            ]
+        )
+        return quote_etag(hashlib.sha1(key.encode()).hexdigest())
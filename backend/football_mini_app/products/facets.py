@@ -0,0 +1,85 @@
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from .catalog import get_catalog_version
+from .filters import ATTRIBUTE_FILTERS, filter_catalog
+from .models import Product
+
+FACETS_CACHE_TIMEOUT = 60 * 60
+SIZE_ORDER = ["XS", "S", "M", "L", "XL", "XXL", "XXXL"]
+
+
+def get_facets(filters, catalog_version=None):
+    """
+    Значения фильтров с количеством товаров.
+
+    Результат кэшируется по версии каталога и набору примененных фильтров,
+    поэтому пока каталог не менялся, запрос стоит одного чтения версии.
+    """
+    catalog_version = catalog_version or get_catalog_version()
+    version = catalog_version.version
+    filters_key = hashlib.md5(json.dumps(filters, sort_keys=True).encode()).hexdigest()
+    cache_key = f"catalog-facets:{version}:{filters_key}"
+
+    data = cache.get(cache_key)
+    if data is None:
+        data = compute_facets(filters, get_known_values(catalog_version))
+        data["version"] = version
+        cache.set(cache_key, data, FACETS_CACHE_TIMEOUT)
+    return data
+
+
+def get_known_values(catalog_version=None):
+    """Нормализованные значения фильтров по всему каталогу, кэшируются по версии"""
+    version = (catalog_version or get_catalog_version()).version
+    cache_key = f"catalog-known-values:{version}"
+
+    known_values = cache.get(cache_key)
+    if known_values is None:
+        norm_fields = [f"{field}_norm" for field in ATTRIBUTE_FILTERS.values()]
+        known_values = {name: set() for name in ATTRIBUTE_FILTERS}
+        rows = Product.objects.values_list(*norm_fields).distinct()
+        for row in rows:
+            for name, value in zip(ATTRIBUTE_FILTERS, row):
+                if value:
+                    known_values[name].add(value)
+        cache.set(cache_key, known_values, FACETS_CACHE_TIMEOUT)
+    return known_values
+
+
+def compute_facets(filters, known_values=None):
+    """
+    Drill-down фасеты: значения каждого фильтра считаются с учетом всех
+    остальных примененных фильтров, кроме него самого.
+    """
+    products = Product.objects.filter(is_available=True)
+    data = {}
+    counts = {}
+
+    for name, field in ATTRIBUTE_FILTERS.items():
+        rows = (
+            filter_catalog(products, filters, exclude=name, known_values=known_values)
+            .exclude(**{f"{field}__isnull": True})
+            .exclude(**{field: ""})
+            .values_list(field)
+            .annotate(count=Count("id"))
+            .order_by(field)
+        )
+        values = list(rows)
+        if name == "size":
+            values.sort(key=lambda row: _size_position(row[0]))
+        data[name] = [value for value, _ in values]
+        counts[name] = [{"value": value, "count": count} for value, count in values]
+
+    data["counts"] = counts
+    return data
+
+
+def _size_position(size):
+    try:
+        return (SIZE_ORDER.index(size.upper()), size)
+    except ValueError:
+        return (len(SIZE_ORDER), size)
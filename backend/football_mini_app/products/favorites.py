@@ -0,0 +1,92 @@
+"""
+Множество избранных товаров пользователя.
+
+Версия множества — случайный токен в общем кэше Django, который сигналы
+добавления и удаления избранного заменяют новым (см. products/signals.py),
+сразу и еще раз после коммита. Список id хранится в кэше вместе с версией,
+при которой он прочитан, поэтому запрос с неизменным избранным не обращается
+к БД, а изменение в любом процессе делает старый список недостижимым во
+всех. Если токен вытеснен из кэша, заводится новый и список перечитывается.
+"""
+
+import base64
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Favorite
+
+FAVORITES_TIMEOUT = 24 * 60 * 60
+MAX_BATCH_SIZE = 500
+
+
+def favorites_key(user_id):
+    return f"favorites:{user_id}"
+
+
+def version_key(user_id):
+    return f"favorites-version:{user_id}"
+
+
+def new_version():
+    return uuid.uuid4().hex[:16]
+
+
+def get_version(user_id):
+    version = cache.get(version_key(user_id))
+    if version is None:
+        version = new_version()
+        # Другой процесс мог завести версию одновременно: остается первая
+        if not cache.add(version_key(user_id), version, None):
+            version = cache.get(version_key(user_id), version)
+    return version
+
+
+def get_favorite_ids(user_id, version=None):
+    """(версия, отсортированный список id товаров в избранном)"""
+    if version is None:
+        version = get_version(user_id)
+    entry = cache.get(favorites_key(user_id))
+    if entry is not None and entry["version"] == version:
+        return version, entry["ids"]
+
+    ids = sorted(
+        Favorite.objects.filter(user_id=user_id).values_list("product_id", flat=True)
+    )
+    cache.set(
+        favorites_key(user_id), {"version": version, "ids": ids}, FAVORITES_TIMEOUT
+    )
+    return version, ids
+
+
+def invalidate(user_id):
+    """Избранное пользователя изменилось: новая версия во всех процессах"""
+    bump_version(user_id)
+    # Процесс, прочитавший строки до коммита, запомнит их с новой версией
+    transaction.on_commit(lambda: bump_version(user_id))
+
+
+def bump_version(user_id):
+    cache.set(version_key(user_id), new_version(), None)
+    cache.delete(favorites_key(user_id))
+
+
+def encode_bitmap(ids):
+    """Битовая карта id (бит N — товар с id N), base64"""
+    if not ids:
+        return ""
+    bitmap = bytearray(max(ids) // 8 + 1)
+    for product_id in ids:
+        bitmap[product_id // 8] |= 1 << (product_id % 8)
+    return base64.b64encode(bytes(bitmap)).decode()
+
+
+def parse_ids(value):
+    """Список id из строки "1,2,3" (некорректные значения пропускаются)"""
+    ids = []
+    for part in (value or "").split(","):
+        part = part.strip()
+        if part.isdigit():
+            ids.append(int(part))
+    return ids[:MAX_BATCH_SIZE]
@@ -0,0 +1,93 @@
+"""
+Выборочные поля товара в ответах API.
+
+`?fields=id,name,price` оставляет в представлении товара только указанные
+поля, `?fields=card` — набор, который отрисовывает карточка в сетке каталога
+(front/src/components/ProductCard.tsx). При выборочных полях из фото
+остается только обложка (ссылка, копии, размеры и заглушка), `?expand=images`
+возвращает все фото целиком. Параметры действуют и на товары, вложенные в корзину, избранное и
+заказы. Проекция применяется к готовому представлению из кэша
+(см. products/snapshots.py), поэтому кэш общий для всех наборов полей.
+"""
+
+from collections import namedtuple
+
+from rest_framework.exceptions import ValidationError
+
+PRESETS = {
+    "card": (
+        "id",
+        "name",
+        "manufacturer",
+        "league",
+        "season",
+        "price",
+        "size",
+        "condition",
+        "badges",
+        "images",
+        "images_count",
+    ),
+}
+EXPANDABLE = ("images",)
+# Поля фото, которые остаются у обложки: карточке нужны и размеры с заглушкой
+COVER_FIELDS = (
+    "id",
+    "image_url",
+    "srcset",
+    "width",
+    "height",
+    "dominant_color",
+    "placeholder",
+)
+
+Fieldset = namedtuple("Fieldset", ["fields", "expand"])
+
+
+def split(value):
+    return [part.strip() for part in (value or "").split(",") if part.strip()]
+
+
+def parse(fields, expand, allowed):
+    """Набор полей из параметров запроса; None — полное представление"""
+    names = split(fields)
+    if not names:
+        return None
+    if len(names) == 1 and names[0] in PRESETS:
+        names = list(PRESETS[names[0]])
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise ValidationError({"fields": f"Неизвестные поля: {', '.join(unknown)}"})
+
+    expand = split(expand)
+    unknown = [name for name in expand if name not in EXPANDABLE]
+    if unknown:
+        raise ValidationError({"expand": f"Нельзя раскрыть: {', '.join(unknown)}"})
+    return Fieldset(tuple(dict.fromkeys(names)), frozenset(expand))
+
+
+def from_request(request, allowed):
+    """Набор полей запроса (разбирается один раз на запрос)"""
+    if request is None:
+        return None
+    try:
+        return request._product_fieldset
+    except AttributeError:
+        pass
+    params = request.query_params
+    fieldset = parse(params.get("fields"), params.get("expand"), allowed)
+    request._product_fieldset = fieldset
+    return fieldset
+
+
+def project(data, fieldset):
+    """Представление товара, урезанное до набора полей"""
+    if fieldset is None:
+        return data
+    data = {name: data[name] for name in fieldset.fields}
+    images = data.get("images")
+    if images and "images" not in fieldset.expand:
+        data["images"] = [
+            {name: images[0].get(name) for name in COVER_FIELDS},
+        ]
+    return data
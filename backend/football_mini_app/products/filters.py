@@ -0,0 +1,86 @@
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+from . import search as catalog_search
+from .models import normalize_filter_value
+
+# Параметр запроса фронтенда -> поле модели Product
+ATTRIBUTE_FILTERS = {
+    "type": "kit_type",
+    "manufacturer": "brand",
+    "league": "league",
+    "season": "season",
+    "condition": "condition",
+    "size": "size",
+}
+
+
+PRICE_FILTERS = ("min_price", "max_price")
+
+
+def parse_price(name, value):
+    """Цена из query параметра; неверное значение — ответ 400, а не 500"""
+    try:
+        price = Decimal(value.strip())
+    except InvalidOperation:
+        price = None
+    if price is None or not price.is_finite() or price < 0:
+        raise ValidationError({name: "Цена должна быть неотрицательным числом"})
+    return str(price)
+
+
+def get_catalog_filters(params):
+    """Примененные фильтры каталога из query параметров (пустые отбрасываются)"""
+    names = list(ATTRIBUTE_FILTERS) + list(PRICE_FILTERS) + ["search"]
+    filters = {name: params.get(name) for name in names if params.get(name)}
+    for name in PRICE_FILTERS:
+        if name in filters:
+            filters[name] = parse_price(name, filters[name])
+    return filters
+
+
+def attribute_condition(field, value, known_values=None):
+    """
+    Условие для фильтра по атрибуту.
+
+    Известное значение фасета сравниваем с индексированной нормализованной
+    колонкой точно. Иначе ищем подстроку, как раньше, но среди известных
+    значений каталога: совпавшие подставляются в IN по той же колонке, чтобы
+    использовался индекс. Без известных значений — прежний icontains.
+    """
+    normalized = normalize_filter_value(value)
+    if known_values and normalized:
+        if normalized in known_values:
+            return Q(**{f"{field}_norm": normalized})
+        matches = sorted(known for known in known_values if normalized in known)
+        return Q(**{f"{field}_norm__in": matches})
+    return Q(**{f"{field}__icontains": value})
+
+
+def filter_catalog(queryset, filters, exclude=None, known_values=None):
+    """
+    Применяет фильтры каталога к queryset.
+
+    `exclude` — имя фильтра, который нужно пропустить (для drill-down фасетов
+    значения фасета считаются без его собственного фильтра).
+    `known_values` — нормализованные значения фасетов {имя фильтра: set}.
+    """
+    known_values = known_values or {}
+    for name, field in ATTRIBUTE_FILTERS.items():
+        value = filters.get(name)
+        if value and name != exclude:
+            queryset = queryset.filter(
+                attribute_condition(field, value, known_values.get(name))
+            )
+
+    if filters.get("min_price"):
+        queryset = queryset.filter(price__gte=filters["min_price"])
+    if filters.get("max_price"):
+        queryset = queryset.filter(price__lte=filters["max_price"])
+    if filters.get("search"):
+        # Полнотекстовый поиск с ранжированием (FTS5 / PostgreSQL)
+        queryset = catalog_search.search(queryset, filters["search"])
+
+    return queryset
@@ -0,0 +1,164 @@
+"""
+Идемпотентные POST-запросы.
+
+Клиент Telegram WebApp на плохой сети повторяет POST. Если запрос пришел с
+заголовком `Idempotency-Key`, первый ответ сохраняется в таблице
+`IdempotencyKey` и на повтор с тем же ключом отдается без обращения к
+данным. Ключ действует в пределах метода, пути и отправителя (id из
+подписанной initData или telegram_id старых клиентов), поэтому одинаковые
+ключи разных пользователей не пересекаются. Таблица общая для всех
+процессов gunicorn; уникальный индекс (key, scope) не дает двум
+параллельным повторам выполниться дважды.
+"""
+
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from users import identity
+from users.authentication import TelegramInitDataAuthentication
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAY_HEADER = "Idempotent-Replayed"
+KEY_TTL = timedelta(hours=24)
+# Через сколько незавершенный запрос считается брошенным (процесс упал)
+LOCK_TIMEOUT = timedelta(minutes=1)
+MAX_KEY_LENGTH = 255
+
+
+class IdempotentMixin:
+    """
+    Повтор POST с тем же Idempotency-Key получает сохраненный первый ответ.
+
+    Ответы 5xx не сохраняются: клиент может повторить запрос. Тот же ключ с
+    другим телом запроса — ошибка 422, повтор до завершения первого — 409.
+    """
+
+    idempotent_actions = ("create",)
+
+    def dispatch(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        action = self.action_map.get(request.method.lower())
+        if request.method != "POST" or not key or action not in self.idempotent_actions:
+            return super().dispatch(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return JsonResponse(
+                {"error": f"{IDEMPOTENCY_HEADER} длиннее {MAX_KEY_LENGTH} символов"},
+                status=400,
+            )
+
+        # Тело читается до разбора request.data: после разбора multipart и
+        # форм request.body уже недоступен, а так оно остается в памяти
+        request_hash = hashlib.sha256(request.body).hexdigest()
+        sender = request_sender(self.initialize_request(request))
+        if sender is None:
+            # Неверная initData: запрос отклонит аутентификация
+            return super().dispatch(request, *args, **kwargs)
+        scope = f"{request.method} {request.path} {sender}"
+        record, response = acquire(key, scope, request_hash)
+        if response is not None:
+            return response
+
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+        except BaseException:
+            record.delete()
+            raise
+
+        if response.status_code >= 500:
+            record.delete()
+            return response
+        if hasattr(response, "render"):
+            response.render()
+        record.status_code = response.status_code
+        record.content = response.content
+        record.content_type = response.get("Content-Type", "")
+        record.save(update_fields=["status_code", "content", "content_type"])
+        return response
+
+
+def request_sender(request):
+    """
+    Отправитель запроса без обращения к БД: id из подписанной initData,
+    telegram_id из параметров или тела, иначе "anonymous"; None — подпись
+    initData неверна.
+    """
+    init_data = TelegramInitDataAuthentication().get_init_data(request)
+    bot_token = getattr(settings, "TELEGRAM_BOT_TOKEN", "")
+    if init_data and bot_token:
+        try:
+            fields = identity.validate_init_data(init_data, bot_token)
+        except identity.InvalidInitData:
+            return None
+        return f"tg:{int(fields['user']['id'])}"
+
+    telegram_id = request.query_params.get("telegram_id")
+    if telegram_id is None and hasattr(request.data, "get"):
+        telegram_id = request.data.get("telegram_id")
+    try:
+        return f"id:{int(telegram_id)}"
+    except (TypeError, ValueError):
+        return "anonymous"
+
+
+def acquire(key, scope, request_hash):
+    """Занять ключ: (запись, None) или (None, ответ для повторного запроса)"""
+    now = timezone.now()
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    key=key,
+                    scope=scope,
+                    request_hash=request_hash,
+                    created_at=now,
+                    expires_at=now + KEY_TTL,
+                )
+            return record, None
+        except IntegrityError:
+            pass
+
+        record = IdempotencyKey.objects.filter(key=key, scope=scope).first()
+        if record is None:
+            continue
+        if record.expires_at <= now or (
+            record.status_code is None and record.created_at <= now - LOCK_TIMEOUT
+        ):
+            # Ключ истек или первый запрос брошен — занимаем заново
+            IdempotencyKey.objects.filter(pk=record.pk).delete()
+            continue
+        return None, replay(record, request_hash)
+
+    return None, JsonResponse(
+        {"error": "Запрос с этим ключом уже обрабатывается"}, status=409
+    )
+
+
+def replay(record, request_hash):
+    if record.status_code is None:
+        return JsonResponse(
+            {"error": "Запрос с этим ключом уже обрабатывается"}, status=409
+        )
+    if record.request_hash != request_hash:
+        return JsonResponse(
+            {"error": f"{IDEMPOTENCY_HEADER} уже использован с другим запросом"},
+            status=422,
+        )
+    response = HttpResponse(
+        bytes(record.content),
+        status=record.status_code,
+        content_type=record.content_type or None,
+    )
+    response[REPLAY_HEADER] = "true"
+    return response
+
+
+def clear_expired():
+    """Удалить истекшие ключи; возвращает количество удаленных"""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
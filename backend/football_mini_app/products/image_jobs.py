@@ -0,0 +1,132 @@
+"""
+Очередь фоновой обработки фото в БД.
+
+Загрузка только сохраняет файл и ставит задачу (см. Image.save), а
+декодирование, снятие EXIF, нарезка копий и перекодирование выполняются
+командой process_image_jobs в пуле процессов. Задача захватывается условным
+UPDATE по статусу, поэтому несколько обработчиков не возьмут одну задачу и
+без SELECT ... SKIP LOCKED (его нет в SQLite). Задачи зависшего обработчика
+возвращаются в очередь по таймауту, ошибки повторяются с растущей паузой.
+Выполненная задача удаляется: итог хранится в Image.status.
+
+Снятие EXIF меняет байты оригинала, поэтому он сохраняется под новым именем
+по хэшу (см. storage.py), а файл с исходными байтами удаляется, если на него
+больше не ссылается ни одно фото.
+"""
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .catalog import products_changed
+from .models import PROCESSED_FIELDS, Image, ImageJob, Product
+from .storage import content_storage
+
+MAX_ATTEMPTS = 3
+# Задача в статусе processing дольше этого считается брошенной
+PROCESSING_TIMEOUT = timedelta(minutes=10)
+RETRY_DELAY = timedelta(seconds=30)
+
+
+def enqueue(images):
+    """
+    Создать фото пачкой (bulk_create в обход Image.save): у байтов, которые
+    уже обработаны, берется готовый результат, на остальные ставятся задачи.
+    У фото должны быть заполнены image (уже сохраненный файл) и checksum.
+    """
+    if not images:
+        return []
+    processed = {}
+    for image in Image.objects.filter(
+        checksum__in={image.checksum for image in images}, status="ready"
+    ).order_by("id"):
+        processed.setdefault(image.checksum, image)
+    for image in images:
+        ready = processed.get(image.checksum)
+        if ready is None:
+            image.status = "pending"
+            continue
+        image.image = ready.image.name
+        for field in PROCESSED_FIELDS:
+            setattr(image, field, getattr(ready, field))
+        image.status = "ready"
+    with transaction.atomic():
+        created = Image.objects.bulk_create(images)
+        ImageJob.objects.bulk_create(
+            [ImageJob(image=image) for image in created if image.status == "pending"]
+        )
+    return created
+
+
+def claim(limit):
+    """Захватить до limit готовых к выполнению задач"""
+    now = timezone.now()
+    candidates = list(
+        ImageJob.objects.filter(status="pending", available_at__lte=now)
+        .order_by("available_at", "id")
+        .values_list("id", flat=True)[:limit]
+    )
+    claimed = []
+    for job_id in candidates:
+        updated = ImageJob.objects.filter(pk=job_id, status="pending").update(
+            status="processing", started_at=now, attempts=F("attempts") + 1
+        )
+        if updated:
+            claimed.append(job_id)
+    return list(
+        ImageJob.objects.filter(pk__in=claimed).select_related("image").order_by("id")
+    )
+
+
+def complete(job, result):
+    """Сохранить итог imaging.process_upload: имя файла и PROCESSED_FIELDS"""
+    image = job.image
+    with transaction.atomic():
+        Image.objects.filter(pk=image.pk).update(
+            image=result["name"],
+            status="ready",
+            **{field: result[field] for field in PROCESSED_FIELDS},
+        )
+        ImageJob.objects.filter(pk=job.pk).delete()
+    uploaded = image.image.name
+    if uploaded != result["name"] and not Image.objects.filter(image=uploaded).exists():
+        content_storage.delete(uploaded)
+    touch_products([image.product_id])
+
+
+def fail(job, error, max_attempts=MAX_ATTEMPTS):
+    """Отложить повтор или, если попытки кончились, отметить фото как сбойное"""
+    if job.attempts < max_attempts:
+        ImageJob.objects.filter(pk=job.pk).update(
+            status="pending",
+            error=error,
+            available_at=timezone.now() + RETRY_DELAY * 2 ** (job.attempts - 1),
+        )
+        return False
+    with transaction.atomic():
+        ImageJob.objects.filter(pk=job.pk).update(status="failed", error=error)
+        Image.objects.filter(pk=job.image_id).update(status="failed")
+    touch_products([job.image.product_id])
+    return True
+
+
+def requeue_stale(max_attempts=MAX_ATTEMPTS):
+    """
+    Вернуть в очередь задачи, брошенные упавшим обработчиком. Попытка уже
+    засчитана при захвате: задача, которая раз за разом роняет обработчик,
+    после max_attempts отмечается как сбойная, а не захватывается бесконечно.
+    """
+    stale = ImageJob.objects.filter(
+        status="processing", started_at__lt=timezone.now() - PROCESSING_TIMEOUT
+    )
+    for job in stale.filter(attempts__gte=max_attempts).select_related("image"):
+        fail(job, "Обработка прервана: обработчик не завершил задачу", max_attempts)
+    return stale.update(status="pending", available_at=timezone.now())
+
+
+def touch_products(product_ids):
+    # Обновление в обход save(): дата изменения нужна для кэша в других процессах
+    Product.objects.filter(pk__in=product_ids).update(updated_at=timezone.now())
+    products_changed(product_ids)
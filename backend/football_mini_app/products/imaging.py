@@ -0,0 +1,213 @@
+"""
+Уменьшенные копии фотографий товаров.
+
+Из оригинала нарезаются копии фиксированной ширины в JPEG, WebP и, если
+Pillow собран с его поддержкой, AVIF. Копии лежат рядом с оригиналом:
+`products/ab/<sha256>.v1.w400.webp` (см. storage.py). Модуль не импортирует
+модели, поэтому функции можно вызывать в дочерних процессах (см. команды
+generate_image_variants и process_image_jobs).
+"""
+
+import base64
+import hashlib
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.core.files.base import ContentFile
+from PIL import Image as PILImage
+from PIL import ImageOps, features
+
+from .storage import content_name, content_storage
+
+# Ширины копий: карточка в сетке, карточка на широком экране, карточка товара
+WIDTHS = (200, 400, 800)
+# Форматы в порядке предпочтения для <picture>: первый поддерживаемый браузером
+FORMATS = ("avif", "webp", "jpeg") if features.check("avif") else ("webp", "jpeg")
+SAVE_OPTIONS = {
+    "avif": {"format": "AVIF", "quality": 50, "speed": 8},
+    "webp": {"format": "WEBP", "quality": 75, "method": 4},
+    "jpeg": {"format": "JPEG", "quality": 80, "optimize": True, "progressive": True},
+}
+EXTENSIONS = {"avif": "avif", "webp": "webp", "jpeg": "jpg"}
+# Входит в имя копии: при смене WIDTHS или SAVE_OPTIONS его нужно увеличить,
+# иначе по неизменяемой ссылке останутся закэшированные старые байты
+VARIANTS_VERSION = 1
+# Фото с перцептивными хэшами не дальше этого считаются почти одинаковыми
+NEAR_DUPLICATE_DISTANCE = 6
+# Заглушка до загрузки фото: JPEG по длинной стороне, растягивается с размытием
+PLACEHOLDER_SIZE = 16
+PLACEHOLDER_QUALITY = 50
+
+
+def variant_name(name, width, image_format):
+    path = PurePosixPath(name)
+    extension = EXTENSIONS[image_format]
+    return str(path.with_name(f"{path.stem}.v{VARIANTS_VERSION}.w{width}.{extension}"))
+
+
+def target_widths(original_width):
+    """Ширины копий без увеличения: маленький оригинал дает одну копию"""
+    return sorted({min(width, original_width) for width in WIDTHS})
+
+
+def load(name, storage=content_storage):
+    with storage.open(name, "rb") as file:
+        image = PILImage.open(file)
+        image.load()
+    return image
+
+
+def prepare(image):
+    # Поворот по EXIF применяется к пикселям, сами метаданные в копии не попадают
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+    return image
+
+
+def strip_metadata(name, image, storage=content_storage):
+    """
+    Сохранить оригинал без EXIF (координаты съемки, модель камеры); поворот
+    переносится в пиксели, цветовой профиль сохраняется. Новые байты — новое
+    имя по хэшу: возвращает (имя, картинка).
+    """
+    if not image.getexif():
+        return name, image
+    image_format = image.format
+    icc_profile = image.info.get("icc_profile")
+    image = ImageOps.exif_transpose(image)
+    options = {"format": image_format, "exif": b""}
+    if icc_profile:
+        options["icc_profile"] = icc_profile
+    if image_format == "JPEG":
+        options.update(quality=90, optimize=True)
+    buffer = BytesIO()
+    image.save(buffer, **options)
+    content = buffer.getvalue()
+    digest = hashlib.sha256(content).hexdigest()
+    name = storage.save(content_name(digest, name), ContentFile(content))
+    return name, image
+
+
+def perceptual_hash(image):
+    """
+    dHash: 64 бита «соседний пиксель ярче» на уменьшенной до 9×8 серой копии.
+    Не меняется при пересжатии и масштабировании, в отличие от sha256.
+    """
+    small = image.convert("L").resize((9, 8), PILImage.LANCZOS)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(8):
+        for column in range(8):
+            left = pixels[row * 9 + column]
+            bits = bits << 1 | (left > pixels[row * 9 + column + 1])
+    return f"{bits:016x}"
+
+
+def hash_distance(first, second):
+    """Число различающихся бит двух перцептивных хэшей"""
+    return (int(first, 16) ^ int(second, 16)).bit_count()
+
+
+def dominant_color(image):
+    """Самый частый цвет после сведения к палитре из 8 цветов: "#rrggbb" """
+    small = image.convert("RGB")
+    small.thumbnail((64, 64))
+    quantized = small.quantize(colors=8)
+    _, index = max(quantized.getcolors())
+    red, green, blue = quantized.getpalette()[index * 3 : index * 3 + 3]
+    return f"#{red:02x}{green:02x}{blue:02x}"
+
+
+def placeholder(image):
+    """Крошечная JPEG-копия как data URI (~300–600 байт в JSON)"""
+    small = image.copy()
+    small.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), PILImage.BOX)
+    if small.mode != "RGB":
+        small = small.convert("RGB")
+    buffer = BytesIO()
+    small.save(buffer, format="JPEG", quality=PLACEHOLDER_QUALITY, optimize=True)
+    return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+def describe(image):
+    """
+    Данные для отрисовки сетки до загрузки фото: размеры (без сдвига
+    верстки), основной цвет и заглушка. image — после prepare().
+    """
+    return {
+        "width": image.width,
+        "height": image.height,
+        "dominant_color": dominant_color(image),
+        "placeholder": placeholder(image),
+    }
+
+
+def process_upload(name, storage=content_storage):
+    """
+    Обработка загруженного фото в фоновом обработчике (см. image_jobs.py);
+    возвращает {"name", "variants", "phash", "width", "height",
+    "dominant_color", "placeholder"}.
+    """
+    name, image = strip_metadata(name, load(name, storage), storage)
+    image = prepare(image)
+    return {
+        "name": name,
+        "variants": render_variants(name, storage, image),
+        "phash": perceptual_hash(image),
+        **describe(image),
+    }
+
+
+def encode(image, image_format):
+    if image_format == "jpeg" and image.mode == "RGBA":
+        background = PILImage.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, **SAVE_OPTIONS[image_format])
+    return buffer.getvalue()
+
+
+def render_variants(name, storage=content_storage, image=None):
+    """
+    Нарезать и сохранить копии оригинала; возвращает их описание для
+    Image.variants: [{"format", "width", "height", "name"}, ...].
+    """
+    original = prepare(image if image is not None else load(name, storage))
+    variants = []
+    # От большей копии к меньшей: каждая уменьшается из предыдущей, а не из
+    # оригинала, — так быстрее, а качество при шаге в 2 раза не страдает
+    source = original
+    for width in reversed(target_widths(original.width)):
+        height = max(1, round(original.height * width / original.width))
+        source = source.resize((width, height), PILImage.LANCZOS, reducing_gap=3.0)
+        for image_format in FORMATS:
+            target = variant_name(name, width, image_format)
+            # Имя копии определяется содержимым оригинала и VARIANTS_VERSION:
+            # готовый файл (например, у повторной загрузки) не пересобирается
+            if not storage.exists(target):
+                storage.save(target, ContentFile(encode(source, image_format)))
+            variants.append(
+                {
+                    "format": image_format,
+                    "width": width,
+                    "height": height,
+                    "name": target,
+                }
+            )
+    return variants
+
+
+def build_srcset(variants, url):
+    """{"webp": "url 200w, url 400w", ...} в порядке FORMATS"""
+    srcset = {}
+    for image_format in FORMATS:
+        entries = [
+            f"{url(variant['name'])} {variant['width']}w"
+            for variant in sorted(variants, key=lambda variant: variant["width"])
+            if variant["format"] == image_format
+        ]
+        if entries:
+            srcset[image_format] = ", ".join(entries)
+    return srcset
@@ -0,0 +1,112 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from products import snapshots
+from products.models import Image, Product
+from products.serializers import ProductSerializer
+
+
+class Rollback(Exception):
+    """Откат всех данных замера"""
+
+
+VARIANTS = [
+    ("полное", ""),
+    ("card", "?fields=card"),
+    ("card+фото", "?fields=card&expand=images"),
+    ("id,price", "?fields=id,price"),
+]
+
+
+class Command(BaseCommand):
+    help = "Сравнить размер и время сериализации списка товаров по наборам полей"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--products", type=int, default=100, help="Товаров в списке"
+        )
+        parser.add_argument("--images", type=int, default=5, help="Фото у товара")
+        parser.add_argument(
+            "--repeat", type=int, default=20, help="Повторов каждого варианта"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                products = self.create_products(options["products"], options["images"])
+                self.stdout.write(
+                    f"{'поля':>10} {'байт':>9} {'байт/товар':>11} "
+                    f"{'холодный, мс':>13} {'из кэша, мс':>12}"
+                )
+                for name, query in VARIANTS:
+                    size, cold, warm = self.measure(products, query, options["repeat"])
+                    self.stdout.write(
+                        f"{name:>10} {size:>9} {size // len(products):>11} "
+                        f"{cold:>13.2f} {warm:>12.2f}"
+                    )
+                snapshots.invalidate([product.pk for product in products])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def measure(self, products, query, repeat):
+        """Размер ответа и медианы времени без кэша и с кэшем представлений"""
+        # Разрешенный домен: ссылки на фото строятся через request.get_host()
+        factory = APIRequestFactory(SERVER_NAME=settings.ALLOWED_HOSTS[0])
+        product_ids = [product.pk for product in products]
+        timings = {"cold": [], "warm": []}
+        for mode in ("cold", "warm"):
+            for _ in range(repeat):
+                if mode == "cold":
+                    snapshots.invalidate(product_ids)
+                request = Request(factory.get(f"/api/products/{query}"))
+                started = time.perf_counter()
+                data = ProductSerializer(
+                    products, many=True, context={"request": request}
+                ).data
+                content = JSONRenderer().render(data)
+                timings[mode].append(time.perf_counter() - started)
+        return (
+            len(content),
+            statistics.median(timings["cold"]) * 1000,
+            statistics.median(timings["warm"]) * 1000,
+        )
+
+    def create_products(self, count, images):
+        products = Product.objects.bulk_create(
+            Product(
+                team=f"bench {index}",
+                national_team="bench",
+                league="bench league",
+                brand="bench",
+                season="2024/25",
+                kit_type="Домашняя",
+                condition="Новая",
+                price=1000 + index,
+                size="M",
+                color="bench",
+                features="bench " * 40,
+                contacts="@bench",
+                hashtags="#bench #kit",
+                post_url="https://t.me/bench/1",
+                stock_quantity=1,
+            )
+            for index in range(count)
+        )
+        Image.objects.bulk_create(
+            Image(product=product, image=f"products/bench-{product.pk}-{index}.jpg")
+            for product in products
+            for index in range(images)
+        )
+        return list(
+            Product.objects.filter(pk__in=[product.pk for product in products])
+            .prefetch_related("images_set")
+            .order_by("id")
+        )
@@ -0,0 +1,170 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from football_mini_app import middleware, renderers
+from orders.models import Order, OrderItem
+from orders.serializers import OrderSerializer
+from products.models import CartItem, Image, Product
+from products.serializers import CartItemSerializer, ProductSerializer
+from users.models import User
+
+
+class Rollback(Exception):
+    """Откат всех данных замера"""
+
+
+class Command(BaseCommand):
+    help = "Сравнить рендереры и сжатие ответов: каталог, корзина, история заказов"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--products", type=int, default=500, help="Товаров в каталоге"
+        )
+        parser.add_argument("--cart", type=int, default=30, help="Позиций в корзине")
+        parser.add_argument(
+            "--orders", type=int, default=50, help="Заказов в истории (по 3 позиции)"
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=20, help="Повторов каждого замера"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                payloads = self.build_payloads(options)
+                self.report(payloads, options["repeat"])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def build_payloads(self, options):
+        products = Product.objects.bulk_create(
+            Product(
+                team=f"bench {index}",
+                national_team="bench",
+                league="bench league",
+                brand="bench",
+                season="2024/25",
+                kit_type="Домашняя",
+                condition="Новая",
+                price=1000 + index,
+                size="M",
+                color="bench",
+                features="Оригинальная форма, состояние отличное. " * 5,
+                contacts="@bench",
+                hashtags="#bench #kit",
+                post_url="https://t.me/bench/1",
+                stock_quantity=100,
+            )
+            for index in range(options["products"])
+        )
+        Image.objects.bulk_create(
+            Image(product=product, image=f"products/bench-{product.pk}-{index}.jpg")
+            for product in products
+            for index in range(3)
+        )
+        user = User.objects.create(telegram_id=-int(time.time_ns() % 10**12))
+        CartItem.objects.bulk_create(
+            CartItem(user=user, product=product, quantity=1, selected_size="M")
+            for product in products[: options["cart"]]
+        )
+        orders = Order.objects.bulk_create(
+            Order(
+                user=user,
+                order_number=f"BENCH-{user.pk}-{index}",
+                total_amount=3000,
+                shipping_address="bench",
+                phone_number="0",
+            )
+            for index in range(options["orders"])
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(
+                order=order,
+                product=products[(index * 3 + offset) % len(products)],
+                quantity=1,
+                price=1000,
+                selected_size="M",
+            )
+            for index, order in enumerate(orders)
+            for offset in range(3)
+        )
+
+        # Разрешенный домен: ссылки на фото строятся через request.get_host()
+        factory = APIRequestFactory(SERVER_NAME=settings.ALLOWED_HOSTS[0])
+        request = Request(factory.get("/api/"))
+        context = {"request": request}
+        product_ids = [product.pk for product in products]
+        return [
+            (
+                "каталог",
+                ProductSerializer(
+                    Product.objects.filter(pk__in=product_ids).prefetch_related(
+                        "images_set"
+                    ),
+                    many=True,
+                    context=context,
+                ).data,
+            ),
+            (
+                "корзина",
+                CartItemSerializer(
+                    CartItem.objects.filter(user=user).with_product(),
+                    many=True,
+                    context=context,
+                ).data,
+            ),
+            (
+                "заказы",
+                OrderSerializer(
+                    Order.objects.filter(user=user).with_items(),
+                    many=True,
+                    context=context,
+                ).data,
+            ),
+        ]
+
+    def report(self, payloads, repeat):
+        formats = [
+            ("drf json", JSONRenderer()),
+            ("orjson", renderers.FastJSONRenderer()),
+        ]
+        if renderers.msgpack is not None:
+            formats.append(("msgpack", renderers.MessagePackRenderer()))
+        encodings = ["gzip"]
+        if middleware.brotli is not None:
+            encodings.append("br")
+
+        self.stdout.write(f"{'ответ':>8} {'формат':>12} {'байт':>9} {'рендер, мс':>11}")
+        for name, data in payloads:
+            for label, renderer in formats:
+                content, elapsed = self.timed(lambda: renderer.render(data), repeat)
+                self.stdout.write(
+                    f"{name:>8} {label:>12} {len(content):>9} {elapsed:>11.2f}"
+                )
+                if label == "drf json":
+                    continue
+                for encoding in encodings:
+                    compressed, elapsed = self.timed(
+                        lambda: middleware.compress(content, encoding), repeat
+                    )
+                    self.stdout.write(
+                        f"{name:>8} {label + '+' + encoding:>12} "
+                        f"{len(compressed):>9} {elapsed:>11.2f}"
+                    )
+
+    def timed(self, function, repeat):
+        """Результат и медиана времени вызова в миллисекундах"""
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = function()
+            timings.append(time.perf_counter() - started)
+        return result, statistics.median(timings) * 1000
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from products.idempotency import clear_expired
+
+
+class Command(BaseCommand):
+    help = "Удалить истекшие ключи идемпотентности"
+
+    def handle(self, *args, **options):
+        deleted = clear_expired()
+        self.stdout.write(self.style.SUCCESS(f"Удалено ключей: {deleted}"))
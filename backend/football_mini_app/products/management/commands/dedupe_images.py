@@ -0,0 +1,173 @@
+import hashlib
+from io import BytesIO
+from itertools import combinations
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from PIL import Image as PILImage
+
+from products import image_jobs, imaging
+from products.models import Image
+from products.storage import (
+    DIRECTORY,
+    content_name,
+    content_storage,
+    digest_from_name,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Перенести фото товаров в хранилище по хэшу содержимого, "
+        "удалить повторы и найти почти одинаковые фото"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать, что будет сделано",
+        )
+        parser.add_argument(
+            "--distance",
+            type=int,
+            default=imaging.NEAR_DUPLICATE_DISTANCE,
+            help="Порог расстояния перцептивных хэшей для почти одинаковых фото",
+        )
+        parser.add_argument(
+            "--prune",
+            action="store_true",
+            help=f"Удалить файлы в {DIRECTORY}/, на которые не ссылается ни одно фото",
+        )
+
+    def handle(self, *args, **options):
+        self.dry_run = options["dry_run"]
+        self.touched = set()
+        # Загрузки в очереди доводит до хранилища process_image_jobs
+        images = list(
+            Image.objects.exclude(image="").exclude(status="pending").order_by("id")
+        )
+        self.migrate(images)
+        self.merge_duplicates(images)
+        self.report_similar(images, options["distance"])
+        if options["prune"]:
+            self.prune()
+        if self.touched and not self.dry_run:
+            image_jobs.touch_products(self.touched)
+
+    def migrate(self, images):
+        """Переименовать файлы по sha256 и заполнить хэши"""
+        changed, stale, renamed, missing = [], set(), 0, 0
+        for image in images:
+            name = image.image.name
+            if digest_from_name(name) and image.checksum and image.phash:
+                continue
+            try:
+                with content_storage.open(name, "rb") as file:
+                    content = file.read()
+                picture = PILImage.open(BytesIO(content))
+                picture.load()
+            except (OSError, ValueError) as e:
+                missing += 1
+                self.stderr.write(f"Фото {image.pk} ({name}): {e}")
+                continue
+
+            digest = hashlib.sha256(content).hexdigest()
+            target = content_name(digest, name)
+            if target != name:
+                renamed += 1
+                stale.add(name)
+                stale.update(variant["name"] for variant in image.variants)
+                image.variants = self.move_variants(image.variants, target)
+                if not self.dry_run:
+                    content_storage.save(target, ContentFile(content))
+                image.image = target
+            # У старых фото нет исходных байтов загрузки: хэш хранимого файла
+            image.checksum = image.checksum or digest
+            image.phash = imaging.perceptual_hash(imaging.prepare(picture))
+            changed.append(image)
+            self.touched.add(image.product_id)
+
+        if not self.dry_run and changed:
+            Image.objects.bulk_update(
+                changed, ["image", "checksum", "phash", "variants"], batch_size=200
+            )
+            referenced = self.referenced_names()
+            for name in stale - referenced:
+                content_storage.delete(name)
+        self.stdout.write(
+            f"Перенесено в хранилище по хэшу: {renamed}, "
+            f"хэши заполнены: {len(changed)}, без файла: {missing}"
+        )
+
+    def move_variants(self, variants, target):
+        """Копии под именами от нового оригинала; без файла копии — пересобрать"""
+        moved = []
+        for variant in variants:
+            name = imaging.variant_name(target, variant["width"], variant["format"])
+            if not self.dry_run:
+                try:
+                    with content_storage.open(variant["name"], "rb") as file:
+                        content_storage.save(name, ContentFile(file.read()))
+                except FileNotFoundError:
+                    # Пустой список подхватит generate_image_variants
+                    return []
+            moved.append({**variant, "name": name})
+        return moved
+
+    def merge_duplicates(self, images):
+        """Удалить у товара повторы одного и того же файла (остается первое)"""
+        seen, duplicates = set(), []
+        for image in images:
+            key = (image.product_id, image.image.name)
+            if key in seen:
+                duplicates.append(image.pk)
+                self.touched.add(image.product_id)
+            else:
+                seen.add(key)
+        if duplicates and not self.dry_run:
+            with transaction.atomic():
+                Image.objects.filter(pk__in=duplicates).delete()
+        self.stdout.write(f"Удалено повторов фото: {len(duplicates)}")
+
+    def report_similar(self, images, distance):
+        """Почти одинаковые фото одного товара: пересжатые или уменьшенные копии"""
+        by_product = {}
+        for image in images:
+            if image.phash:
+                unique = by_product.setdefault(image.product_id, {})
+                unique.setdefault(image.image.name, image)
+        pairs = 0
+        for product_id, unique in by_product.items():
+            for first, second in combinations(unique.values(), 2):
+                if imaging.hash_distance(first.phash, second.phash) <= distance:
+                    pairs += 1
+                    self.stdout.write(
+                        f"Товар {product_id}: фото {first.pk} и {second.pk} похожи"
+                    )
+        self.stdout.write(f"Пар почти одинаковых фото: {pairs}")
+
+    def prune(self):
+        referenced = self.referenced_names()
+        orphans = [name for name in self.walk(DIRECTORY) if name not in referenced]
+        if not self.dry_run:
+            for name in orphans:
+                content_storage.delete(name)
+        self.stdout.write(f"Удалено файлов без ссылок: {len(orphans)}")
+
+    def walk(self, path):
+        if not content_storage.exists(path):
+            return
+        directories, files = content_storage.listdir(path)
+        for name in files:
+            yield f"{path}/{name}"
+        for directory in directories:
+            yield from self.walk(f"{path}/{directory}")
+
+    def referenced_names(self):
+        names = set()
+        for name, variants in Image.objects.values_list("image", "variants"):
+            names.add(name)
+            names.update(variant["name"] for variant in variants)
+        return names
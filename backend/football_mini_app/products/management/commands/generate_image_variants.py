@@ -0,0 +1,99 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Q
+
+from products import image_jobs, imaging
+from products.models import Image
+
+FIELDS = ["variants", "width", "height", "dominant_color", "placeholder"]
+
+
+def render(name):
+    """Выполняется в дочернем процессе: без обращений к БД"""
+    try:
+        image = imaging.prepare(imaging.load(name))
+        result = {"variants": imaging.render_variants(name, image=image)}
+        result.update(imaging.describe(image))
+        return name, result, None
+    except Exception as e:
+        # Любая ошибка файла (в том числе DecompressionBombError PIL) —
+        # строка в отчете, а не остановка всей нарезки
+        return name, None, f"{type(e).__name__}: {e}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Нарезать уменьшенные копии (JPEG/WebP/AVIF) и заглушки "
+        "для существующих фото товаров"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Число процессов (по умолчанию — по числу ядер)",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Обработать и фото, где копии уже есть (недостающие файлы дорисуются)",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=200, help="Фото в одной записи в БД"
+        )
+
+    def handle(self, *args, **options):
+        # Новые загрузки обрабатывает process_image_jobs
+        images = Image.objects.exclude(image="").exclude(status="pending")
+        images = images.order_by("id")
+        if not options["force"]:
+            images = images.filter(Q(variants=[]) | Q(placeholder=""))
+        images = list(images.only("id", "product_id", "image"))
+        if not images:
+            self.stdout.write("Нет фото для обработки")
+            return
+
+        by_name = {}
+        for image in images:
+            by_name.setdefault(image.image.name, []).append(image)
+
+        started = time.perf_counter()
+        # Соединения с БД не должны наследоваться дочерними процессами
+        connections.close_all()
+        processed, failed, batch = 0, 0, []
+        with ProcessPoolExecutor(max_workers=options["workers"]) as executor:
+            results = executor.map(render, by_name, chunksize=4)
+            for name, result, error in results:
+                if error:
+                    failed += 1
+                    self.stderr.write(f"{name}: {error}")
+                    continue
+                for image in by_name[name]:
+                    for field in FIELDS:
+                        setattr(image, field, result[field])
+                    batch.append(image)
+                processed += 1
+                if len(batch) >= options["batch_size"]:
+                    self.save(batch)
+                    batch = []
+        self.save(batch)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Обработано {processed} фото за {elapsed:.1f} с "
+                f"({options['workers']} процессов), ошибок: {failed}"
+            )
+        )
+
+    def save(self, images):
+        if not images:
+            return
+        Image.objects.bulk_update(images, FIELDS)
+        # bulk_update обходит сигналы: дата изменения и кэш товаров вручную
+        image_jobs.touch_products({image.product_id for image in images})
@@ -0,0 +1,203 @@
+import csv
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from products import image_jobs, search, storage
+from products.catalog import products_changed
+from products.models import Image, Product
+
+SCRIPTS_DIR = Path(settings.BASE_DIR).parent.parent / "scripts"
+
+# Поля, которые импорт перезаписывает у существующего товара. Наличие и
+# остаток ведет магазин (и reconcile_availability), поэтому их тут нет
+IMPORTED_FIELDS = [
+    "team",
+    "league",
+    "brand",
+    "season",
+    "kit_type",
+    "condition",
+    "price",
+    "size",
+    "color",
+    "features",
+    "contacts",
+    "hashtags",
+    "post_url",
+]
+UPDATE_FIELDS = (
+    IMPORTED_FIELDS
+    + [f"{field}_norm" for field in Product.NORMALIZED_FIELDS]
+    + ["updated_at"]
+)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def clean(value):
+    return (value or "").strip()
+
+
+def product_from_row(row):
+    """Товар из строки CSV скрапера или None, если в посте нет команды или цены"""
+    team = clean(row.get("Команда"))
+    try:
+        price = Decimal(clean(row.get("Цена")))
+    except InvalidOperation:
+        return None
+    external_id = clean(row.get("UUID"))
+    if not team or not external_id:
+        return None
+    size = clean(row.get("Размер"))
+    kit_type = clean(row.get("Тип формы"))
+    hashtags = clean(row.get("Хештеги"))
+    # Хештеги поста: лига и размер («АПЛ, L»)
+    tags = [tag.strip() for tag in hashtags.split(",") if tag.strip()]
+    league = next((tag for tag in tags if tag.casefold() != size.casefold()), None)
+    product = Product(
+        external_id=external_id,
+        team=team,
+        league=league,
+        brand=clean(row.get("Бренд")),
+        season=clean(row.get("Сезон")),
+        kit_type=kit_type[:1].upper() + kit_type[1:],
+        condition=clean(row.get("Состояние")) or "Новая",
+        price=price,
+        size=size,
+        color=clean(row.get("Цвет")),
+        features=clean(row.get("Особенности")) or None,
+        contacts=clean(row.get("Контакты")),
+        hashtags=hashtags or None,
+        post_url=clean(row.get("Ссылка на пост")) or None,
+    )
+    product.normalize_fields()
+    return product
+
+
+class Command(BaseCommand):
+    help = (
+        "Загрузить товары и фото из выгрузки скрапера канала "
+        "(scripts/tg_channel_availability_to_csv.py) потоком, пачками"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "csv",
+            nargs="?",
+            default=str(SCRIPTS_DIR / "football_jerseys.csv"),
+            help="CSV скрапера (по умолчанию scripts/football_jerseys.csv)",
+        )
+        parser.add_argument(
+            "--photos-dir",
+            help="Папка фото <UUID товара>/<UUID фото>.jpg (по умолчанию рядом с CSV)",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=200, help="Строк CSV в одной пачке"
+        )
+        parser.add_argument(
+            "--skip-images", action="store_true", help="Не загружать фото"
+        )
+
+    def handle(self, *args, **options):
+        csv_path = Path(options["csv"])
+        if not csv_path.exists():
+            raise CommandError(f"Нет файла {csv_path}")
+        self.photos_dir = Path(options["photos_dir"] or csv_path.parent / "photos")
+        self.skip_images = options["skip_images"]
+        self.stats = dict.fromkeys(
+            ["created", "updated", "skipped", "images", "missing"], 0
+        )
+
+        started = time.perf_counter()
+        # Файл читается построчно: в памяти только текущая пачка
+        with open(csv_path, encoding="utf-8-sig", newline="") as file:
+            for rows in batched(csv.DictReader(file), options["batch_size"]):
+                self.import_batch(rows)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Товаров: {created} новых, {updated} обновлено, {skipped} пропущено; "
+                "фото: {images} добавлено, {missing} файлов не найдено".format(
+                    **self.stats
+                )
+                + f" ({time.perf_counter() - started:.1f} с)"
+            )
+        )
+
+    def import_batch(self, rows):
+        products, photos = {}, {}
+        for row in rows:
+            product = product_from_row(row)
+            if product is None:
+                self.stats["skipped"] += 1
+                continue
+            # Повтор товара в выгрузке: побеждает первая (самая новая) строка
+            if product.external_id in products:
+                continue
+            products[product.external_id] = product
+            photos[product.external_id] = [
+                photo for photo in clean(row.get("UUID_фотографий")).split(",") if photo
+            ]
+        if not products:
+            return
+
+        with transaction.atomic():
+            existing = set(
+                Product.objects.filter(external_id__in=products).values_list(
+                    "external_id", flat=True
+                )
+            )
+            Product.objects.bulk_create(
+                products.values(),
+                update_conflicts=True,
+                unique_fields=["external_id"],
+                update_fields=UPDATE_FIELDS,
+            )
+            # Первичные ключи обновленных строк bulk_create не возвращает
+            saved = list(Product.objects.filter(external_id__in=products))
+            if not self.skip_images:
+                self.attach_images(saved, photos)
+        self.stats["created"] += len(products) - len(existing)
+        self.stats["updated"] += len(existing)
+
+        # bulk_create обходит сигналы: индекс поиска и кэши обновляются вручную
+        search.index_products(saved)
+        products_changed([product.pk for product in saved])
+
+    def attach_images(self, products, photos):
+        """Фото из папки скрапера, которых у товара еще нет (по sha256 файла)"""
+        known = set(
+            Image.objects.filter(product__in=products).values_list(
+                "product_id", "checksum"
+            )
+        )
+        images = []
+        for product in products:
+            for photo in photos[product.external_id]:
+                path = self.photos_dir / product.external_id / f"{photo}.jpg"
+                if not path.exists():
+                    self.stats["missing"] += 1
+                    continue
+                with open(path, "rb") as file:
+                    checksum = storage.checksum(file)
+                    if (product.pk, checksum) in known:
+                        continue
+                    known.add((product.pk, checksum))
+                    # Одинаковые байты уже в хранилище: файл не пишется повторно
+                    name = storage.content_storage.save(
+                        storage.content_name(checksum, path.name), File(file)
+                    )
+                images.append(Image(product=product, image=name, checksum=checksum))
+        image_jobs.enqueue(images)
+        self.stats["images"] += len(images)
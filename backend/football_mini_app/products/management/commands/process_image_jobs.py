@@ -0,0 +1,98 @@
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from products import image_jobs, imaging
+
+
+def process(name):
+    """Выполняется в дочернем процессе: без обращений к БД"""
+    try:
+        return imaging.process_upload(name), None
+    except Exception:
+        # Любая ошибка файла — повтор задачи, а не падение обработчика
+        return None, traceback.format_exc()
+
+
+class Command(BaseCommand):
+    help = "Фоновый обработчик загруженных фото (очередь ImageJob)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Число процессов обработки (по умолчанию — по числу ядер)",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Пауза между проверками пустой очереди, секунд",
+        )
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=image_jobs.MAX_ATTEMPTS,
+            help="Попыток на задачу до статуса failed",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Обработать готовые задачи и выйти (для cron и тестов)",
+        )
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        try:
+            # Пул ломается, если дочерний процесс убит: тогда создается новый
+            while True:
+                # Соединения с БД не должны наследоваться дочерними процессами
+                connections.close_all()
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    if self.loop(executor, workers, options):
+                        break
+        except KeyboardInterrupt:
+            self.stdout.write("Остановлено")
+
+    def loop(self, executor, workers, options):
+        """Обрабатывать очередь; False — пул процессов сломан и нужен новый"""
+        while True:
+            image_jobs.requeue_stale(options["max_attempts"])
+            jobs = image_jobs.claim(workers * 2)
+            if jobs:
+                if not self.run(executor, jobs, options["max_attempts"]):
+                    return False
+            elif options["once"]:
+                return True
+            else:
+                time.sleep(options["poll_interval"])
+
+    def run(self, executor, jobs, max_attempts):
+        futures = [executor.submit(process, job.image.image.name) for job in jobs]
+        usable = True
+        for job, future in zip(jobs, futures):
+            try:
+                result, error = future.result()
+                if error is None:
+                    image_jobs.complete(job, result)
+                    self.stdout.write(f"Фото {job.image_id}: готово")
+                    continue
+            except BrokenProcessPool:
+                usable = False
+                error = traceback.format_exc()
+            except Exception:
+                error = traceback.format_exc()
+            summary = error.strip().splitlines()[-1]
+            if image_jobs.fail(job, error, max_attempts):
+                self.stderr.write(f"Фото {job.image_id}: {summary}")
+            else:
+                self.stdout.write(
+                    f"Фото {job.image_id}: {summary}, повтор (попытка {job.attempts})"
+                )
+        return usable
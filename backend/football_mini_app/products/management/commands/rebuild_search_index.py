@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from products import search
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = "Перестроить полнотекстовый индекс каталога"
+
+    def handle(self, *args, **options):
+        if not search.fts_available():
+            self.stdout.write(
+                self.style.WARNING(
+                    "Полнотекстовый индекс недоступен для этой базы данных"
+                )
+            )
+            return
+
+        count = search.rebuild_index(Product.objects.all())
+        self.stdout.write(self.style.SUCCESS(f"Проиндексировано {count} товаров"))
@@ -0,0 +1,126 @@
+import csv
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from products.catalog import products_changed
+from products.management.commands.import_channel import SCRIPTS_DIR
+from products.models import Product
+
+# Колонка «Статус» выгрузки скрапера (scripts/tg_channel_availability_to_csv.py)
+STATUS_AVAILABLE = "в наличии"
+STATUS_GONE = {"продано": "продано", "удален": "пост удален"}
+# Значений в одном IN (...): с запасом ниже лимита параметров SQLite
+CHUNK_SIZE = 500
+
+
+def chunked(values, size=CHUNK_SIZE):
+    iterator = iter(sorted(values))
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = (
+        "Сверить наличие товаров с каналом: снять с продажи проданные и "
+        "удаленные посты, вернуть снятые сверкой, если пост снова доступен "
+        "(и остаток ненулевой)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "csv",
+            nargs="?",
+            default=str(SCRIPTS_DIR / "football_jerseys.csv"),
+            help="CSV скрапера (по умолчанию scripts/football_jerseys.csv)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать, какие товары изменятся",
+        )
+
+    def handle(self, *args, **options):
+        gone, available = self.read_channel(Path(options["csv"]))
+        dry_run = options["dry_run"]
+
+        to_hide = self.collect(
+            Product.objects.filter(is_available=True), gone, "снять с продажи"
+        )
+        # Возвращаются только товары, снятые самой сверкой: скрытые вручную в
+        # админке и выключенные из-за нулевого остатка остаются выключенными
+        to_show = self.collect(
+            Product.objects.filter(
+                is_available=False, hidden_by_channel=True, stock_quantity__gt=0
+            ),
+            dict.fromkeys(available, "снова в наличии"),
+            "вернуть в продажу",
+        )
+
+        if not dry_run and (to_hide or to_show):
+            now = timezone.now()
+            with transaction.atomic():
+                for ids in chunked(to_hide):
+                    Product.objects.filter(pk__in=ids, is_available=True).update(
+                        is_available=False, hidden_by_channel=True, updated_at=now
+                    )
+                for ids in chunked(to_show):
+                    Product.objects.filter(pk__in=ids, is_available=False).update(
+                        is_available=True, hidden_by_channel=False, updated_at=now
+                    )
+            # Обновление в обход save(): кэши товаров сбрасываются вручную
+            products_changed(to_hide | to_show)
+
+        prefix = "Будет снято" if dry_run else "Снято"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{prefix} с продажи: {len(to_hide)}, "
+                f"возвращено в продажу: {len(to_show)}"
+                + (" (пробный прогон, изменений нет)" if dry_run else "")
+            )
+        )
+
+    def read_channel(self, path):
+        """
+        Внешние id товаров из выгрузки: {id: причина} снятых с продажи и
+        множество доступных. Файл читается построчно.
+        """
+        if not path.exists():
+            raise CommandError(f"Нет файла {path}")
+        gone, available = {}, set()
+        with open(path, encoding="utf-8-sig", newline="") as file:
+            reader = csv.DictReader(file)
+            if "Статус" not in (reader.fieldnames or []):
+                raise CommandError(
+                    "В выгрузке нет колонки «Статус»: обновите ее скрапером"
+                )
+            for row in reader:
+                external_id = (row.get("UUID") or "").strip()
+                status = (row.get("Статус") or "").strip()
+                if not external_id:
+                    continue
+                if status in STATUS_GONE:
+                    gone.setdefault(external_id, STATUS_GONE[status])
+                elif status == STATUS_AVAILABLE:
+                    available.add(external_id)
+        # Тот же товар в другом посте еще продается: не снимаем
+        for external_id in available:
+            gone.pop(external_id, None)
+        return gone, available
+
+    def collect(self, queryset, reasons, action):
+        """id товаров к изменению (reasons — {внешний id: причина}) и отчет по ним"""
+        ids = set()
+        for chunk in chunked(reasons):
+            rows = queryset.filter(external_id__in=chunk).values_list(
+                "id", "team", "season", "external_id"
+            )
+            for product_id, team, season, external_id in rows:
+                ids.add(product_id)
+                self.stdout.write(
+                    f"{action}: {product_id} {team} ({season}) — {reasons[external_id]}"
+                )
+        return ids
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from products import snapshots
+from products.models import Product
+from products.serializers import ProductSerializer
+
+
+class Command(BaseCommand):
+    help = "Прогреть кэш готового JSON товаров"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=200,
+            help="Количество товаров, сериализуемых за один проход",
+        )
+        parser.add_argument(
+            "--reset-stats",
+            action="store_true",
+            help="Сбросить счетчики попаданий и промахов после прогрева",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        products = Product.objects.prefetch_related("images_set").order_by("id")
+
+        warmed = 0
+        batch = []
+        for product in products.iterator(chunk_size=batch_size):
+            batch.append(product)
+            if len(batch) >= batch_size:
+                ProductSerializer(batch, many=True, context={}).data
+                warmed += len(batch)
+                batch = []
+        if batch:
+            ProductSerializer(batch, many=True, context={}).data
+            warmed += len(batch)
+
+        if options["reset_stats"]:
+            snapshots.reset_stats()
+
+        stats = snapshots.get_stats()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Прогрето {warmed} товаров "
+                f"(попаданий: {stats['hits']}, промахов: {stats['misses']})"
+            )
+        )
@@ -0,0 +1,95 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:49
+
+from django.db import migrations, models
+
+from products.models import normalize_filter_value
+
+NORMALIZED_FIELDS = ["kit_type", "brand", "league", "season", "condition", "size"]
+
+
+def fill_normalized_columns(apps, schema_editor):
+    Product = apps.get_model("products", "Product")
+    products = list(Product.objects.all())
+    for product in products:
+        for field in NORMALIZED_FIELDS:
+            setattr(
+                product,
+                f"{field}_norm",
+                normalize_filter_value(getattr(product, field)),
+            )
+    Product.objects.bulk_update(
+        products, [f"{field}_norm" for field in NORMALIZED_FIELDS], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0009_catalog_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="brand_norm",
+            field=models.CharField(default="", editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="condition_norm",
+            field=models.CharField(default="", editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="kit_type_norm",
+            field=models.CharField(default="", editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="league_norm",
+            field=models.CharField(default="", editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="season_norm",
+            field=models.CharField(default="", editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="size_norm",
+            field=models.CharField(default="", editable=False, max_length=50),
+        ),
+        migrations.RunPython(fill_normalized_columns, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["is_available", "price"], name="product_available_price_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["brand_norm", "price"], name="product_brand_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["league_norm", "price"], name="product_league_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["season_norm", "price"], name="product_season_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["kit_type_norm"], name="product_kit_type_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["size_norm"], name="product_size_idx"),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:54
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0010_normalized_filter_columns"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IdempotencyKey",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=255, verbose_name="Ключ")),
+                (
+                    "scope",
+                    models.CharField(
+                        max_length=255, verbose_name="Метод и путь запроса"
+                    ),
+                ),
+                (
+                    "request_hash",
+                    models.CharField(max_length=64, verbose_name="Хэш тела запроса"),
+                ),
+                (
+                    "status_code",
+                    models.PositiveSmallIntegerField(
+                        blank=True, null=True, verbose_name="Код ответа"
+                    ),
+                ),
+                (
+                    "content",
+                    models.BinaryField(default=b"", verbose_name="Тело ответа"),
+                ),
+                (
+                    "content_type",
+                    models.CharField(
+                        blank=True,
+                        default="",
+                        max_length=100,
+                        verbose_name="Тип содержимого",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="Дата создания"
+                    ),
+                ),
+                (
+                    "expires_at",
+                    models.DateTimeField(db_index=True, verbose_name="Действует до"),
+                ),
+            ],
+            options={
+                "verbose_name": "Ключ идемпотентности",
+                "verbose_name_plural": "Ключи идемпотентности",
+                "unique_together": {("key", "scope")},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0012_cart_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="image",
+            name="variants",
+            field=models.JSONField(blank=True, default=list, verbose_name="Копии"),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:18
+
+import products.models
+import products.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0014_image_jobs"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="image",
+            name="checksum",
+            field=models.CharField(
+                blank=True, db_index=True, max_length=64, verbose_name="Хэш файла"
+            ),
+        ),
+        migrations.AddField(
+            model_name="image",
+            name="phash",
+            field=models.CharField(
+                blank=True, max_length=16, verbose_name="Перцептивный хэш"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="image",
+            name="image",
+            field=models.ImageField(
+                max_length=255,
+                storage=products.storage.get_storage,
+                upload_to=products.models.image_upload_to,
+                verbose_name="Картинка",
+            ),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0015_image_content_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="image",
+            name="dominant_color",
+            field=models.CharField(
+                blank=True, max_length=7, verbose_name="Основной цвет"
+            ),
+        ),
+        migrations.AddField(
+            model_name="image",
+            name="height",
+            field=models.PositiveIntegerField(
+                blank=True, null=True, verbose_name="Высота"
+            ),
+        ),
+        migrations.AddField(
+            model_name="image",
+            name="placeholder",
+            field=models.TextField(blank=True, verbose_name="Заглушка (data URI)"),
+        ),
+        migrations.AddField(
+            model_name="image",
+            name="width",
+            field=models.PositiveIntegerField(
+                blank=True, null=True, verbose_name="Ширина"
+            ),
+        ),
+    ]
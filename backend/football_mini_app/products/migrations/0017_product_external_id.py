@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0016_image_placeholders"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="external_id",
+            field=models.CharField(
+                blank=True,
+                max_length=64,
+                null=True,
+                unique=True,
+                verbose_name="Внешний id",
+            ),
+        ),
+    ]
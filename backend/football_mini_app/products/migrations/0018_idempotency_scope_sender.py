@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0017_product_external_id"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="idempotencykey",
+            name="scope",
+            field=models.CharField(
+                max_length=255, verbose_name="Метод, путь и отправитель запроса"
+            ),
+        ),
+    ]
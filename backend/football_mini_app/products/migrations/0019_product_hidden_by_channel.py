@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0018_idempotency_scope_sender"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="hidden_by_channel",
+            field=models.BooleanField(
+                default=False, editable=False, verbose_name="Снят по данным канала"
+            ),
+        ),
+    ]
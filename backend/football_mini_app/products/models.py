@@ -1,9 +1,30 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
+from django.utils import timezone
+
+from . import storage
 
 # Create your models here.
 
 
+def image_upload_to(instance, filename):
+    """Имя файла по хэшу содержимого (см. storage.py)"""
+    return storage.content_name(instance.checksum, filename)
+
+
+def normalize_filter_value(value):
+    """Значение фильтра для точного сравнения: без лишних пробелов и регистра"""
+    return " ".join(str(value).split()).casefold() if value else ""
+
+
+class ProductRelatedQuerySet(models.QuerySet):
+    """QuerySet для моделей, ссылающихся на товар (корзина, избранное, заказы)"""
+
+    def with_product(self):
+        # Товар и его изображения загружаются фиксированным числом запросов
+        return self.select_related("product").prefetch_related("product__images_set")
+
+
 class Product(models.Model):
     team = models.CharField(max_length=255, verbose_name="Команда")
     national_team = models.CharField(
@@ -25,39 +46,190 @@ class Product(models.Model):
         max_length=255, blank=True, null=True, verbose_name="Хештеги"
     )
     post_url = models.URLField(blank=True, null=True, verbose_name="Ссылка на пост")
+    # Стабильный id товара в канале (UUID скрапера), ключ импорта import_channel
+    external_id = models.CharField(
+        max_length=64, unique=True, null=True, blank=True, verbose_name="Внешний id"
+    )
     is_available = models.BooleanField(
         default=True, verbose_name="Доступен для покупки"
     )
+    # Снят с продажи сверкой с каналом (reconcile_availability): сверка
+    # возвращает в продажу только такие товары, ручное скрытие не трогает
+    hidden_by_channel = models.BooleanField(
+        default=False, editable=False, verbose_name="Снят по данным канала"
+    )
     stock_quantity = models.IntegerField(default=1, verbose_name="Количество на складе")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
 
+    # Нормализованные копии полей фильтров для индексированного сравнения
+    kit_type_norm = models.CharField(max_length=100, default="", editable=False)
+    brand_norm = models.CharField(max_length=100, default="", editable=False)
+    league_norm = models.CharField(max_length=255, default="", editable=False)
+    season_norm = models.CharField(max_length=50, default="", editable=False)
+    condition_norm = models.CharField(max_length=50, default="", editable=False)
+    size_norm = models.CharField(max_length=50, default="", editable=False)
+
+    NORMALIZED_FIELDS = ["kit_type", "brand", "league", "season", "condition", "size"]
+
     def __str__(self):
         return f"{self.team} ({self.season})"
 
+    def normalize_fields(self):
+        """Заполнить *_norm поля (вызывается и для bulk-операций)"""
+        for field in self.NORMALIZED_FIELDS:
+            setattr(self, f"{field}_norm", normalize_filter_value(getattr(self, field)))
+
+    def save(self, *args, **kwargs):
+        self.normalize_fields()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = set(update_fields) | {
+                f"{field}_norm"
+                for field in self.NORMALIZED_FIELDS
+                if field in update_fields
+            }
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "Товар"
         verbose_name_plural = "Товары"
+        indexes = [
+            # Keyset пагинация каталога
+            models.Index(fields=["created_at", "id"], name="product_created_id_idx"),
+            models.Index(fields=["price", "id"], name="product_price_id_idx"),
+            # Фильтры каталога
+            models.Index(
+                fields=["is_available", "price"], name="product_available_price_idx"
+            ),
+            models.Index(fields=["brand_norm", "price"], name="product_brand_idx"),
+            models.Index(fields=["league_norm", "price"], name="product_league_idx"),
+            models.Index(fields=["season_norm", "price"], name="product_season_idx"),
+            models.Index(fields=["kit_type_norm"], name="product_kit_type_idx"),
+            models.Index(fields=["size_norm"], name="product_size_idx"),
+        ]
+
+
+# Итог обработки файла: у повторной загрузки тех же байтов копируется целиком
+PROCESSED_FIELDS = (
+    "variants",
+    "phash",
+    "width",
+    "height",
+    "dominant_color",
+    "placeholder",
+)
 
 
 class Image(models.Model):
+    STATUS_CHOICES = [
+        ("pending", "Обрабатывается"),
+        ("ready", "Готово"),
+        ("failed", "Ошибка обработки"),
+    ]
+
     product = models.ForeignKey(
         Product,
         on_delete=models.CASCADE,
         related_name="images_set",
         verbose_name="Продукт",
     )
-    image = models.ImageField(upload_to="products/", verbose_name="Картинка")
+    image = models.ImageField(
+        upload_to=image_upload_to,
+        storage=storage.get_storage,
+        max_length=255,
+        verbose_name="Картинка",
+    )
+    # sha256 загруженных байтов: повторная загрузка того же файла находится по нему
+    checksum = models.CharField(
+        max_length=64, blank=True, db_index=True, verbose_name="Хэш файла"
+    )
+    # Перцептивный хэш (imaging.perceptual_hash) для поиска почти одинаковых фото
+    phash = models.CharField(max_length=16, blank=True, verbose_name="Перцептивный хэш")
+    # Уменьшенные копии: [{"format", "width", "height", "name"}], см. imaging.py
+    variants = models.JSONField(default=list, blank=True, verbose_name="Копии")
+    # Размеры (после поворота по EXIF), основной цвет и крошечная заглушка:
+    # сетка каталога размечается и закрашивается до загрузки фото
+    width = models.PositiveIntegerField(null=True, blank=True, verbose_name="Ширина")
+    height = models.PositiveIntegerField(null=True, blank=True, verbose_name="Высота")
+    dominant_color = models.CharField(
+        max_length=7, blank=True, verbose_name="Основной цвет"
+    )
+    placeholder = models.TextField(blank=True, verbose_name="Заглушка (data URI)")
+    # Загруженный файл обрабатывается в фоне (см. image_jobs.py)
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default="ready",
+        verbose_name="Статус обработки",
+    )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
 
     def __str__(self):
         return f"Image for {self.product.team} ({self.product.season})"
 
+    def save(self, *args, **kwargs):
+        # Новый загруженный файл (а не присвоенное имя) ставится в очередь обработки
+        uploaded = bool(self.image) and not self.image._committed
+        if not uploaded:
+            return super().save(*args, **kwargs)
+        self.checksum = storage.checksum(self.image.file)
+        processed = (
+            Image.objects.filter(checksum=self.checksum, status="ready")
+            .exclude(pk=self.pk)
+            .first()
+        )
+        if processed is not None:
+            # Те же байты уже обработаны: ссылаемся на готовые файлы без очереди
+            self.image = processed.image.name
+            for field in PROCESSED_FIELDS:
+                setattr(self, field, getattr(processed, field))
+            self.status = "ready"
+            return super().save(*args, **kwargs)
+        self.status = "pending"
+        self.variants = []
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            ImageJob.objects.create(image=self)
+
     class Meta:
         verbose_name = "Изображение"
         verbose_name_plural = "Изображения"
 
 
+class ImageJob(models.Model):
+    """Задача фоновой обработки загруженного фото (очередь в БД)"""
+
+    STATUS_CHOICES = [
+        ("pending", "В очереди"),
+        ("processing", "Выполняется"),
+        ("failed", "Ошибка"),
+    ]
+
+    image = models.ForeignKey(
+        Image, on_delete=models.CASCADE, related_name="jobs", verbose_name="Фото"
+    )
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default="pending", verbose_name="Статус"
+    )
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Попыток")
+    error = models.TextField(blank=True, default="", verbose_name="Последняя ошибка")
+    # Повтор после ошибки откладывается до этого времени
+    available_at = models.DateTimeField(default=timezone.now, verbose_name="Доступна с")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Начата")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+
+    def __str__(self):
+        return f"Обработка фото {self.image_id} ({self.status})"
+
+    class Meta:
+        verbose_name = "Обработка фото"
+        verbose_name_plural = "Обработка фото"
+        indexes = [
+            models.Index(fields=["status", "available_at"], name="image_job_queue_idx"),
+        ]
+
+
 class CartItem(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -76,6 +248,8 @@ class CartItem(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата добавления")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
 
+    objects = ProductRelatedQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.quantity}x {self.product.team} ({self.selected_size})"
 
@@ -100,6 +274,8 @@ class Favorite(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата добавления")
 
+    objects = ProductRelatedQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.product.team} в избранном у {self.user}"
 
@@ -107,3 +283,68 @@ class Favorite(models.Model):
         verbose_name = "Избранный товар"
         verbose_name_plural = "Избранные товары"
         unique_together = ("user", "product")
+
+
+class CartVersion(models.Model):
+    """Версия корзины пользователя: увеличивается при каждом ее изменении"""
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="cart_version",
+        verbose_name="Пользователь",
+    )
+    version = models.BigIntegerField(default=0, verbose_name="Версия")
+
+    def __str__(self):
+        return f"Корзина {self.user} v{self.version}"
+
+    class Meta:
+        verbose_name = "Версия корзины"
+        verbose_name_plural = "Версии корзин"
+
+
+class CatalogVersion(models.Model):
+    """Версия каталога: увеличивается при каждом изменении товаров"""
+
+    version = models.BigIntegerField(default=0, verbose_name="Версия")
+    updated_at = models.DateTimeField(
+        default=timezone.now, verbose_name="Дата изменения"
+    )
+
+    def __str__(self):
+        return f"Каталог v{self.version}"
+
+    class Meta:
+        verbose_name = "Версия каталога"
+        verbose_name_plural = "Версии каталога"
+
+
+class IdempotencyKey(models.Model):
+    """Первый ответ на POST с заголовком Idempotency-Key (для повторов клиента)"""
+
+    key = models.CharField(max_length=255, verbose_name="Ключ")
+    scope = models.CharField(
+        max_length=255, verbose_name="Метод, путь и отправитель запроса"
+    )
+    request_hash = models.CharField(max_length=64, verbose_name="Хэш тела запроса")
+    # Пока ответа нет, запрос с этим ключом еще выполняется
+    status_code = models.PositiveSmallIntegerField(
+        null=True, blank=True, verbose_name="Код ответа"
+    )
+    content = models.BinaryField(default=b"", verbose_name="Тело ответа")
+    content_type = models.CharField(
+        max_length=100, blank=True, default="", verbose_name="Тип содержимого"
+    )
+    created_at = models.DateTimeField(
+        default=timezone.now, verbose_name="Дата создания"
+    )
+    expires_at = models.DateTimeField(db_index=True, verbose_name="Действует до")
+
+    def __str__(self):
+        return f"{self.scope} {self.key}"
+
+    class Meta:
+        verbose_name = "Ключ идемпотентности"
+        verbose_name_plural = "Ключи идемпотентности"
+        unique_together = ("key", "scope")
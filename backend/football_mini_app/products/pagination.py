@@ -0,0 +1,149 @@
+import base64
+import binascii
+import json
+import math
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class ProductKeysetPagination(BasePagination):
+    """
+    Keyset (cursor) пагинация каталога.
+
+    Страница выбирается условием по паре (поле сортировки, id), поэтому
+    стоимость запроса не зависит от глубины прокрутки. Пагинация включается,
+    только если клиент передал `cursor` или `page_size` — без них список
+    отдается целиком, как раньше. Результаты поиска без явного `ordering`
+    листаются в порядке релевантности, по паре (ранг, id).
+    """
+
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    ordering_query_param = "ordering"
+    page_size = 20
+    max_page_size = 100
+    default_ordering = "-created_at"
+    # Допустимые поля сортировки и функции разбора значения из курсора
+    ordering_fields = {
+        "created_at": parse_datetime,
+        "price": Decimal,
+    }
+    # Аннотация ранга, которую добавляет поиск (products/search.py)
+    rank_field = "search_rank"
+    invalid_cursor_message = "Неверный курсор"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if (
+            self.cursor_query_param not in params
+            and self.page_size_query_param not in params
+        ):
+            return None
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering, id_ordering = self.get_ordering(request, queryset)
+        field = self.ordering.lstrip("-")
+
+        queryset = queryset.order_by(self.ordering, id_ordering)
+
+        encoded = params.get(self.cursor_query_param)
+        if encoded:
+            value, last_id = self.decode_cursor(encoded, field)
+            lookup = "lt" if self.ordering.startswith("-") else "gt"
+            id_lookup = "lt" if id_ordering.startswith("-") else "gt"
+            queryset = queryset.filter(
+                Q(**{f"{field}__{lookup}": value})
+                | Q(**{field: value, f"id__{id_lookup}": last_id})
+            )
+
+        results = list(queryset[: self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[: self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, request, queryset):
+        """Сортировка страницы: (поле, направление id при равенстве поля)"""
+        ordering = request.query_params.get(self.ordering_query_param, "")
+        if ordering.lstrip("-") not in self.ordering_fields:
+            if self.rank_field in queryset.query.annotations:
+                # Порядок релевантности задает бэкенд поиска
+                rank, *rest = queryset.query.order_by
+                return rank, rest[0] if rest else "-id"
+            ordering = self.default_ordering
+        return ordering, "-id" if ordering.startswith("-") else "id"
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        field = self.ordering.lstrip("-")
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.page_size_query_param, self.page_size)
+        return replace_query_param(
+            url,
+            self.cursor_query_param,
+            self.encode_cursor(getattr(last, field), last.pk),
+        )
+
+    def get_previous_link(self):
+        # Keyset пагинация ведется только вперед (бесконечная лента)
+        return None
+
+    def encode_cursor(self, value, last_id):
+        if hasattr(value, "isoformat"):
+            value = value.isoformat()
+        payload = json.dumps(
+            {"o": self.ordering, "v": str(value), "id": last_id},
+            separators=(",", ":"),
+        )
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, encoded, field):
+        try:
+            padded = encoded + "=" * (-len(encoded) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if payload["o"] != self.ordering:
+                raise ValueError("ordering mismatch")
+            parse = float if field == self.rank_field else self.ordering_fields[field]
+            value = parse(payload["v"])
+            last_id = int(payload["id"])
+        except (
+            binascii.Error,
+            InvalidOperation,
+            KeyError,
+            TypeError,
+            ValueError,
+        ):
+            raise ValidationError({"cursor": self.invalid_cursor_message})
+        if value is None or (isinstance(value, float) and not math.isfinite(value)):
+            raise ValidationError({"cursor": self.invalid_cursor_message})
+        return value, last_id
@@ -0,0 +1,221 @@
+"""
+Полнотекстовый поиск по каталогу.
+
+На SQLite используется виртуальная таблица FTS5, которая синхронизируется
+сигналами `Product` (см. products/signals.py), на PostgreSQL — tsvector с
+русской конфигурацией. Для остальных бэкендов остается поиск через icontains.
+"""
+
+import re
+
+from django.db import DatabaseError, connection
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = "products_product_fts"
+
+# Поля товара, попадающие в индекс, по колонкам с разным весом
+SEARCH_COLUMNS = {
+    "team": ["team", "national_team"],
+    "attrs": ["brand", "league", "season", "kit_type"],
+    "body": ["features", "hashtags"],
+}
+# Веса колонок для bm25 (в порядке SEARCH_COLUMNS)
+COLUMN_WEIGHTS = (10.0, 5.0, 1.0)
+
+# Окончания для упрощенного стемминга русских слов (длинные проверяются первыми)
+RUSSIAN_ENDINGS = sorted(
+    (
+        "ами ями ого его ому ему ыми ими ешь ете ует уют ость ости ение ения ений "
+        "ая яя ое ее ые ие ый ий ой ей ую юю ым им ом ем ах ях ов ев ия ья ье ью "
+        "а я о е ы и у ю ь й"
+    ).split(),
+    key=len,
+    reverse=True,
+)
+MIN_STEM_LENGTH = 3
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+CYRILLIC_RE = re.compile(r"[а-я]")
+
+_fts_available = None
+
+
+def stem(word):
+    """Отрезает типичное русское окончание, латиницу и числа оставляет как есть"""
+    word = word.lower().replace("ё", "е")
+    if not CYRILLIC_RE.search(word):
+        return word
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            return word[: -len(ending)]
+    return word
+
+
+def tokenize(text):
+    return [stem(word) for word in WORD_RE.findall(text or "")]
+
+
+def product_document(product):
+    """Текст товара для индекса: по одной строке основ на колонку"""
+    return {
+        column: " ".join(
+            token
+            for field in fields
+            for token in tokenize(getattr(product, field, None))
+        )
+        for column, fields in SEARCH_COLUMNS.items()
+    }
+
+
+def fts_available():
+    global _fts_available
+    if connection.vendor != "sqlite":
+        return False
+    if _fts_available is None:
+        _fts_available = FTS_TABLE in connection.introspection.table_names()
+    return _fts_available
+
+
+def create_index(schema_editor):
+    """Создает таблицу FTS5; возвращает False, если SQLite собран без FTS5"""
+    global _fts_available
+    columns = ", ".join(SEARCH_COLUMNS)
+    try:
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            f"{columns}, tokenize='unicode61 remove_diacritics 2')"
+        )
+    except DatabaseError:
+        _fts_available = False
+        return False
+    _fts_available = True
+    return True
+
+
+def drop_index(schema_editor):
+    global _fts_available
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    _fts_available = False
+
+
+def index_products(products):
+    if not fts_available():
+        return
+    rows = []
+    for product in products:
+        document = product_document(product)
+        rows.append([product.pk] + [document[column] for column in SEARCH_COLUMNS])
+    if not rows:
+        return
+    columns = ", ".join(SEARCH_COLUMNS)
+    placeholders = ", ".join(["%s"] * (len(SEARCH_COLUMNS) + 1))
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [[row[0]] for row in rows]
+        )
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, {columns}) VALUES ({placeholders})",
+            rows,
+        )
+
+
+def remove_products(product_ids):
+    if not fts_available() or not product_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid = %s",
+            [[product_id] for product_id in product_ids],
+        )
+
+
+def rebuild_index(queryset):
+    """Полностью перестраивает индекс (после bulk-операций в обход сигналов)"""
+    if not fts_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+    count = 0
+    batch = []
+    for product in queryset.iterator(chunk_size=500):
+        batch.append(product)
+        if len(batch) >= 500:
+            index_products(batch)
+            count += len(batch)
+            batch = []
+    index_products(batch)
+    return count + len(batch)
+
+
+def build_match_query(query):
+    """Запрос FTS5: каждая основа ищется по префиксу, все слова обязательны"""
+    tokens = [token for token in tokenize(query) if token]
+    return " AND ".join(f'"{token}"*' for token in tokens)
+
+
+def search(queryset, query):
+    """Фильтрует queryset по поисковой строке и сортирует по релевантности"""
+    if fts_available():
+        match = build_match_query(query)
+        if not match:
+            return queryset
+        table = queryset.model._meta.db_table
+        weights = ", ".join(str(weight) for weight in COLUMN_WEIGHTS)
+        # Таблица индекса присоединяется один раз: bm25 считается для строки
+        # совпадения, а не отдельным подзапросом на каждый товар
+        return (
+            queryset.extra(
+                tables=[FTS_TABLE],
+                where=[f"{FTS_TABLE}.rowid = {table}.id", f"{FTS_TABLE} MATCH %s"],
+                params=[match],
+            )
+            .annotate(
+                search_rank=RawSQL(
+                    f"bm25({FTS_TABLE}, {weights})", [], output_field=FloatField()
+                )
+            )
+            .order_by("search_rank", "-id")
+        )
+
+    if connection.vendor == "postgresql":
+        return _search_postgres(queryset, query)
+
+    return _search_icontains(queryset, query)
+
+
+def _search_postgres(queryset, query):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+    from django.db.models.functions import Cast
+
+    words = [word.lower() for word in WORD_RE.findall(query)]
+    if not words:
+        return queryset
+    weights = ["A", "B", "C"]
+    vector = None
+    for weight, fields in zip(weights, SEARCH_COLUMNS.values()):
+        for field in fields:
+            part = SearchVector(field, weight=weight, config="russian")
+            vector = part if vector is None else vector + part
+    search_query = SearchQuery(
+        " & ".join(f"{word}:*" for word in words),
+        search_type="raw",
+        config="russian",
+    )
+    return (
+        queryset.annotate(
+            search_vector=vector,
+            # double precision: ранг из курсора страницы сравнивается точно
+            search_rank=Cast(SearchRank(vector, search_query), FloatField()),
+        )
+        .filter(search_vector=search_query)
+        .order_by("-search_rank", "-id")
+    )
+
+
+def _search_icontains(queryset, query):
+    condition = Q()
+    for fields in SEARCH_COLUMNS.values():
+        for field in fields:
+            condition |= Q(**{f"{field}__icontains": query})
+    return queryset.filter(condition)
@@ -1,27 +1,75 @@
+from django.db import models
 from rest_framework import serializers
 from .models import Product, Image, CartItem, Favorite
+from . import fieldsets, imaging, snapshots
 
 
 class ImageSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
+    # Уменьшенные копии для <picture>: {"webp": "url 200w, url 400w", ...}
+    srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Image
-        fields = ["id", "image", "image_url", "created_at"]
+        fields = [
+            "id",
+            "image",
+            "image_url",
+            "srcset",
+            "width",
+            "height",
+            "dominant_color",
+            "placeholder",
+            "status",
+            "created_at",
+        ]
 
     def get_image_url(self, obj):
         if obj.image:
-            request = self.context.get("request")
-            if request:
-                return request.build_absolute_uri(obj.image.url)
-            return obj.image.url
+            return self.absolute_url(obj.image.url)
         return None
 
+    def get_srcset(self, obj):
+        storage = obj.image.storage
+        return imaging.build_srcset(
+            obj.variants, lambda name: self.absolute_url(storage.url(name))
+        )
+
+    def absolute_url(self, url):
+        request = self.context.get("request")
+        if request:
+            return request.build_absolute_uri(url)
+        return url
+
 
 class ImageUploadSerializer(serializers.ModelSerializer):
     class Meta:
         model = Image
-        fields = ["product", "image"]
+        # id и status — чтобы клиент мог дождаться фоновой обработки
+        fields = ["id", "product", "image", "status"]
+        read_only_fields = ["status"]
+
+
+class ProductListSerializer(serializers.ListSerializer):
+    """Список товаров: готовые представления берутся из кэша одним запросом"""
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        products = list(iterable)
+        cached = snapshots.get_many(products)
+        missing = [product for product in products if product.pk not in cached]
+        rendered = [(product, self.child.render(product)) for product in missing]
+        snapshots.set_many(rendered)
+        cached.update((product.pk, data) for product, data in rendered)
+
+        request = self.context.get("request")
+        fieldset = fieldsets.from_request(request, self.child.Meta.fields)
+        return [
+            snapshots.absolutize(
+                fieldsets.project(cached[product.pk], fieldset), request
+            )
+            for product in products
+        ]
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -30,7 +78,6 @@ class ProductSerializer(serializers.ModelSerializer):
     # Добавляем поля для совместимости с фронтендом
     name = serializers.SerializerMethodField()
     manufacturer = serializers.CharField(source="brand")
-    league = serializers.CharField(source="league")
     type = serializers.CharField(source="kit_type")
     description = serializers.CharField(source="features")
     withPlayer = serializers.SerializerMethodField()
@@ -67,9 +114,28 @@ class ProductSerializer(serializers.ModelSerializer):
             "images_count",
             "badges",
         ]
+        list_serializer_class = ProductListSerializer
+
+    def to_representation(self, instance):
+        data = snapshots.get_many([instance]).get(instance.pk)
+        if data is None:
+            data = self.render(instance)
+            snapshots.set_many([(instance, data)])
+        request = self.context.get("request")
+        fieldset = fieldsets.from_request(request, self.Meta.fields)
+        return snapshots.absolutize(fieldsets.project(data, fieldset), request)
+
+    def render(self, instance):
+        """Представление товара без привязки к запросу (ссылки относительные)"""
+        # Сериализатор без контекста создается один раз: сборка полей дорогая
+        serializer = self.__dict__.get("_renderer")
+        if serializer is None:
+            serializer = self._renderer = ProductSerializer(context={})
+        return dict(super(ProductSerializer, serializer).to_representation(instance))
 
     def get_images_count(self, obj):
-        return obj.images_set.count()
+        # Используем prefetch_related("images_set"), а не отдельный COUNT
+        return len(obj.images_set.all())
 
     def get_name(self, obj):
         return f"{obj.team} ({obj.season})"
@@ -131,7 +197,8 @@ class CartItemSerializer(serializers.ModelSerializer):
 
 
 class CartItemCreateSerializer(serializers.ModelSerializer):
-    telegram_id = serializers.IntegerField(write_only=True)
+    # С initData пользователь берется из request.user, и telegram_id не нужен
+    telegram_id = serializers.IntegerField(write_only=True, required=False)
 
     class Meta:
         model = CartItem
@@ -145,3 +212,11 @@ class FavoriteSerializer(serializers.ModelSerializer):
     class Meta:
         model = Favorite
         fields = ["id", "product", "created_at", "telegram_id"]
+
+
+class FavoriteCreateSerializer(serializers.ModelSerializer):
+    telegram_id = serializers.IntegerField(write_only=True, required=False)
+
+    class Meta:
+        model = Favorite
+        fields = ["id", "product", "created_at", "telegram_id"]
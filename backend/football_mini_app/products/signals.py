@@ -0,0 +1,33 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import favorites, image_jobs, search, snapshots
+from .catalog import bump_catalog_version
+from .models import Favorite, Image, Product
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    search.index_products([instance])
+    snapshots.invalidate([instance.pk])
+    bump_catalog_version()
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    search.remove_products([instance.pk])
+    snapshots.invalidate([instance.pk])
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=Image)
+def image_changed(sender, instance, **kwargs):
+    # Новая дата изменения товара делает устаревшими его снимки во всех процессах
+    image_jobs.touch_products([instance.product_id])
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def favorite_changed(sender, instance, **kwargs):
+    favorites.invalidate(instance.user_id)
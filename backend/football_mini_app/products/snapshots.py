@@ -0,0 +1,126 @@
+"""
+Кэш готового JSON товаров.
+
+Каждый товар сериализуется один раз и хранится в кэше Django по id вместе
+с меткой `updated_at`. Ссылки на изображения хранятся относительными и
+превращаются в абсолютные при отдаче, поэтому запись не зависит от домена
+запроса. Записи удаляются сигналами при изменении товара или его фото.
+"""
+
+from django.core.cache import cache
+
+SNAPSHOT_TIMEOUT = 24 * 60 * 60
+HITS_KEY = "product-json:hits"
+MISSES_KEY = "product-json:misses"
+# Поля изображения, содержащие ссылки на файлы
+IMAGE_URL_FIELDS = ("image", "image_url")
+
+
+def snapshot_key(product_id):
+    return f"product-json:{product_id}"
+
+
+def snapshot_stamp(product):
+    return product.updated_at.isoformat() if product.updated_at else ""
+
+
+def get_many(products):
+    """Закэшированные представления товаров: {id: data}, устаревшие пропускаются"""
+    keys = {snapshot_key(product.pk): product for product in products}
+    found = cache.get_many(keys)
+    snapshots = {}
+    for key, entry in found.items():
+        product = keys[key]
+        if entry.get("stamp") == snapshot_stamp(product):
+            snapshots[product.pk] = entry["data"]
+    record_lookups(hits=len(snapshots), misses=len(keys) - len(snapshots))
+    return snapshots
+
+
+def set_many(rendered):
+    """Сохранить представления: [(product, data), ...]"""
+    if not rendered:
+        return
+    cache.set_many(
+        {
+            snapshot_key(product.pk): {
+                "stamp": snapshot_stamp(product),
+                "data": data,
+            }
+            for product, data in rendered
+        },
+        SNAPSHOT_TIMEOUT,
+    )
+
+
+def invalidate(product_ids):
+    cache.delete_many([snapshot_key(product_id) for product_id in product_ids])
+
+
+def record_lookups(hits=0, misses=0):
+    for key, value in ((HITS_KEY, hits), (MISSES_KEY, misses)):
+        if not value:
+            continue
+        try:
+            cache.incr(key, value)
+        except ValueError:
+            # Счетчика еще нет (или он вытеснен из кэша)
+            cache.add(key, 0, None)
+            cache.incr(key, value)
+
+
+def get_stats():
+    counters = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits = counters.get(HITS_KEY, 0)
+    misses = counters.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / total, 4) if total else None,
+    }
+
+
+def reset_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
+
+
+def media_base(request):
+    """Схема и домен запроса для абсолютных ссылок (считается раз на запрос)"""
+    if request is None:
+        return ""
+    base = getattr(request, "_product_media_base", None)
+    if base is None:
+        base = request.build_absolute_uri("/")[:-1]
+        request._product_media_base = base
+    return base
+
+
+def absolutize(data, request):
+    """Копия представления с абсолютными ссылками на изображения"""
+    base = media_base(request)
+    if not base or not data.get("images"):
+        return data
+    data = dict(data)
+    images = []
+    for image in data["images"]:
+        image = dict(image)
+        for field in IMAGE_URL_FIELDS:
+            url = image.get(field)
+            if url and url.startswith("/"):
+                image[field] = base + url
+        if image.get("srcset"):
+            image["srcset"] = {
+                image_format: absolutize_srcset(srcset, base)
+                for image_format, srcset in image["srcset"].items()
+            }
+        images.append(image)
+    data["images"] = images
+    return data
+
+
+def absolutize_srcset(srcset, base):
+    """ "/media/a.w200.webp 200w, ..." -> с абсолютными ссылками"""
+    return ", ".join(
+        base + entry if entry.startswith("/") else entry for entry in srcset.split(", ")
+    )
@@ -0,0 +1,122 @@
+"""
+Списание и возврат остатков на складе.
+
+Остаток меняется одним условным UPDATE (`stock_quantity >= n` проверяется
+в том же запросе для каждой строки), поэтому параллельные заказы не могут
+продать больше, чем есть, и не перезаписывают остальные поля товара.
+"""
+
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .catalog import products_changed
+from .models import Product
+
+
+class InsufficientStock(ValueError):
+    """Товар снят с продажи или его не хватает на складе"""
+
+    def __init__(self, product, available=True):
+        self.product = product
+        if available:
+            message = f"Недостаточно товара '{product.team}' на складе"
+        else:
+            message = f"Товар '{product.team}' больше недоступен"
+        super().__init__(message)
+
+
+def quantity_by_product(quantities):
+    """CASE id WHEN ... THEN количество: значение для каждой строки UPDATE"""
+    return Case(
+        *[
+            When(pk=product_id, then=Value(quantity))
+            for product_id, quantity in quantities.items()
+        ],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def reserve(items):
+    """
+    Списать товары со склада одним UPDATE: items — [(product, quantity), ...].
+
+    Если хотя бы одного товара не хватает, изменения откатываются и
+    бросается InsufficientStock.
+    """
+    quantities = Counter()
+    products = {}
+    for product, quantity in items:
+        quantities[product.pk] += quantity
+        products[product.pk] = product
+    if not quantities:
+        return
+
+    quantity = quantity_by_product(quantities)
+    with transaction.atomic():
+        updated = Product.objects.filter(
+            pk__in=list(quantities),
+            is_available=True,
+            stock_quantity__gte=quantity,
+        ).update(
+            # Условие читает остаток до списания. SQLite и PostgreSQL во всех
+            # выражениях SET берут старые значения строки, а MySQL применяет
+            # присваивания слева направо — поэтому is_available стоит первым
+            is_available=Case(
+                When(stock_quantity__gt=quantity, then=Value(True)),
+                default=Value(False),
+            ),
+            stock_quantity=F("stock_quantity") - quantity,
+            updated_at=timezone.now(),
+        )
+        if updated != len(quantities):
+            raise shortage(products, quantities)
+
+    products_changed(list(quantities))
+
+
+def shortage(products, quantities):
+    """Ошибка для первого товара, который нельзя списать (только при отказе)"""
+    current = Product.objects.filter(pk__in=list(quantities)).values_list(
+        "pk", "is_available", "stock_quantity"
+    )
+    for product_id, is_available, stock_quantity in sorted(current):
+        if not is_available:
+            return InsufficientStock(products[product_id], available=False)
+        if stock_quantity < quantities[product_id]:
+            return InsufficientStock(products[product_id])
+    # Товар удален между чтением корзины и списанием
+    product_id = min(set(quantities) - {row[0] for row in current})
+    return InsufficientStock(products[product_id], available=False)
+
+
+def release(items):
+    """Вернуть товары на склад одним UPDATE: items — [(product_id, quantity), ...]"""
+    quantities = Counter()
+    for product_id, quantity in items:
+        quantities[product_id] += quantity
+    if not quantities:
+        return
+
+    quantity = quantity_by_product(quantities)
+    Product.objects.filter(pk__in=list(quantities)).update(
+        # Снова в продаже только товар, который выключило списание последнего
+        # остатка; снятый сверкой с каналом или вручную остается выключенным.
+        # is_available стоит в SET первым и читает остаток до возврата
+        is_available=Case(
+            When(hidden_by_channel=True, then=F("is_available")),
+            When(
+                stock_quantity__lte=0,
+                stock_quantity__gt=-quantity,
+                then=Value(True),
+            ),
+            default=F("is_available"),
+        ),
+        stock_quantity=F("stock_quantity") + quantity,
+        updated_at=timezone.now(),
+    )
+
+    products_changed(list(quantities))
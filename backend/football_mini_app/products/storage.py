@@ -0,0 +1,68 @@
+"""
+Хранение фото товаров по хэшу содержимого.
+
+Оригинал лежит в `products/<ab>/<sha256>.<ext>`, где `ab` — первые два
+символа хэша (чтобы в одном каталоге не копились тысячи файлов). Одинаковые
+байты всегда получают одно имя: повторная загрузка того же файла не пишет
+его второй раз, а содержимое по ссылке никогда не меняется, поэтому nginx
+отдает такие файлы с `Cache-Control: immutable`. Уменьшенные копии
+называются от хэша оригинала (см. imaging.variant_name) и тоже неизменны.
+
+Модуль не импортирует модели: им пользуются дочерние процессы обработки.
+"""
+
+import hashlib
+import re
+from pathlib import PurePosixPath
+
+from django.core.files.storage import FileSystemStorage
+
+DIRECTORY = "products"
+CHUNK_SIZE = 64 * 1024
+EXTENSION_ALIASES = {".jpeg": ".jpg"}
+CONTENT_NAME_RE = re.compile(
+    rf"^{DIRECTORY}/[0-9a-f]{{2}}/([0-9a-f]{{64}})\.[a-z0-9]+$"
+)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Файл с уже существующим именем не перезаписывается: имя — хэш байтов"""
+
+    def __init__(self, **kwargs):
+        # Без переименования в name_XXXX.jpg при совпадении имен
+        kwargs.setdefault("allow_overwrite", True)
+        super().__init__(**kwargs)
+
+    def _save(self, name, content):
+        if self.exists(name):
+            return name
+        return super()._save(name, content)
+
+
+content_storage = ContentAddressedStorage()
+
+
+def get_storage():
+    return content_storage
+
+
+def checksum(file):
+    """sha256 содержимого файла (позиция чтения возвращается в начало)"""
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def content_name(digest, filename):
+    extension = PurePosixPath(filename).suffix.lower() or ".jpg"
+    extension = EXTENSION_ALIASES.get(extension, extension)
+    return f"{DIRECTORY}/{digest[:2]}/{digest}{extension}"
+
+
+def digest_from_name(name):
+    """Хэш из имени файла или None, если файл лежит по старой схеме"""
+    match = CONTENT_NAME_RE.match(name or "")
+    return match.group(1) if match else None
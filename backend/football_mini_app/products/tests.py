@@ -1,3 +1,1480 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import gzip
+import json
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from importlib.util import find_spec
+from io import BytesIO, StringIO
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection, transaction
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image as PILImage
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from football_mini_app import middleware, renderers
+from users import identity
+from users.models import User
+from . import (
+    favorites,
+    fieldsets,
+    image_jobs,
+    imaging,
+    search,
+    snapshots,
+    stock,
+    storage,
+)
+from .management.commands.import_channel import SCRIPTS_DIR
+from .pagination import ProductKeysetPagination
+from .models import Product, Image, ImageJob, CartItem, Favorite, IdempotencyKey
+
+
+def make_product(**kwargs):
+    data = {
+        "team": "Реал Мадрид",
+        "brand": "Adidas",
+        "league": "ЛаЛига",
+        "season": "2023/24",
+        "kit_type": "Домашняя",
+        "price": 5000,
+        "size": "M",
+        "color": "Белый",
+        "contacts": "@rooneyform_admin",
+    }
+    data.update(kwargs)
+    product = Product.objects.create(**data)
+    # Файлы не нужны: сериализатору достаточно имени в хранилище
+    for index in range(2):
+        Image.objects.create(
+            product=product, image=f"products/{product.pk}_{index}.jpg"
+        )
+    return product
+
+
+# Тесты не трогают файловый кэш сервера
+TEST_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, CACHES=TEST_CACHES)
+class CatalogTestCase(TestCase):
+    """Кэши каталога и пользователей живут между тестами, поэтому очищаются"""
+
+    def setUp(self):
+        cache.clear()
+        identity.clear()
+        self.client = APIClient()
+
+
+class QueryCountTestMixin:
+    """Проверка, что число SQL-запросов эндпоинта не зависит от размера выдачи"""
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response.json()
+
+    def assertQueriesDoNotGrow(self, url, add_rows, batch=3):
+        add_rows(batch)
+        # Первый запрос заполняет кэши (пользователь и т.п.), сравниваются повторные
+        self.count_queries(url)
+        small_count, small_data = self.count_queries(url)
+        add_rows(batch * 3)
+        large_count, large_data = self.count_queries(url)
+
+        self.assertGreater(len(large_data), len(small_data))
+        self.assertEqual(
+            small_count,
+            large_count,
+            f"{url}: {small_count} запросов на {len(small_data)} строк, "
+            f"{large_count} на {len(large_data)}",
+        )
+
+
+class ProductQueryCountTests(QueryCountTestMixin, CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(telegram_id=1001)
+
+    def test_product_list(self):
+        def add_rows(count):
+            for _ in range(count):
+                make_product()
+
+        self.assertQueriesDoNotGrow("/api/products/", add_rows)
+
+    def test_cart(self):
+        def add_rows(count):
+            for _ in range(count):
+                CartItem.objects.create(
+                    user=self.user, product=make_product(), selected_size="M"
+                )
+
+        self.assertQueriesDoNotGrow(
+            "/api/cart/by_telegram_id/?telegram_id=1001", add_rows
+        )
+        self.assertQueriesDoNotGrow("/api/cart/?telegram_id=1001", add_rows)
+
+    def test_favorites(self):
+        def add_rows(count):
+            for _ in range(count):
+                Favorite.objects.create(user=self.user, product=make_product())
+
+        self.assertQueriesDoNotGrow(
+            "/api/favorites/by_telegram_id/?telegram_id=1001", add_rows
+        )
+        self.assertQueriesDoNotGrow("/api/favorites/?telegram_id=1001", add_rows)
+
+
+class ProductSearchTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.barcelona = make_product(
+            team="Барселона", brand="Nike", kit_type="Гостевая", league="ЛаЛига"
+        )
+        self.real = make_product(
+            team="Реал Мадрид",
+            kit_type="Домашняя",
+            features="Подарок для фаната Барселоны",
+        )
+
+    def search(self, query):
+        response = self.client.get("/api/products/", {"search": query})
+        return [product["id"] for product in response.json()]
+
+    def test_stemming_and_prefix(self):
+        self.assertEqual(self.search("домашней"), [self.real.id])
+        self.assertEqual(self.search("барс"), [self.barcelona.id, self.real.id])
+        self.assertEqual(self.search("гостевую nike"), [self.barcelona.id])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.real.team = "Ювентус"
+        self.real.save()
+        self.assertEqual(self.search("ювентус"), [self.real.id])
+        self.real.delete()
+        self.assertEqual(self.search("ювентус"), [])
+
+    def test_index_is_matched_once(self):
+        if not search.fts_available():
+            self.skipTest("SQLite без FTS5")
+        # Ранг считается в той же выборке, без подзапроса на каждую строку
+        queryset = search.search(Product.objects.all(), "барс")
+        sql = str(queryset.query)
+        self.assertEqual((sql.count("MATCH"), sql.count("bm25")), (1, 1))
+        self.assertEqual(
+            [product.id for product in queryset], [self.barcelona.id, self.real.id]
+        )
+
+
+class KeysetPaginationTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.products = [make_product(price=price) for price in (300, 100, 200, 100)]
+
+    def walk(self, **params):
+        """id всех товаров, пройденных по ссылкам next"""
+        ids, url, pages = [], "/api/products/", 0
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            ids += [product["id"] for product in data["results"]]
+            url, params, pages = data["next"], None, pages + 1
+        return ids, pages
+
+    def test_cursor_round_trip(self):
+        ids, pages = self.walk(page_size=1, ordering="price")
+        first, second, third, fourth = (product.id for product in self.products)
+        # Равные цены упорядочены по id, ни один товар не теряется и не повторяется
+        self.assertEqual(ids, [second, fourth, third, first])
+        self.assertEqual(pages, 4)
+
+    def test_descending_order(self):
+        ids, _ = self.walk(page_size=3)
+        self.assertEqual(ids, [product.id for product in reversed(self.products)])
+        ids, _ = self.walk(page_size=2, ordering="-price")
+        first, second, third, fourth = (product.id for product in self.products)
+        self.assertEqual(ids, [first, third, fourth, second])
+
+    def test_page_size_bounds(self):
+        for page_size, expected in [(0, 4), (-5, 4), ("abc", 4), (2, 2)]:
+            response = self.client.get("/api/products/", {"page_size": page_size})
+            self.assertEqual(len(response.json()["results"]), expected, page_size)
+        pagination = ProductKeysetPagination()
+        request = APIRequestFactory().get("/", {"page_size": 1000})
+        self.assertEqual(pagination.get_page_size(Request(request)), 100)
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/api/products/", {"page_size": 1})
+        cursor = parse_qs(urlsplit(response.json()["next"]).query)["cursor"][0]
+        for params in [
+            {"cursor": "not-a-cursor"},
+            {"cursor": base64.urlsafe_b64encode(b'{"o":"-created_at"}').decode()},
+            # Курсор другой сортировки
+            {"cursor": cursor, "ordering": "price"},
+        ]:
+            response = self.client.get("/api/products/", params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn("cursor", response.json())
+
+    def test_search_keeps_rank_order(self):
+        barcelona = make_product(team="Барселона")
+        fan = make_product(features="Подарок для фаната Барселоны")
+        ids, pages = self.walk(search="барс", page_size=1)
+        self.assertEqual((ids, pages), ([barcelona.id, fan.id], 2))
+        # Явная сортировка важнее релевантности
+        ids, _ = self.walk(search="барс", page_size=1, ordering="-created_at")
+        self.assertEqual(ids, [fan.id, barcelona.id])
+
+
+class FilterOptionsTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        make_product(brand="Nike", league="АПЛ", size="L")
+        make_product(brand="Nike", league="ЛаЛига", size="M")
+        make_product(brand="Adidas", league="АПЛ", size="M")
+
+    def get_options(self, **params):
+        return self.client.get("/api/products/filter_options/", params).json()
+
+    def test_counts_and_drill_down(self):
+        data = self.get_options(manufacturer="Nike")
+        self.assertEqual(data["size"], ["M", "L"])
+        self.assertEqual(
+            data["counts"]["league"],
+            [{"value": "АПЛ", "count": 1}, {"value": "ЛаЛига", "count": 1}],
+        )
+        # Собственный фильтр фасета не сужает его значения
+        self.assertEqual(data["manufacturer"], ["Adidas", "Nike"])
+
+    def test_cached_until_catalog_changes(self):
+        self.get_options()
+        with self.assertNumQueries(1):
+            self.get_options()
+
+        make_product(brand="Puma")
+        self.assertIn("Puma", self.get_options()["manufacturer"])
+
+    def test_invalid_price_is_rejected(self):
+        for url in ["/api/products/filter_options/", "/api/products/"]:
+            for params in [{"min_price": "abc"}, {"max_price": "-1"}]:
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 400, (url, params))
+                self.assertIn(next(iter(params)), response.json())
+        counts = self.get_options(min_price=" 4000.0 ", max_price="6000")["counts"]
+        self.assertEqual(sum(item["count"] for item in counts["manufacturer"]), 3)
+
+
+class ProductSnapshotTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = make_product()
+
+    def test_snapshot_reused_and_invalidated(self):
+        first = self.client.get("/api/products/").json()
+        self.assertEqual(snapshots.get_stats()["misses"], 1)
+        self.assertTrue(first[0]["images"][0]["image_url"].startswith("http://"))
+
+        self.assertEqual(self.client.get("/api/products/").json(), first)
+        self.assertEqual(snapshots.get_stats()["hits"], 1)
+
+        Image.objects.create(product=self.product, image="products/new.jpg")
+        self.assertEqual(self.client.get("/api/products/").json()[0]["images_count"], 3)
+
+        self.product.price = 7000
+        self.product.save()
+        self.assertEqual(
+            self.client.get(f"/api/products/{self.product.pk}/").json()["price"],
+            "7000.00",
+        )
+
+    def test_image_change_outdates_snapshots_in_other_processes(self):
+        self.client.get("/api/products/")
+        updated_at = self.product.updated_at
+        # Удаление записи из кэша другого процесса не доходит: снимок
+        # должен устареть по дате изменения товара
+        with mock.patch.object(snapshots, "invalidate"):
+            image = Image.objects.create(product=self.product, image="products/3.jpg")
+            self.assertEqual(
+                self.client.get("/api/products/").json()[0]["images_count"], 3
+            )
+            image.delete()
+            self.assertEqual(
+                self.client.get("/api/products/").json()[0]["images_count"], 2
+            )
+        self.product.refresh_from_db()
+        self.assertGreater(self.product.updated_at, updated_at)
+
+    def test_cache_stats_is_staff_only(self):
+        self.assertEqual(self.client.get("/api/products/cache_stats/").status_code, 401)
+        admin = User.objects.create(telegram_id=1, is_admin=True)
+        self.client.force_authenticate(admin)
+        response = self.client.get("/api/products/cache_stats/")
+        self.assertEqual(set(response.json()), {"hits", "misses", "hit_ratio"})
+
+
+class BenchProductPayloadTests(CatalogTestCase):
+    # Без testserver, который тестовый раннер добавляет к ALLOWED_HOSTS
+    @override_settings(ALLOWED_HOSTS=["shop.example"])
+    def test_runs_and_rolls_back(self):
+        output = StringIO()
+        call_command(
+            "bench_product_payload", products=3, images=2, repeat=1, stdout=output
+        )
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(lines[1].split()[0], "полное")
+        self.assertFalse(Product.objects.exists())
+
+
+class SparseFieldsetTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = make_product()
+        self.user = User.objects.create(telegram_id=4004)
+
+    def test_card_fields(self):
+        full = self.client.get("/api/products/").json()[0]
+        card = self.client.get("/api/products/?fields=card").json()[0]
+        self.assertEqual(list(card), list(fieldsets.PRESETS["card"]))
+        cover = full["images"][0]
+        self.assertEqual(
+            card["images"],
+            [{name: cover[name] for name in fieldsets.COVER_FIELDS}],
+        )
+        self.assertEqual(card["images_count"], 2)
+        # Проекция строится из того же закэшированного представления
+        self.assertEqual(
+            snapshots.get_stats(), {"hits": 1, "misses": 1, "hit_ratio": 0.5}
+        )
+
+    def test_explicit_fields_and_expand(self):
+        data = self.client.get(
+            f"/api/products/{self.product.pk}/?fields=id,images&expand=images"
+        ).json()
+        self.assertEqual(list(data), ["id", "images"])
+        self.assertEqual(len(data["images"]), 2)
+        self.assertIn("created_at", data["images"][0])
+
+    def test_unknown_field(self):
+        response = self.client.get("/api/products/?fields=id,secret")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("secret", response.json()["fields"])
+
+    def test_nested_products(self):
+        CartItem.objects.create(user=self.user, product=self.product, selected_size="M")
+        Favorite.objects.create(user=self.user, product=self.product)
+        for url in ("/api/cart/by_telegram_id/", "/api/favorites/by_telegram_id/"):
+            item = self.client.get(url, {"telegram_id": 4004, "fields": "card"}).json()[
+                0
+            ]
+            self.assertEqual(list(item["product"]), list(fieldsets.PRESETS["card"]))
+            self.assertIn("created_at", item)
+
+
+class ConditionalGetTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = make_product()
+
+    def test_not_modified_until_catalog_changes(self):
+        for url in ["/api/products/", "/api/products/filter_options/"]:
+            response = self.client.get(url)
+            etag = response.headers["ETag"]
+            self.assertIn("Last-Modified", response.headers)
+
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+        Image.objects.create(product=self.product, image="products/new.jpg")
+        response = self.client.get("/api/products/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_depends_on_query(self):
+        first = self.client.get("/api/products/").headers["ETag"]
+        second = self.client.get("/api/products/?manufacturer=Nike").headers["ETag"]
+        self.assertNotEqual(first, second)
+
+
+class RenderingTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        for _ in range(5):
+            make_product(features="Описание\u2028с разделителем строк " * 10)
+
+    def test_fast_json_matches_drf(self):
+        response = self.client.get("/api/products/")
+        expected = JSONRenderer().render(response.data)
+        self.assertEqual(response.content, expected)
+        self.assertIn(b"\\u2028", response.content)
+
+    def test_gzip_and_weak_etag(self):
+        response = self.client.get("/api/products/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response.headers["Vary"])
+        self.assertTrue(response.headers["ETag"].startswith('W/"'))
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))), 5)
+
+        etag = response.headers["ETag"]
+        response = self.client.get(
+            "/api/products/", HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_small_and_refused_responses_are_not_compressed(self):
+        small = self.client.get(
+            "/api/products/cache_stats/", HTTP_ACCEPT_ENCODING="gzip"
+        )
+        refused = self.client.get("/api/products/", HTTP_ACCEPT_ENCODING="gzip;q=0")
+        for response in (small, refused):
+            self.assertNotIn("Content-Encoding", response.headers)
+
+    @skipUnless(middleware.brotli, "brotli не установлен")
+    def test_brotli_preferred(self):
+        response = self.client.get(
+            "/api/products/", HTTP_ACCEPT_ENCODING="gzip, deflate, br"
+        )
+        self.assertEqual(response.headers["Content-Encoding"], "br")
+        data = json.loads(middleware.brotli.decompress(response.content))
+        self.assertEqual(len(data), 5)
+
+    @skipUnless(renderers.msgpack, "msgpack не установлен")
+    def test_msgpack_negotiation(self):
+        msgpack = renderers.msgpack
+        response = self.client.get("/api/products/", HTTP_ACCEPT="application/msgpack")
+        self.assertEqual(response.headers["Content-Type"], "application/msgpack")
+        self.assertEqual(
+            msgpack.unpackb(response.content),
+            json.loads(self.client.get("/api/products/").content),
+        )
+
+        User.objects.create(telegram_id=6006)
+        response = self.client.post(
+            "/api/cart/batch/",
+            msgpack.packb(
+                {
+                    "telegram_id": 6006,
+                    "operations": [{"op": "add", "product": response.data[0]["id"]}],
+                }
+            ),
+            content_type="application/msgpack",
+            HTTP_ACCEPT="application/msgpack",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(msgpack.unpackb(response.content)["version"], 1)
+
+
+def make_upload(name="photo.jpg", size=(300, 200), exif=None):
+    buffer = BytesIO()
+    options = {"exif": exif.tobytes()} if exif else {}
+    PILImage.new("RGB", size, (200, 30, 30)).save(buffer, format="JPEG", **options)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/jpeg")
+
+
+class BenchRenderersTests(CatalogTestCase):
+    # Без testserver, который тестовый раннер добавляет к ALLOWED_HOSTS
+    @override_settings(ALLOWED_HOSTS=["shop.example"])
+    def test_runs_and_rolls_back(self):
+        output = StringIO()
+        call_command(
+            "bench_renderers", products=3, cart=2, orders=2, repeat=1, stdout=output
+        )
+        responses = {line.split()[0] for line in output.getvalue().splitlines()[1:]}
+        self.assertEqual(responses, {"каталог", "корзина", "заказы"})
+        self.assertFalse(Product.objects.exists())
+
+
+class ImageProcessingTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+        self.product = make_product()
+
+    def run_worker(self, **options):
+        call_command(
+            "process_image_jobs",
+            once=True,
+            workers=1,
+            stdout=StringIO(),
+            stderr=StringIO(),
+            **options,
+        )
+
+    def test_upload_is_processed_in_background(self):
+        response = self.client.post(
+            f"/api/products/{self.product.pk}/upload_image/",
+            {"image": make_upload()},
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()["status"], "pending")
+        self.assertEqual(response.json()["srcset"], {})
+        self.assertEqual(ImageJob.objects.count(), 1)
+
+        self.run_worker()
+        image_url = f"/api/images/{response.json()['id']}/"
+        data = self.client.get(image_url).json()
+        self.assertEqual(data["status"], "ready")
+        self.assertFalse(ImageJob.objects.exists())
+        self.assertEqual(list(data["srcset"]), list(imaging.FORMATS))
+        # Оригинал шириной 300 не увеличивается до 400 и 800
+        self.assertRegex(
+            data["srcset"]["webp"],
+            r"^http://testserver/media/\S+\.w200\.webp 200w, \S+\.w300\.webp 300w$",
+        )
+
+        # Размеры и заглушка для сетки до загрузки фото
+        self.assertEqual((data["width"], data["height"]), (300, 200))
+        # Красный фон make_upload с поправкой на сжатие JPEG
+        color = bytes.fromhex(data["dominant_color"].removeprefix("#"))
+        self.assertTrue(all(abs(a - b) < 8 for a, b in zip(color, (200, 30, 30))))
+        self.assertTrue(data["placeholder"].startswith("data:image/jpeg;base64,"))
+        placeholder = base64.b64decode(data["placeholder"].split(",", 1)[1])
+        self.assertEqual(PILImage.open(BytesIO(placeholder)).size, (16, 11))
+
+        image = Image.objects.get(pk=data["id"])
+        for variant in image.variants:
+            self.assertEqual(variant["height"], round(200 * variant["width"] / 300))
+            self.assertTrue(image.image.storage.exists(variant["name"]))
+        # Товар в каталоге видит готовые копии
+        product = self.client.get(f"/api/products/{self.product.pk}/").json()
+        self.assertEqual(product["images"][-1]["srcset"], data["srcset"])
+
+    def test_exif_is_stripped(self):
+        exif = PILImage.Exif()
+        exif[0x0112] = 6  # Orientation: повернуть на 90°
+        exif[0x010F] = "PhoneMaker"
+        image = Image.objects.create(product=self.product, image=make_upload(exif=exif))
+        self.run_worker()
+
+        image.refresh_from_db()
+        with image.image.storage.open(image.image.name) as file:
+            original = PILImage.open(file)
+            self.assertEqual(dict(original.getexif()), {})
+            self.assertEqual(original.size, (200, 300))
+        self.assertEqual(image.variants[0]["height"], 300)
+        self.assertEqual((image.width, image.height), (200, 300))
+        # Без EXIF это другие байты: новое имя по хэшу, файл загрузки удален
+        with image.image.storage.open(image.image.name) as file:
+            digest = storage.checksum(file)
+        self.assertEqual(storage.digest_from_name(image.image.name), digest)
+        self.assertNotEqual(digest, image.checksum)
+        uploaded = storage.content_name(image.checksum, "photo.jpg")
+        self.assertFalse(image.image.storage.exists(uploaded))
+
+    def test_identical_uploads_are_stored_once(self):
+        url = f"/api/products/{self.product.pk}/upload_image/"
+        first = self.client.post(url, {"image": make_upload()})
+        self.assertEqual(first.status_code, 202)
+        # Тот же файл к тому же товару: уже созданное фото
+        again = self.client.post(url, {"image": make_upload("copy.jpg")})
+        self.assertEqual(
+            (again.status_code, again.json()["id"]), (200, first.json()["id"])
+        )
+        self.run_worker()
+
+        # К другому товару: новая запись на готовых файлах, без очереди
+        image = Image.objects.create(product=make_product(), image=make_upload())
+        original = Image.objects.get(pk=first.json()["id"])
+        self.assertEqual(image.status, "ready")
+        self.assertEqual(image.image.name, original.image.name)
+        self.assertEqual(image.variants, original.variants)
+        self.assertFalse(ImageJob.objects.exists())
+        self.assertEqual(
+            image.image.name, storage.content_name(image.checksum, "a.jpg")
+        )
+
+    def test_failed_job_is_retried_then_marked(self):
+        image = Image.objects.create(product=self.product, image=make_upload())
+        image.image.storage.delete(image.image.name)
+
+        self.run_worker(max_attempts=2)
+        job = ImageJob.objects.get()
+        self.assertEqual((job.status, job.attempts), ("pending", 1))
+        self.assertIn("FileNotFoundError", job.error)
+
+        ImageJob.objects.update(available_at=timezone.now())
+        self.run_worker(max_attempts=2)
+        job.refresh_from_db()
+        image.refresh_from_db()
+        self.assertEqual((job.status, image.status), ("failed", "failed"))
+
+    def test_unexpected_error_does_not_stop_worker(self):
+        image = Image.objects.create(product=self.product, image=make_upload())
+        other = Image.objects.create(
+            product=make_product(), image=make_upload("other.jpg", size=(120, 80))
+        )
+        process_upload = imaging.process_upload
+
+        def broken(name):
+            if name == image.image.name:
+                raise RuntimeError("сбой декодера")
+            return process_upload(name)
+
+        with mock.patch.object(imaging, "process_upload", broken):
+            self.run_worker(max_attempts=1)
+        job = ImageJob.objects.get()
+        image.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((job.status, image.status), ("failed", "failed"))
+        self.assertIn("Traceback", job.error)
+        self.assertIn("RuntimeError: сбой декодера", job.error)
+        # Остальные задачи пачки обработаны
+        self.assertEqual(other.status, "ready")
+
+    def test_stale_job_is_not_reclaimed_forever(self):
+        image = Image.objects.create(product=self.product, image=make_upload())
+        started_at = timezone.now() - image_jobs.PROCESSING_TIMEOUT * 2
+        # Обработчик упал на задаче, попытки еще есть: задача возвращается
+        ImageJob.objects.update(status="processing", started_at=started_at, attempts=1)
+        self.assertEqual(image_jobs.requeue_stale(max_attempts=2), 1)
+        self.assertEqual(ImageJob.objects.get().status, "pending")
+
+        # Попытки кончились: задача и фото сбойные, в очередь не возвращаются
+        ImageJob.objects.update(status="processing", started_at=started_at, attempts=2)
+        self.assertEqual(image_jobs.requeue_stale(max_attempts=2), 0)
+        job = ImageJob.objects.get()
+        image.refresh_from_db()
+        self.assertEqual((job.status, image.status), ("failed", "failed"))
+        self.assertIn("Обработка прервана", job.error)
+
+    def test_backfill_command(self):
+        # Фото, загруженное до появления очереди: файл есть, копий нет
+        name = default_storage.save("products/old.jpg", make_upload())
+        image = Image.objects.create(product=self.product, image=name)
+        self.assertEqual(image.status, "ready")
+        # Файлов фото из make_product нет на диске: они попадают в ошибки
+        call_command(
+            "generate_image_variants", workers=1, stdout=StringIO(), stderr=StringIO()
+        )
+
+        image.refresh_from_db()
+        self.assertEqual(len(image.variants), 2 * len(imaging.FORMATS))
+        self.assertEqual((image.width, image.height), (300, 200))
+        self.assertTrue(image.placeholder)
+
+    def test_backfill_continues_after_unexpected_error(self):
+        bomb = default_storage.save("products/bomb.jpg", make_upload())
+        name = default_storage.save("products/old.jpg", make_upload(size=(120, 80)))
+        Image.objects.create(product=self.product, image=bomb)
+        image = Image.objects.create(product=self.product, image=name)
+        load = imaging.load
+
+        def guarded(path):
+            if path == bomb:
+                raise PILImage.DecompressionBombError("слишком большое фото")
+            return load(path)
+
+        errors = StringIO()
+        with mock.patch.object(imaging, "load", guarded):
+            call_command(
+                "generate_image_variants", workers=1, stdout=StringIO(), stderr=errors
+            )
+
+        self.assertIn(f"{bomb}: DecompressionBombError", errors.getvalue())
+        image.refresh_from_db()
+        self.assertEqual((image.width, image.height), (120, 80))
+
+    def test_dedupe_command(self):
+        def save_legacy(name, picture, **options):
+            buffer = BytesIO()
+            picture.save(buffer, format="JPEG", **options)
+            name = default_storage.save(
+                name, SimpleUploadedFile(name, buffer.getvalue())
+            )
+            return Image.objects.create(product=self.product, image=name)
+
+        picture = PILImage.effect_mandelbrot((300, 200), (-2, -1, 1, 1), 100)
+        picture = picture.convert("RGB")
+        first = save_legacy("products/a.jpg", picture, quality=95)
+        copy = save_legacy("products/b.jpg", picture, quality=95)
+        # Пересжатая уменьшенная копия того же снимка
+        similar = save_legacy("products/c.jpg", picture.resize((150, 100)), quality=40)
+        gradient = PILImage.linear_gradient("L").rotate(-90).resize((300, 200))
+        other = save_legacy("products/d.jpg", gradient.convert("RGB"))
+        out = StringIO()
+        call_command("dedupe_images", stdout=out, stderr=StringIO())
+
+        self.assertFalse(Image.objects.filter(pk=copy.pk).exists())
+        first.refresh_from_db()
+        with first.image.storage.open(first.image.name) as file:
+            self.assertEqual(
+                storage.digest_from_name(first.image.name), storage.checksum(file)
+            )
+        self.assertFalse(default_storage.exists("products/a.jpg"))
+        self.assertFalse(default_storage.exists("products/b.jpg"))
+        self.assertIn(f"фото {first.pk} и {similar.pk} похожи", out.getvalue())
+        self.assertNotIn(f"{other.pk} похожи", out.getvalue())
+        self.assertIn("Пар почти одинаковых фото: 1", out.getvalue())
+
+
+class ChannelImportTests(CatalogTestCase):
+    HEADER = ["Команда", "Бренд", "Сезон", "Тип формы", "Цена", "Размер", "Хештеги"]
+    HEADER += ["UUID", "UUID_фотографий", "Ссылка на пост"]
+
+    def setUp(self):
+        super().setUp()
+        self.directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.enterContext(override_settings(MEDIA_ROOT=self.directory / "media"))
+        photo_dir = self.directory / "photos" / "ext-1"
+        photo_dir.mkdir(parents=True)
+        for name, size in [("p1", (300, 200)), ("p2", (200, 300))]:
+            (photo_dir / f"{name}.jpg").write_bytes(make_upload(size=size).read())
+
+    def run_import(self, *rows):
+        path = self.directory / "football_jerseys.csv"
+        with open(path, "w", encoding="utf-8-sig", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(self.HEADER)
+            writer.writerows(rows)
+        call_command("import_channel", str(path), batch_size=1, stdout=StringIO())
+
+    def test_import_upserts_products_and_attaches_images(self):
+        row = ["Ипсвич", "Umbro", "2003/05", "домашняя", "4200", "M", "Чемпионшип, M"]
+        url = "https://t.me/channel/1"
+        self.run_import(
+            row + ["ext-1", "p1,p2,lost", url],
+            ["", "Nike", "2020/21", "гостевая", "100", "L", "", "ext-2", "", url],
+        )
+        product = Product.objects.get()
+        self.assertEqual(product.external_id, "ext-1")
+        self.assertEqual((product.league, product.kit_type), ("Чемпионшип", "Домашняя"))
+        self.assertEqual(product.images_set.filter(status="pending").count(), 2)
+        self.assertEqual(ImageJob.objects.count(), 2)
+        response = self.client.get("/api/products/", {"search": "Ипсвич"})
+        self.assertEqual([item["id"] for item in response.json()], [product.pk])
+
+        # Повторный импорт обновляет товар, а не создает копии товара и фото
+        Product.objects.filter(pk=product.pk).update(is_available=False)
+        row[4] = "3900"
+        self.run_import(row + ["ext-1", "p1,p2", url])
+        product.refresh_from_db()
+        self.assertEqual((Product.objects.count(), product.price), (1, 3900))
+        self.assertFalse(product.is_available)
+        self.assertEqual(product.images_set.count(), 2)
+
+
+class AvailabilityReconcileTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = directory / "football_jerseys.csv"
+        self.sold = make_product(external_id="sold")
+        self.deleted = make_product(external_id="deleted")
+        self.back = make_product(
+            external_id="back", is_available=False, hidden_by_channel=True
+        )
+        self.sold_out = make_product(
+            external_id="sold-out",
+            is_available=False,
+            hidden_by_channel=True,
+            stock_quantity=0,
+        )
+        # Скрыт вручную в админке, хотя пост еще продается
+        self.manual = make_product(external_id="manual", is_available=False)
+        self.write_csv(
+            ["sold", "продано"],
+            ["deleted", "удален"],
+            ["back", "в наличии"],
+            ["sold-out", "в наличии"],
+            ["manual", "в наличии"],
+            # Повтор товара в другом посте, который еще продается
+            ["back", "продано"],
+        )
+
+    def write_csv(self, *rows, header=("UUID", "Статус")):
+        with open(self.path, "w", encoding="utf-8-sig", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(header)
+            writer.writerows(rows)
+
+    def reconcile(self, **options):
+        output = StringIO()
+        call_command("reconcile_availability", str(self.path), stdout=output, **options)
+        return output.getvalue()
+
+    def available(self):
+        return set(
+            Product.objects.filter(is_available=True).values_list(
+                "external_id", flat=True
+            )
+        )
+
+    def test_sold_and_deleted_posts_are_hidden(self):
+        output = self.reconcile()
+        # Товар без остатка остается выключенным: его распродал магазин
+        self.assertEqual(self.available(), {"back"})
+        self.assertIn("пост удален", output)
+        self.assertIn("Снято с продажи: 2, возвращено в продажу: 1", output)
+        self.assertEqual(
+            set(
+                Product.objects.filter(hidden_by_channel=True).values_list(
+                    "external_id", flat=True
+                )
+            ),
+            {"sold", "deleted", "sold-out"},
+        )
+
+    def test_only_products_hidden_by_sync_come_back(self):
+        self.reconcile()
+        # Пост снова в наличии: возвращаются товары, снятые сверкой
+        self.write_csv(["sold", "в наличии"], ["manual", "в наличии"])
+        self.reconcile()
+        self.assertIn("sold", self.available())
+        self.assertNotIn("manual", self.available())
+
+        # Админ скрыл товар вручную: повторные прогоны его не включают
+        admin = User.objects.create(telegram_id=1, is_admin=True)
+        self.client.force_login(admin)
+        response = self.client.post(
+            "/admin/products/product/",
+            {
+                "action": "mark_as_unavailable",
+                "_selected_action": [self.sold.pk],
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.reconcile()
+        self.assertNotIn("sold", self.available())
+
+    def test_dry_run_only_reports(self):
+        output = self.reconcile(dry_run=True)
+        self.assertEqual(self.available(), {"sold", "deleted"})
+        self.assertIn(f"снять с продажи: {self.sold.pk}", output)
+        self.assertIn(f"вернуть в продажу: {self.back.pk}", output)
+
+    def test_export_without_status_is_rejected(self):
+        self.write_csv(["sold"], header=("UUID",))
+        with self.assertRaisesMessage(CommandError, "Статус"):
+            self.reconcile()
+
+
+def load_scraper():
+    """Скрапер scripts/tg_channel_availability_to_csv.py и его канал в памяти"""
+    if str(SCRIPTS_DIR) not in sys.path:
+        sys.path.insert(0, str(SCRIPTS_DIR))
+    import tg_channel_availability_to_csv as scraper
+    import tg_fake_client
+
+    return scraper, tg_fake_client
+
+
+@skipUnless(
+    find_spec("telethon") and find_spec("pandas"),
+    "нет зависимостей скрапера (telethon, pandas)",
+)
+class ChannelSyncTests(SimpleTestCase):
+    def setUp(self):
+        self.scraper, self.fake = load_scraper()
+        self.directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def sync(self, client, state=None, workers=2, **options):
+        state = state or {"channel": "", "last_message_id": 0, "posts": {}}
+        sync = self.scraper.ChannelSync(
+            client, state, photos_dir=str(self.directory), workers=workers
+        )
+        options = {"full": False, "limit": 1000, "recheck": 0, **options}
+        with mock.patch("builtins.print"):
+            asyncio.run(sync.run(progress_interval=60, **options))
+        return sync, state
+
+    def test_downloads_are_limited_by_workers_and_queue(self):
+        client = self.fake.FakeTelegramClient.generate(30, latency=0.005)
+        ahead = []
+        download_media = client.download_media
+
+        async def track(message, file):
+            # Сколько сообщений прочитано сверх уже скачанных фото
+            ahead.append(client.messages_read - client.downloads)
+            return await download_media(message, file)
+
+        client.download_media = track
+        sync, state = self.sync(client, workers=3)
+
+        self.assertEqual((client.downloads, sync.metrics.downloaded), (120, 120))
+        self.assertEqual(len(state["posts"]), 30)
+        self.assertLessEqual(client.max_active_downloads, 3)
+        self.assertGreater(client.max_active_downloads, 1)
+        # Полная очередь останавливает чтение канала: вперед читается не больше
+        # очереди, загрузок в работе, альбома у производителя и одного сообщения
+        limit = sync.queue.maxsize + 3 + 4 + 1
+        self.assertLessEqual(max(ahead), limit)
+        self.assertLess(limit, 120)
+
+    def test_albums_are_grouped_from_one_pass(self):
+        Message = self.fake.FakeMessage
+        # Порядок прохода: от новых к старым; альбом 2 встречается еще раз
+        # после других сообщений и не должен склеиться с первой частью
+        messages = [
+            Message(10, grouped_id=2),
+            Message(9, grouped_id=2),
+            Message(8),
+            Message(7),
+            Message(6, grouped_id=1),
+            Message(5, grouped_id=2),
+            Message(4, grouped_id=1),
+            Message(3, grouped_id=1),
+        ]
+        groups = self.scraper.iter_groups(messages)
+        self.assertEqual(
+            [[message.id for message in group] for group in groups],
+            [[10, 9], [8], [7], [6], [5], [4, 3]],
+        )
+
+    def test_split_albums_are_completed_at_pass_edges(self):
+        # Альбомы по 4 сообщения: 1–4, 5–8, 9–12, 13–16
+        client = self.fake.FakeTelegramClient.generate(4, latency=0)
+
+        async def read(**options):
+            messages = client.iter_messages("channel", **options)
+            return [
+                [message.id for message in group]
+                async for group in self.scraper.read_posts(client, messages)
+            ]
+
+        # Проход min_id=2, max_id=15 режет первый и последний альбомы
+        self.assertEqual(
+            asyncio.run(read(min_id=2, max_id=15)),
+            [[13, 14, 15, 16], [9, 10, 11, 12], [5, 6, 7, 8], [1, 2, 3, 4]],
+        )
+        # Один запрос списка и по запросу на каждый крайний альбом
+        self.assertEqual(client.api_calls, 3)
+
+        client.api_calls = 0
+        self.assertEqual(
+            asyncio.run(read(limit=6)), [[13, 14, 15, 16], [9, 10, 11, 12]]
+        )
+        self.assertEqual(client.api_calls, 3)
+
+    def test_resumed_run_reads_only_new_posts(self):
+        channel = self.fake.FakeTelegramClient.generate(8, latency=0)
+        first = self.fake.FakeTelegramClient(channel.messages[:20], channel.photos)
+        _, state = self.sync(first)
+        self.assertEqual((state["last_message_id"], first.downloads), (20, 20))
+
+        sync, state = self.sync(channel, state)
+        # Уже обработанные сообщения не читаются и не скачиваются заново
+        self.assertEqual((channel.messages_read, channel.downloads), (12, 12))
+        self.assertEqual(sync.metrics.posts["new"], 3)
+        self.assertEqual(state["last_message_id"], 32)
+        self.assertEqual(len(state["posts"]), 8)
+
+    def test_checkpoint_stops_before_unsaved_photos(self):
+        client = self.fake.FakeTelegramClient.generate(4, latency=0)
+        download_media = client.download_media
+        failing = {6}
+
+        async def flaky(message, file):
+            if message.photo.id in failing:
+                failing.clear()
+                raise PermissionError("нет доступа")
+            return await download_media(message, file)
+
+        client.download_media = flaky
+        sync, state = self.sync(client)
+        self.assertEqual(sync.metrics.failed, 1)
+        # Пост 5 (сообщения 5–8) сохранен не целиком: отметка остается перед ним
+        self.assertEqual(state["last_message_id"], 4)
+        self.assertIsNone(state["posts"]["5"]["hash"])
+
+        downloads = client.downloads
+        sync, state = self.sync(client, state)
+        self.assertEqual(client.downloads - downloads, 1)
+        self.assertEqual(sync.metrics.skipped, 3)
+        self.assertEqual(state["last_message_id"], 16)
+        self.assertIsNotNone(state["posts"]["5"]["hash"])
+
+    def test_interrupted_run_keeps_previous_state(self):
+        state_path = self.directory / "sync_state.json"
+        csv_path = self.directory / "football_jerseys.csv"
+        channel = self.fake.FakeTelegramClient.generate(4, latency=0)
+        first = self.fake.FakeTelegramClient(channel.messages[:8], channel.photos)
+        options = {"full": False, "limit": 1000, "recheck": 0, "workers": 2}
+        with mock.patch("builtins.print"):
+            asyncio.run(
+                self.scraper.sync_channel(
+                    first, state_path, csv_path, str(self.directory), **options
+                )
+            )
+        saved = state_path.read_bytes()
+
+        iter_messages = channel.iter_messages
+
+        async def broken(*args, **kwargs):
+            async for message in iter_messages(*args, **kwargs):
+                if channel.messages_read > 3:
+                    raise ConnectionError("соединение разорвано")
+                yield message
+
+        channel.iter_messages = broken
+        with self.assertRaises(ConnectionError), mock.patch("builtins.print"):
+            asyncio.run(
+                self.scraper.sync_channel(
+                    channel, state_path, csv_path, str(self.directory), **options
+                )
+            )
+        # Отметка и хэши прерванного прогона не записаны
+        self.assertEqual(state_path.read_bytes(), saved)
+
+
+class AttributeFilterTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.nike_l = make_product(brand="Nike", size="L")
+        self.nike_xl = make_product(brand="  NIKE ", size="XL")
+        self.umbro = make_product(brand="Umbro", size="M")
+
+    def filter_ids(self, **params):
+        response = self.client.get("/api/products/", params)
+        return sorted(product["id"] for product in response.json())
+
+    def test_known_values_match_exactly(self):
+        self.assertEqual(self.filter_ids(size="l"), [self.nike_l.id])
+        self.assertEqual(
+            self.filter_ids(manufacturer="nike"), [self.nike_l.id, self.nike_xl.id]
+        )
+
+    def test_prefix_and_substring_fallback(self):
+        self.assertEqual(self.filter_ids(manufacturer="um"), [self.umbro.id])
+        self.assertEqual(self.filter_ids(manufacturer="mbr"), [self.umbro.id])
+        self.assertEqual(self.filter_ids(manufacturer="adidas"), [])
+
+    def test_substring_matches_every_known_value(self):
+        make_product(league="Лига чемпионов")
+        premier = make_product(league="Английская Премьер Лига")
+        # Не только значения, начинающиеся с «лига» (у остальных — «ЛаЛига»)
+        self.assertEqual(
+            self.filter_ids(league="лига"),
+            sorted(Product.objects.values_list("id", flat=True)),
+        )
+        self.assertEqual(self.filter_ids(league="премьер"), [premier.id])
+
+
+class IdempotencyTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = make_product()
+
+    def add_to_cart(self, key, quantity=1):
+        return self.client.post(
+            "/api/cart/",
+            {
+                "telegram_id": 4004,
+                "product": self.product.pk,
+                "quantity": quantity,
+                "selected_size": "M",
+            },
+            format="json",
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retry_replays_first_response(self):
+        first = self.add_to_cart("retry-1")
+        with CaptureQueriesContext(connection) as context:
+            second = self.add_to_cart("retry-1")
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second.headers["Idempotent-Replayed"], "true")
+        self.assertEqual(CartItem.objects.count(), 1)
+        # Повтор не трогает данные: только попытка занять ключ и чтение ответа
+        tables = " ".join(query["sql"] for query in context.captured_queries)
+        self.assertNotIn("products_cartitem", tables)
+        self.assertNotIn("users_user", tables)
+
+    def test_key_reused_with_other_body(self):
+        self.add_to_cart("retry-2")
+        response = self.add_to_cart("retry-2", quantity=2)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(CartItem.objects.get().quantity, 1)
+
+    def test_request_in_progress(self):
+        IdempotencyKey.objects.create(
+            key="retry-3",
+            scope="POST /api/favorites/ id:4004",
+            request_hash="",
+            expires_at=timezone.now() + timedelta(hours=1),
+        )
+        response = self.client.post(
+            "/api/favorites/",
+            {"telegram_id": 4004, "product": self.product.pk},
+            format="json",
+            HTTP_IDEMPOTENCY_KEY="retry-3",
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Favorite.objects.exists())
+
+    def test_expired_key_runs_again(self):
+        self.client.post(
+            "/api/favorites/",
+            {"telegram_id": 4004, "product": self.product.pk},
+            format="json",
+            HTTP_IDEMPOTENCY_KEY="retry-4",
+        )
+        Favorite.objects.all().delete()
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+
+        response = self.client.post(
+            "/api/favorites/",
+            {"telegram_id": 4004, "product": self.product.pk},
+            format="json",
+            HTTP_IDEMPOTENCY_KEY="retry-4",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn("Idempotent-Replayed", response.headers)
+        self.assertEqual(Favorite.objects.count(), 1)
+
+    def test_same_key_from_other_user_is_not_replayed(self):
+        first = self.add_to_cart("retry-5")
+        response = self.client.post(
+            "/api/cart/",
+            {"telegram_id": 5005, "product": self.product.pk, "selected_size": "M"},
+            format="json",
+            HTTP_IDEMPOTENCY_KEY="retry-5",
+        )
+        self.assertEqual((first.status_code, response.status_code), (201, 201))
+        self.assertNotIn("Idempotent-Replayed", response.headers)
+        self.assertEqual(CartItem.objects.count(), 2)
+
+    def test_multipart_retry_replays_first_response(self):
+        def add(key):
+            return self.client.post(
+                "/api/cart/",
+                {"telegram_id": 4004, "product": self.product.pk, "selected_size": "M"},
+                format="multipart",
+                HTTP_IDEMPOTENCY_KEY=key,
+            )
+
+        first = add("retry-6")
+        second = add("retry-6")
+        self.assertEqual((first.status_code, second.status_code), (201, 201))
+        self.assertEqual(second.headers["Idempotent-Replayed"], "true")
+        self.assertEqual(CartItem.objects.count(), 1)
+
+    def test_duplicate_favorite_without_key(self):
+        data = {"telegram_id": 4004, "product": self.product.pk}
+        first = self.client.post("/api/favorites/", data, format="json")
+        second = self.client.post("/api/favorites/", data, format="json")
+        self.assertEqual((first.status_code, second.status_code), (201, 200))
+        self.assertEqual(second.json()["id"], first.json()["id"])
+        self.assertEqual(Favorite.objects.count(), 1)
+
+
+class FavoriteIdsTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(telegram_id=6006)
+        self.products = [make_product() for _ in range(3)]
+        for product in self.products[:2]:
+            Favorite.objects.create(user=self.user, product=product)
+
+    def test_ids_with_version(self):
+        response = self.client.get("/api/favorites/ids/?telegram_id=6006")
+        data = response.json()
+        self.assertEqual(data["ids"], [p.pk for p in self.products[:2]])
+        self.assertTrue(data["version"])
+
+        not_modified = self.client.get(
+            "/api/favorites/ids/?telegram_id=6006",
+            HTTP_IF_NONE_MATCH=response.headers["ETag"],
+        )
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_bitmap(self):
+        data = self.client.get(
+            "/api/favorites/ids/?telegram_id=6006&encoding=bitmap"
+        ).json()
+        bitmap = base64.b64decode(data["bitmap"])
+        marked = [
+            index
+            for index in range(len(bitmap) * 8)
+            if bitmap[index // 8] >> (index % 8) & 1
+        ]
+        self.assertEqual(marked, [p.pk for p in self.products[:2]])
+
+    def test_check_many(self):
+        ids = ",".join(str(p.pk) for p in self.products)
+        url = f"/api/favorites/check_many/?telegram_id=6006&product_ids={ids}"
+        self.client.get(url)
+        # Версия и список id берутся из кэша, пользователь — из кэша процесса
+        with self.assertNumQueries(0):
+            data = self.client.get(url).json()
+        self.assertEqual(
+            data["favorites"],
+            {
+                str(self.products[0].pk): True,
+                str(self.products[1].pk): True,
+                str(self.products[2].pk): False,
+            },
+        )
+
+    def test_add_and_remove_change_version(self):
+        url = "/api/favorites/ids/?telegram_id=6006"
+        before = self.client.get(url).json()
+
+        favorite = Favorite.objects.create(user=self.user, product=self.products[2])
+        added = self.client.get(url).json()
+        self.assertNotEqual(added["version"], before["version"])
+        self.assertIn(self.products[2].pk, added["ids"])
+
+        # Удаление через queryset тоже проходит через сигналы
+        Favorite.objects.filter(pk=favorite.pk).delete()
+        removed = self.client.get(url).json()
+        self.assertNotEqual(removed["version"], added["version"])
+        self.assertNotIn(self.products[2].pk, removed["ids"])
+
+    def test_list_read_before_commit_is_dropped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.create(user=self.user, product=self.products[2])
+            # Параллельный запрос до коммита видит старые строки, но уже новую
+            # версию и кэширует под ней устаревший список
+            version = favorites.get_version(self.user.pk)
+            cache.set(
+                favorites.favorites_key(self.user.pk),
+                {"version": version, "ids": [p.pk for p in self.products[:2]]},
+            )
+
+        fresh, ids = favorites.get_favorite_ids(self.user.pk)
+        self.assertNotEqual(fresh, version)
+        self.assertEqual(ids, [p.pk for p in self.products])
+
+    def test_version_is_read_without_queries(self):
+        url = "/api/favorites/ids/?telegram_id=6006"
+        etag = self.client.get(url).headers["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Версия вытеснена из кэша: новая версия, список перечитывается
+        cache.delete(favorites.version_key(self.user.pk))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["ids"], [p.pk for p in self.products[:2]])
+
+
+class CartBatchTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(telegram_id=7007)
+        self.product = make_product(stock_quantity=5)
+
+    def batch(self, *operations):
+        return self.client.post(
+            "/api/cart/batch/",
+            {"telegram_id": 7007, "operations": list(operations)},
+            format="json",
+        )
+
+    def quantities(self):
+        return dict(
+            CartItem.objects.filter(user=self.user).values_list(
+                "selected_size", "quantity"
+            )
+        )
+
+    def test_operations_upsert_lines(self):
+        CartItem.objects.create(
+            user=self.user, product=self.product, selected_size="M", quantity=1
+        )
+        response = self.batch(
+            {"op": "add", "product": self.product.pk, "selected_size": "M"},
+            {"op": "add", "product": self.product.pk, "selected_size": "L"},
+            {"op": "increment", "product": self.product.pk, "selected_size": "L"},
+            {
+                "op": "set",
+                "product": self.product.pk,
+                "selected_size": "S",
+                "quantity": 1,
+            },
+            {"op": "increment", "product": self.product.pk, "selected_size": "XL"},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), {"M": 2, "L": 2, "S": 1})
+        self.assertEqual(len(response.json()["items"]), 3)
+
+    def test_version_grows(self):
+        op = {"op": "add", "product": self.product.pk, "selected_size": "M"}
+        first = self.batch(op).json()["version"]
+        second = self.batch(op).json()["version"]
+        self.assertGreater(second, first)
+
+    def test_remove_and_zero_quantity(self):
+        for size in ("M", "L"):
+            CartItem.objects.create(
+                user=self.user, product=self.product, selected_size=size, quantity=2
+            )
+        self.batch(
+            {"op": "remove", "product": self.product.pk, "selected_size": "M"},
+            {
+                "op": "increment",
+                "product": self.product.pk,
+                "selected_size": "L",
+                "quantity": -2,
+            },
+        )
+        self.assertEqual(self.quantities(), {})
+
+    def test_stock_shortage_rolls_back_batch(self):
+        other = make_product(stock_quantity=5)
+        response = self.batch(
+            {"op": "add", "product": other.pk, "selected_size": "M"},
+            {
+                "op": "set",
+                "product": self.product.pk,
+                "selected_size": "M",
+                "quantity": 3,
+            },
+            {
+                "op": "set",
+                "product": self.product.pk,
+                "selected_size": "L",
+                "quantity": 3,
+            },
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Недостаточно", response.json()["error"])
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_unknown_product(self):
+        response = self.batch({"op": "add", "product": 999999, "selected_size": "M"})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_repeated_post_increments(self):
+        for _ in range(2):
+            response = self.client.post(
+                "/api/cart/",
+                {"telegram_id": 7007, "product": self.product.pk, "selected_size": "M"},
+                format="json",
+            )
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.quantities(), {"M": 2})
+
+
+class StockTests(CatalogTestCase):
+    def test_reserve_decrements_and_marks_sold_out(self):
+        product = make_product(stock_quantity=3)
+        stock.reserve([(product, 1), (product, 2)])
+        product.refresh_from_db()
+        self.assertEqual(product.stock_quantity, 0)
+        self.assertFalse(product.is_available)
+
+    def test_reserve_rejects_shortage_without_changes(self):
+        product = make_product(stock_quantity=1)
+        with self.assertRaisesMessage(stock.InsufficientStock, "Недостаточно"):
+            stock.reserve([(product, 2)])
+        product.refresh_from_db()
+        self.assertEqual(product.stock_quantity, 1)
+
+    def test_reserve_rejects_unavailable(self):
+        product = make_product(stock_quantity=5, is_available=False)
+        with self.assertRaisesMessage(stock.InsufficientStock, "больше недоступен"):
+            stock.reserve([(product, 1)])
+
+    def test_reserve_keeps_other_fields(self):
+        product = make_product(stock_quantity=2)
+        stale = Product.objects.get(pk=product.pk)
+        Product.objects.filter(pk=product.pk).update(price=7000)
+        stock.reserve([(stale, 1)])
+        product.refresh_from_db()
+        self.assertEqual(product.price, 7000)
+        self.assertEqual(product.stock_quantity, 1)
+
+    def test_release_restores_availability(self):
+        product = make_product(stock_quantity=1)
+        stock.reserve([(product, 1)])
+        stock.release([(product.pk, 1)])
+        product.refresh_from_db()
+        self.assertEqual(product.stock_quantity, 1)
+        self.assertTrue(product.is_available)
+
+    def test_release_keeps_hidden_products_hidden(self):
+        by_channel = make_product(stock_quantity=1)
+        by_admin = make_product(stock_quantity=2)
+        stock.reserve([(by_channel, 1), (by_admin, 1)])
+        # Пост продан в канале, а второй товар скрыт в админке
+        Product.objects.filter(pk=by_channel.pk).update(hidden_by_channel=True)
+        Product.objects.filter(pk=by_admin.pk).update(is_available=False)
+
+        stock.release([(by_channel.pk, 1), (by_admin.pk, 1)])
+        self.assertEqual(
+            list(
+                Product.objects.filter(pk__in=[by_channel.pk, by_admin.pk])
+                .order_by("pk")
+                .values_list("stock_quantity", "is_available")
+            ),
+            [(1, False), (2, False)],
+        )
+
+
+@override_settings(CACHES=TEST_CACHES)
+class StockConcurrencyTests(TransactionTestCase):
+    """Параллельные покупки не продают больше, чем есть на складе"""
+
+    STOCK = 20
+    BUYERS = 50
+
+    def buy(self, product, results):
+        try:
+            while True:
+                try:
+                    with transaction.atomic():
+                        stock.reserve([(product, 1)])
+                    results.append(True)
+                    return
+                except stock.InsufficientStock:
+                    results.append(False)
+                    return
+                except OperationalError:
+                    # SQLite блокирует таблицу на время чужой записи
+                    time.sleep(0.001)
+        finally:
+            connection.close()
+
+    def test_no_oversell(self):
+        product = make_product(stock_quantity=self.STOCK)
+        results = []
+        threads = [
+            threading.Thread(target=self.buy, args=(product, results))
+            for _ in range(self.BUYERS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(len(results), self.BUYERS)
+        self.assertEqual(results.count(True), self.STOCK)
+        self.assertEqual(product.stock_quantity, 0)
+        self.assertFalse(product.is_available)
@@ -1,10 +1,12 @@
+from django.db import IntegrityError, transaction
 from django.shortcuts import render
-from rest_framework import viewsets, status, permissions
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from rest_framework import viewsets, status, permissions, serializers
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import Q
 from .models import Product, Image, CartItem, Favorite
-from users.models import User
+from users.authentication import TelegramUserMixin
 from .serializers import (
     ProductSerializer,
     ProductCreateUpdateSerializer,
@@ -13,13 +15,21 @@ from .serializers import (
     CartItemSerializer,
     CartItemCreateSerializer,
     FavoriteSerializer,
+    FavoriteCreateSerializer,
 )
+from .pagination import ProductKeysetPagination
+from .conditional import CatalogConditionalGetMixin
+from .idempotency import IdempotentMixin
+from .filters import ATTRIBUTE_FILTERS, filter_catalog, get_catalog_filters
+from . import cart, facets, favorites, snapshots, storage
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(CatalogConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Product.objects.filter(is_available=True)
     serializer_class = ProductSerializer
     permission_classes = [permissions.AllowAny]
+    pagination_class = ProductKeysetPagination
+    conditional_actions = ("list", "retrieve", "filter_options")
 
     def get_serializer_class(self):
         if self.action in ["create", "update", "partial_update"]:
@@ -32,67 +42,39 @@ class ProductViewSet(viewsets.ModelViewSet):
             queryset = Product.objects.all()
         else:
             queryset = Product.objects.filter(is_available=True)
+        queryset = queryset.prefetch_related("images_set")
 
-            # Фильтрация для совместимости с фронтендом
-        type_filter = self.request.query_params.get("type", None)
-        manufacturer = self.request.query_params.get("manufacturer", None)
-        league = self.request.query_params.get("league", None)
-        season = self.request.query_params.get("season", None)
-        condition = self.request.query_params.get("condition", None)
-        size = self.request.query_params.get("size", None)
-        min_price = self.request.query_params.get("min_price", None)
-        max_price = self.request.query_params.get("max_price", None)
-        search = self.request.query_params.get("search", None)
-
-        if type_filter:
-            queryset = queryset.filter(kit_type__icontains=type_filter)
-        if manufacturer:
-            queryset = queryset.filter(brand__icontains=manufacturer)
-        if league:
-            queryset = queryset.filter(league__icontains=league)
-        if season:
-            queryset = queryset.filter(season__icontains=season)
-        if condition:
-            queryset = queryset.filter(condition__icontains=condition)
-        if size:
-            queryset = queryset.filter(size__icontains=size)
-        if min_price:
-            queryset = queryset.filter(price__gte=min_price)
-        if max_price:
-            queryset = queryset.filter(price__lte=max_price)
-        if search:
-            queryset = queryset.filter(
-                Q(team__icontains=search)
-                | Q(brand__icontains=search)
-                | Q(season__icontains=search)
-                | Q(kit_type__icontains=search)
-            )
-
-        return queryset
+        # Фильтрация для совместимости с фронтендом
+        filters = get_catalog_filters(self.request.query_params)
+        known_values = None
+        if any(name in filters for name in ATTRIBUTE_FILTERS):
+            known_values = facets.get_known_values(self.catalog_version)
+        return filter_catalog(queryset, filters, known_values=known_values)
 
     @action(detail=False, methods=["get"])
     def filter_options(self, request):
-        """Получить опции для фильтров"""
-        products = Product.objects.filter(is_available=True)
-
+        """Получить опции для фильтров с количеством товаров"""
         return Response(
-            {
-                "type": list(products.values_list("kit_type", flat=True).distinct()),
-                "manufacturer": list(
-                    products.values_list("brand", flat=True).distinct()
-                ),
-                "league": list(products.values_list("league", flat=True).distinct()),
-                "season": list(products.values_list("season", flat=True).distinct()),
-                "condition": list(
-                    products.values_list("condition", flat=True).distinct()
-                ),
-                "size": ["XS", "S", "M", "L", "XL", "XXL"],  # Стандартные размеры
-            }
+            facets.get_facets(
+                get_catalog_filters(request.query_params), self.catalog_version
+            )
         )
 
+    @action(detail=False, methods=["get"], permission_classes=[permissions.IsAdminUser])
+    def cache_stats(self, request):
+        """Статистика кэша готового JSON товаров (для мониторинга)"""
+        return Response(snapshots.get_stats())
+
     @action(detail=True, methods=["post"])
     def upload_image(self, request, pk=None):
-        """Загрузить изображение для товара"""
+        """
+        Загрузить изображение для товара.
+
+        Файл обрабатывается в фоне: ответ 202 со статусом pending, готовность
+        проверяется через GET /api/images/{id}/ (status = ready / failed).
+        Повторная загрузка того же файла к товару возвращает уже созданное
+        фото с ответом 200.
+        """
         product = self.get_object()
 
         if "image" not in request.FILES:
@@ -101,6 +83,14 @@ class ProductViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
+        checksum = storage.checksum(request.FILES["image"])
+        duplicate = product.images_set.filter(checksum=checksum).first()
+        if duplicate is not None:
+            response_serializer = ImageSerializer(
+                duplicate, context={"request": request}
+            )
+            return Response(response_serializer.data)
+
         serializer = ImageUploadSerializer(
             data={"product": product.id, "image": request.FILES["image"]}
         )
@@ -108,7 +98,7 @@ class ProductViewSet(viewsets.ModelViewSet):
         if serializer.is_valid():
             image = serializer.save()
             response_serializer = ImageSerializer(image, context={"request": request})
-            return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+            return Response(response_serializer.data, status=status.HTTP_202_ACCEPTED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -153,20 +143,16 @@ class ImageViewSet(viewsets.ModelViewSet):
         return queryset
 
 
-class CartItemViewSet(viewsets.ModelViewSet):
+class CartItemViewSet(TelegramUserMixin, IdempotentMixin, viewsets.ModelViewSet):
     serializer_class = CartItemSerializer
     permission_classes = [permissions.AllowAny]  # Разрешаем доступ для Telegram WebApp
+    idempotent_actions = ("create", "batch")
 
     def get_queryset(self):
-        # Получаем telegram_id из query параметров
-        telegram_id = self.request.query_params.get("telegram_id")
-        if telegram_id:
-            try:
-                user = User.objects.get(telegram_id=telegram_id)
-                return CartItem.objects.filter(user=user)
-            except User.DoesNotExist:
-                return CartItem.objects.none()
-        return CartItem.objects.none()
+        user = self.get_telegram_user()
+        if user is None:
+            return CartItem.objects.none()
+        return CartItem.objects.filter(user=user).with_product()
 
     def get_serializer_class(self):
         if self.action == "create":
@@ -174,133 +160,182 @@ class CartItemViewSet(viewsets.ModelViewSet):
         return CartItemSerializer
 
     def perform_create(self, serializer):
-        # Получаем telegram_id из данных запроса
-        telegram_id = self.request.data.get("telegram_id")
-        if telegram_id:
-            try:
-                # Преобразуем telegram_id в число
-                telegram_id = int(telegram_id)
-                user, created = User.objects.get_or_create(telegram_id=telegram_id)
-                serializer.save(user=user)
-                print(f"CartItem created successfully for user {user.telegram_id}")
-            except ValueError as e:
-                print(f"ValueError in perform_create: {e}")
-                raise
-        else:
-            print("No telegram_id provided")
-            raise ValueError("telegram_id is required")
+        user = self.get_telegram_user(self.request.data, create=True)
+        if user is None:
+            raise serializers.ValidationError({"telegram_id": "telegram_id обязателен"})
+        data = serializer.validated_data
+        # Повторное добавление того же товара и размера увеличивает количество
+        operation = {
+            "op": "add",
+            "product": data["product"].pk,
+            "selected_size": data["selected_size"],
+            "quantity": data.get("quantity", 1),
+        }
+        try:
+            cart.apply_operations(user.pk, cart.parse_operations([operation]))
+        except ValueError as e:
+            raise serializers.ValidationError({"error": str(e)})
+        serializer.instance = CartItem.objects.get(
+            user=user, product=data["product"], selected_size=data["selected_size"]
+        )
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        cart.bump_version(serializer.instance.user_id)
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        cart.bump_version(instance.user_id)
+
+    @action(detail=False, methods=["post"])
+    def batch(self, request):
+        """
+        Пакет операций с корзиной в одной транзакции.
+
+        operations: [{"op": "add" | "increment" | "set" | "remove",
+        "product": id, "selected_size": "M", "quantity": 1}, ...]. Ответ —
+        новая корзина и ее версия.
+        """
+        user = self.get_telegram_user(request.data, create=True)
+        if user is None:
+            return self.telegram_user_missing(request.data)
+        try:
+            operations = cart.parse_operations(request.data.get("operations"))
+            version = cart.apply_operations(user.pk, operations)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        cart_items = CartItem.objects.filter(user=user).with_product()
+        serializer = CartItemSerializer(
+            cart_items, many=True, context={"request": request}
+        )
+        return Response({"version": version, "items": serializer.data})
 
     @action(detail=False, methods=["delete"])
     def clear(self, request):
         """Очистить корзину"""
-        telegram_id = request.query_params.get("telegram_id")
-        if not telegram_id:
-            return Response(
-                {"error": "telegram_id обязателен"}, status=status.HTTP_400_BAD_REQUEST
-            )
-
-        try:
-            # Преобразуем telegram_id в число
-            telegram_id = int(telegram_id)
-            user = User.objects.get(telegram_id=telegram_id)
-            CartItem.objects.filter(user=user).delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        except (ValueError, User.DoesNotExist):
-            return Response(
-                {"error": "Пользователь не найден"}, status=status.HTTP_404_NOT_FOUND
-            )
+        user = self.get_telegram_user()
+        if user is None:
+            return self.telegram_user_missing()
+        CartItem.objects.filter(user=user).delete()
+        cart.bump_version(user.pk)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=False, methods=["get"])
     def by_telegram_id(self, request):
         """Получить корзину по telegram_id"""
-        telegram_id = request.query_params.get("telegram_id")
-        if not telegram_id:
-            return Response(
-                {"error": "telegram_id обязателен"}, status=status.HTTP_400_BAD_REQUEST
-            )
-
-        try:
-            # Преобразуем telegram_id в число
-            telegram_id = int(telegram_id)
-            user = User.objects.get(telegram_id=telegram_id)
-            cart_items = CartItem.objects.filter(user=user)
-            serializer = CartItemSerializer(
-                cart_items, many=True, context={"request": request}
-            )
-            return Response(serializer.data)
-        except (ValueError, User.DoesNotExist):
-            return Response([])
+        user = self.get_telegram_user()
+        if user is None:
+            return self.telegram_user_missing(not_found=[])
+        cart_items = CartItem.objects.filter(user=user).with_product()
+        serializer = CartItemSerializer(
+            cart_items, many=True, context={"request": request}
+        )
+        return Response(serializer.data)
 
 
-class FavoriteViewSet(viewsets.ModelViewSet):
+class FavoriteViewSet(TelegramUserMixin, IdempotentMixin, viewsets.ModelViewSet):
     serializer_class = FavoriteSerializer
     permission_classes = [permissions.AllowAny]  # Разрешаем доступ для Telegram WebApp
 
     def get_queryset(self):
-        # Получаем telegram_id из query параметров
-        telegram_id = self.request.query_params.get("telegram_id")
-        if telegram_id:
-            try:
-                # Преобразуем telegram_id в число
-                telegram_id = int(telegram_id)
-                user = User.objects.get(telegram_id=telegram_id)
-                return Favorite.objects.filter(user=user)
-            except (ValueError, User.DoesNotExist):
-                return Favorite.objects.none()
-        return Favorite.objects.none()
+        user = self.get_telegram_user()
+        if user is None:
+            return Favorite.objects.none()
+        return Favorite.objects.filter(user=user).with_product()
+
+    def get_serializer_class(self):
+        if self.action == "create":
+            return FavoriteCreateSerializer
+        return FavoriteSerializer
 
     def perform_create(self, serializer):
-        # Получаем telegram_id из данных запроса
-        telegram_id = self.request.data.get("telegram_id")
-        if telegram_id:
-            try:
-                # Преобразуем telegram_id в число
-                telegram_id = int(telegram_id)
-                user, created = User.objects.get_or_create(telegram_id=telegram_id)
+        user = self.get_telegram_user(self.request.data, create=True)
+        if user is None:
+            raise serializers.ValidationError({"telegram_id": "telegram_id обязателен"})
+        # telegram_id нужен только для поиска пользователя, в модели его нет
+        serializer.validated_data.pop("telegram_id", None)
+        try:
+            with transaction.atomic():
                 serializer.save(user=user)
-                print(f"Favorite created successfully for user {user.telegram_id}")
-            except ValueError as e:
-                print(f"ValueError in perform_create: {e}")
-                raise
-        else:
-            print("No telegram_id provided")
-            raise ValueError("telegram_id is required")
+        except IntegrityError:
+            # Товар уже в избранном: повтор без Idempotency-Key не ошибка
+            serializer.instance = Favorite.objects.get(
+                user=user, product=serializer.validated_data["product"]
+            )
+            self.favorite_existed = True
+
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        if getattr(self, "favorite_existed", False):
+            response.status_code = status.HTTP_200_OK
+        return response
 
     @action(detail=True, methods=["get"])
     def check(self, request, pk=None):
         """Проверить, есть ли товар в избранном"""
-        telegram_id = request.query_params.get("telegram_id")
-        if not telegram_id:
-            return Response(
-                {"error": "telegram_id обязателен"}, status=status.HTTP_400_BAD_REQUEST
+        user = self.get_telegram_user()
+        if user is None:
+            return self.telegram_user_missing(not_found={"is_favorite": False})
+        is_favorite = Favorite.objects.filter(user=user, product_id=pk).exists()
+        return Response({"is_favorite": is_favorite})
+
+    @action(detail=False, methods=["get"])
+    def ids(self, request):
+        """
+        id товаров в избранном с версией: для отметок на карточках.
+
+        `?encoding=bitmap` — битовая карта в base64 вместо списка; при
+        совпадении If-None-Match с версией отдается 304.
+        """
+        user = self.get_telegram_user()
+        if user is None:
+            return self.telegram_user_missing(not_found={"version": "", "ids": []})
+
+        version = favorites.get_version(user.pk)
+        etag = quote_etag(f"favorites-{version}")
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            version, ids = favorites.get_favorite_ids(user.pk, version)
+            if request.query_params.get("encoding") == "bitmap":
+                data = {"version": version, "bitmap": favorites.encode_bitmap(ids)}
+            else:
+                data = {"version": version, "ids": ids}
+            response = Response(data)
+        response.headers["ETag"] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    @action(detail=False, methods=["get"])
+    def check_many(self, request):
+        """Проверить несколько товаров сразу: ?product_ids=1,2,3"""
+        product_ids = favorites.parse_ids(request.query_params.get("product_ids"))
+        user = self.get_telegram_user()
+        if user is None:
+            return self.telegram_user_missing(
+                not_found={
+                    "version": "",
+                    "favorites": {str(pk): False for pk in product_ids},
+                }
             )
 
-        try:
-            # Преобразуем telegram_id в число
-            telegram_id = int(telegram_id)
-            user = User.objects.get(telegram_id=telegram_id)
-            is_favorite = Favorite.objects.filter(user=user, product_id=pk).exists()
-            return Response({"is_favorite": is_favorite})
-        except (ValueError, User.DoesNotExist):
-            return Response({"is_favorite": False})
+        version, ids = favorites.get_favorite_ids(user.pk)
+        ids = set(ids)
+        return Response(
+            {
+                "version": version,
+                "favorites": {str(pk): pk in ids for pk in product_ids},
+            }
+        )
 
     @action(detail=False, methods=["get"])
     def by_telegram_id(self, request):
         """Получить избранные товары по telegram_id"""
-        telegram_id = request.query_params.get("telegram_id")
-        if not telegram_id:
-            return Response(
-                {"error": "telegram_id обязателен"}, status=status.HTTP_400_BAD_REQUEST
-            )
-
-        try:
-            # Преобразуем telegram_id в число
-            telegram_id = int(telegram_id)
-            user = User.objects.get(telegram_id=telegram_id)
-            favorites = Favorite.objects.filter(user=user)
-            serializer = FavoriteSerializer(
-                favorites, many=True, context={"request": request}
-            )
-            return Response(serializer.data)
-        except (ValueError, User.DoesNotExist):
-            return Response([])
+        user = self.get_telegram_user()
+        if user is None:
+            return self.telegram_user_missing(not_found=[])
+        queryset = Favorite.objects.filter(user=user).with_product()
+        serializer = FavoriteSerializer(
+            queryset, many=True, context={"request": request}
+        )
+        return Response(serializer.data)
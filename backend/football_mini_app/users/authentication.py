@@ -0,0 +1,92 @@
+from django.conf import settings
+from rest_framework import exceptions, status
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.response import Response
+
+from . import identity
+
+# Authorization: tma <initData> (как в документации Telegram Mini Apps)
+AUTH_SCHEME = "tma"
+INIT_DATA_HEADER = "X-Telegram-Init-Data"
+
+
+class TelegramInitDataAuthentication(BaseAuthentication):
+    """
+    Аутентификация по initData Telegram WebApp.
+
+    initData передается в заголовке `Authorization: tma <initData>` или
+    `X-Telegram-Init-Data`. Подпись проверяется токеном бота, результат
+    кэшируется (см. users/identity.py), и request.user доступен без
+    запроса к БД на каждый вызов.
+    """
+
+    def authenticate(self, request):
+        init_data = self.get_init_data(request)
+        bot_token = getattr(settings, "TELEGRAM_BOT_TOKEN", "")
+        if not init_data or not bot_token:
+            return None
+
+        try:
+            user = identity.user_for_init_data(init_data, bot_token)
+        except identity.InvalidInitData as e:
+            raise exceptions.AuthenticationFailed(str(e))
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed("Пользователь заблокирован")
+        return user, None
+
+    def authenticate_header(self, request):
+        return AUTH_SCHEME
+
+    def get_init_data(self, request):
+        authorization = request.headers.get("Authorization", "")
+        scheme, _, value = authorization.partition(" ")
+        if scheme.lower() == AUTH_SCHEME:
+            return value.strip()
+        return request.headers.get(INIT_DATA_HEADER, "")
+
+
+class TelegramUserMixin:
+    """
+    Пользователь запроса для viewset'ов Telegram WebApp.
+
+    Берется из request.user (подписанная initData), а для старых клиентов —
+    по telegram_id из параметров или тела запроса, через тот же кэш.
+    """
+
+    def get_telegram_user(self, source=None, create=False):
+        user = self.request.user
+        if user.is_authenticated and getattr(user, "telegram_id", None) is not None:
+            return user
+        if identity.auth_required():
+            return None
+
+        if source is None:
+            source = self.request.query_params
+        try:
+            telegram_id = int(source.get("telegram_id"))
+        except (TypeError, ValueError):
+            return None
+        return identity.user_for_telegram_id(telegram_id, create=create)
+
+    def telegram_user_missing(self, source=None, not_found=None):
+        """
+        Ответ, когда пользователя нет: 401, если нужна initData, 400 без
+        telegram_id, иначе not_found (200) или 404.
+        """
+        if identity.auth_required():
+            return Response(
+                {"error": "Требуется авторизация Telegram"},
+                status=status.HTTP_401_UNAUTHORIZED,
+            )
+        if source is None:
+            source = self.request.query_params
+        if not source.get("telegram_id"):
+            return Response(
+                {"error": "telegram_id обязателен"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not_found is not None:
+            return Response(not_found)
+        return Response(
+            {"error": "Пользователь не найден"}, status=status.HTTP_404_NOT_FOUND
+        )
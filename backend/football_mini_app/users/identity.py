@@ -0,0 +1,232 @@
+"""
+Определение пользователя запроса по Telegram.
+
+Проверенная подпись initData и найденный по telegram_id пользователь
+кэшируются в памяти процесса (LRU с ограниченным размером и временем
+жизни), поэтому повторные запросы не обращаются к таблице пользователей.
+Каждый процесс gunicorn держит свой кэш, а согласуются они версией
+пользователя в общем кэше Django: запись хранит версию, с которой она
+создана, и при попадании сверяется с текущей. Изменение пользователя
+(см. users/signals.py) меняет версию, и записи во всех процессах
+перечитываются из БД на следующем запросе.
+"""
+
+import hashlib
+import hmac
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from urllib.parse import parse_qsl
+
+from django.conf import settings
+from django.core.cache import cache as shared_cache
+from django.db import transaction
+
+from .models import User
+
+DEFAULT_CACHE_SIZE = 10000
+DEFAULT_CACHE_TTL = 5 * 60
+# initData старше суток не принимается
+DEFAULT_INIT_DATA_MAX_AGE = 24 * 60 * 60
+
+
+class InvalidInitData(Exception):
+    """initData не прошла проверку подписи или устарела"""
+
+
+class TTLCache:
+    """Потокобезопасный LRU-кэш с временем жизни записей"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, predicate):
+        """Удалить записи, для значений которых predicate истинен"""
+        with self._lock:
+            for key in [
+                key for key, (_, value) in self._data.items() if predicate(value)
+            ]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_cache = TTLCache(
+    getattr(settings, "TELEGRAM_IDENTITY_CACHE_SIZE", DEFAULT_CACHE_SIZE),
+    getattr(settings, "TELEGRAM_IDENTITY_CACHE_TTL", DEFAULT_CACHE_TTL),
+)
+
+
+def auth_required():
+    """Принимать только подписанную initData (без telegram_id в параметрах)"""
+    return getattr(settings, "TELEGRAM_AUTH_REQUIRED", False)
+
+
+def user_fields():
+    return [field.attname for field in User._meta.concrete_fields]
+
+
+def freeze(user):
+    """Значения полей пользователя для кэша"""
+    return tuple(getattr(user, field) for field in user_fields())
+
+
+def thaw(values):
+    """Новый экземпляр пользователя из кэша (без запроса к БД)"""
+    return User.from_db("default", user_fields(), values)
+
+
+def version_key(user_id):
+    return f"user-identity-version:{user_id}"
+
+
+def pk_index():
+    return user_fields().index(User._meta.pk.attname)
+
+
+def cached_user(key):
+    """Пользователь из кэша процесса, если его версия не устарела"""
+    entry = _cache.get(key)
+    if entry is None:
+        return None
+    version, values = entry
+    if shared_cache.get(version_key(values[pk_index()])) != version:
+        return None
+    return thaw(values)
+
+
+def remember(user, *entries):
+    """Запомнить пользователя под ключами entries: (ключ, ttl)"""
+    version = shared_cache.get(version_key(user.pk))
+    values = freeze(user)
+    for key, ttl in entries:
+        _cache.set(key, (version, values), ttl)
+
+
+def validate_init_data(init_data, bot_token, max_age=None):
+    """
+    Проверить подпись initData Telegram WebApp; возвращает словарь полей.
+
+    Ключ подписи — HMAC-SHA256("WebAppData", токен бота), подписываются все
+    поля, кроме hash, в виде "key=value", отсортированные и разделенные \\n.
+    """
+    fields = dict(parse_qsl(init_data, keep_blank_values=True))
+    received_hash = fields.pop("hash", "")
+    data_check_string = "\n".join(f"{key}={fields[key]}" for key in sorted(fields))
+    secret_key = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+    expected_hash = hmac.new(
+        secret_key, data_check_string.encode(), hashlib.sha256
+    ).hexdigest()
+    if not hmac.compare_digest(expected_hash, received_hash):
+        raise InvalidInitData("Неверная подпись initData")
+
+    if max_age is None:
+        max_age = getattr(
+            settings, "TELEGRAM_INIT_DATA_MAX_AGE", DEFAULT_INIT_DATA_MAX_AGE
+        )
+    try:
+        auth_date = int(fields.get("auth_date", 0))
+        telegram_user = json.loads(fields.get("user", ""))
+        int(telegram_user["id"])
+    except (KeyError, TypeError, ValueError):
+        raise InvalidInitData("Неполные данные initData")
+    if max_age and time.time() - auth_date > max_age:
+        raise InvalidInitData("initData устарела")
+    fields["auth_date"] = auth_date
+    fields["user"] = telegram_user
+    return fields
+
+
+def user_for_init_data(init_data, bot_token):
+    """Пользователь по подписанной initData; создается при первом входе"""
+    key = ("init_data", hashlib.sha256(init_data.encode()).hexdigest())
+    user = cached_user(key)
+    if user is not None:
+        return user
+
+    fields = validate_init_data(init_data, bot_token)
+    telegram_user = fields["user"]
+    user, _ = User.objects.get_or_create(
+        telegram_id=int(telegram_user["id"]),
+        defaults={
+            "username": telegram_user.get("username"),
+            "first_name": telegram_user.get("first_name"),
+            "last_name": telegram_user.get("last_name"),
+        },
+    )
+    if not user.is_active:
+        return user
+
+    max_age = getattr(settings, "TELEGRAM_INIT_DATA_MAX_AGE", DEFAULT_INIT_DATA_MAX_AGE)
+    ttl = None
+    if max_age:
+        # Запись не переживает срок действия самой initData
+        ttl = max(0, fields["auth_date"] + max_age - time.time())
+    remember(user, (key, ttl), (("telegram_id", user.telegram_id), None))
+    return user
+
+
+def user_for_telegram_id(telegram_id, create=False):
+    """Пользователь по telegram_id из параметров запроса (старые клиенты)"""
+    key = ("telegram_id", telegram_id)
+    user = cached_user(key)
+    if user is not None:
+        return user
+
+    if create:
+        user, _ = User.objects.get_or_create(telegram_id=telegram_id)
+    else:
+        user = User.objects.filter(telegram_id=telegram_id).first()
+        if user is None:
+            # Отсутствие не кэшируется: пользователь может зарегистрироваться
+            return None
+    remember(user, (key, None))
+    return user
+
+
+def forget(user_id):
+    """Сбросить записи пользователя во всех процессах"""
+    bump_version(user_id)
+    # Процесс, прочитавший строку до коммита, запомнит ее со старой версией
+    transaction.on_commit(lambda: bump_version(user_id))
+    index = pk_index()
+    _cache.discard(lambda entry: entry[1][index] == user_id)
+
+
+def bump_version(user_id):
+    # Версия живет дольше записей с прежней версией в кэшах процессов
+    shared_cache.set(version_key(user_id), uuid.uuid4().hex, _cache.ttl * 2)
+
+
+def clear():
+    _cache.clear()
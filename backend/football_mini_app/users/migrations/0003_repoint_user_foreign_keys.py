@@ -0,0 +1,67 @@
+"""
+Перевод внешних ключей на users.User в базах, созданных до AUTH_USER_MODEL.
+
+Пока AUTH_USER_MODEL не был задан, миграции создавали ссылки на
+пользователя (корзина, избранное, заказы, журнал админки) на таблицу
+auth_user. Состояние миграций после переключения уже считает их ссылками на
+users.User, поэтому здесь по фактической схеме БД находятся колонки, которые
+все еще ссылаются на другую таблицу, и пересоздаются на users_user. В новых
+базах таких колонок нет и миграция ничего не делает.
+"""
+
+from django.db import migrations, models
+
+
+def user_foreign_keys(apps, user_model):
+    for model in apps.get_models():
+        for field in model._meta.local_fields:
+            if field.is_relation and field.related_model is user_model:
+                yield model, field
+
+
+def repoint_user_foreign_keys(apps, schema_editor):
+    connection = schema_editor.connection
+    User = apps.get_model("users", "User")
+    AuthUser = apps.get_model("auth", "User")
+    stale = []
+    with connection.cursor() as cursor:
+        for model, field in user_foreign_keys(apps, User):
+            relations = connection.introspection.get_relations(
+                cursor, model._meta.db_table
+            )
+            target = relations.get(field.column)
+            if target is not None and target[1] != User._meta.db_table:
+                stale.append((model, field))
+
+    for model, field in stale:
+        # Строки, чьих пользователей нет в users_user, нарушат новый ключ
+        orphans = model._base_manager.exclude(
+            **{f"{field.attname}__in": User._base_manager.values("pk")}
+        ).count()
+        if orphans:
+            raise RuntimeError(
+                f"{model._meta.db_table}.{field.column}: ссылок на пользователей "
+                f"auth_user, которых нет в users_user, — {orphans}. "
+                "Перенесите или удалите эти строки и повторите migrate."
+            )
+
+    for model, field in stale:
+        old_field = models.ForeignKey(AuthUser, on_delete=field.remote_field.on_delete)
+        old_field.set_attributes_from_name(field.name)
+        old_field.model = model
+        schema_editor.alter_field(model, old_field, field)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0002_user_first_name_user_last_name_user_phone_number_and_more"),
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("admin", "0003_logentry_add_action_flag_choices"),
+        ("orders", "0003_order_stats"),
+        ("products", "0019_product_hidden_by_channel"),
+    ]
+
+    operations = [
+        migrations.RunPython(repoint_user_foreign_keys, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,151 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import json
+import time
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+from django.test import override_settings
+
+from orders.models import Order
+from products.models import Favorite
+from products.tests import CatalogTestCase, make_product
+from . import identity
+from .models import User
+
+BOT_TOKEN = "123456:test-token"
+
+
+def sign_init_data(user, auth_date=None, bot_token=BOT_TOKEN):
+    fields = {
+        "auth_date": str(int(time.time()) if auth_date is None else auth_date),
+        "query_id": "AAH",
+        "user": json.dumps(user, separators=(",", ":")),
+    }
+    data_check_string = "\n".join(f"{key}={fields[key]}" for key in sorted(fields))
+    secret_key = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+    fields["hash"] = hmac.new(
+        secret_key, data_check_string.encode(), hashlib.sha256
+    ).hexdigest()
+    return urlencode(fields)
+
+
+@override_settings(TELEGRAM_BOT_TOKEN=BOT_TOKEN)
+class TelegramAuthenticationTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.init_data = sign_init_data({"id": 777, "first_name": "Иван"})
+
+    def get_stats(self, init_data, **params):
+        return self.client.get(
+            "/api/orders/stats/",
+            params,
+            HTTP_AUTHORIZATION=f"tma {init_data}",
+        )
+
+    def test_valid_init_data_creates_user(self):
+        response = self.get_stats(self.init_data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(User.objects.get(telegram_id=777).first_name, "Иван")
+
+    def test_user_is_cached_between_requests(self):
+        user = User.objects.create(telegram_id=777)
+        Order.objects.create(user=user, total_amount=100)
+        self.get_stats(self.init_data)
+
+        # Только строка сводки статистики, без поиска пользователя
+        with self.assertNumQueries(1):
+            response = self.get_stats(self.init_data)
+        self.assertEqual(response.json()["total_orders"], 1)
+
+    def test_init_data_wins_over_telegram_id(self):
+        User.objects.create(telegram_id=888)
+        response = self.get_stats(self.init_data, telegram_id=888)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["total_orders"], 0)
+        self.assertTrue(User.objects.filter(telegram_id=777).exists())
+
+    def test_idempotency_keys_are_per_user(self):
+        product = make_product()
+        responses = [
+            self.client.post(
+                "/api/favorites/",
+                {"product": product.pk},
+                format="json",
+                HTTP_AUTHORIZATION=f"tma {init_data}",
+                HTTP_IDEMPOTENCY_KEY="same-key",
+            )
+            for init_data in (self.init_data, sign_init_data({"id": 778}))
+        ]
+        self.assertEqual([response.status_code for response in responses], [201, 201])
+        self.assertNotIn("Idempotent-Replayed", responses[1].headers)
+        self.assertEqual(
+            sorted(Favorite.objects.values_list("user__telegram_id", flat=True)),
+            [777, 778],
+        )
+
+    def test_bad_signature(self):
+        init_data = sign_init_data({"id": 777}, bot_token="other:token")
+        response = self.get_stats(init_data)
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(User.objects.filter(telegram_id=777).exists())
+
+    def test_expired_init_data(self):
+        init_data = sign_init_data({"id": 777}, auth_date=int(time.time()) - 2 * 86400)
+        self.assertEqual(self.get_stats(init_data).status_code, 401)
+
+    def test_blocked_user_is_rejected(self):
+        User.objects.create(telegram_id=777, is_active=False)
+        self.assertEqual(self.get_stats(self.init_data).status_code, 401)
+
+    def test_legacy_telegram_id_is_cached(self):
+        User.objects.create(telegram_id=999)
+        self.client.get("/api/orders/stats/?telegram_id=999")
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/orders/stats/?telegram_id=999")
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(TELEGRAM_AUTH_REQUIRED=True)
+    def test_auth_required_ignores_telegram_id(self):
+        User.objects.create(telegram_id=999)
+        response = self.client.get("/api/orders/stats/?telegram_id=999")
+        self.assertEqual(response.status_code, 401)
+
+    def test_user_change_drops_cached_identity(self):
+        user = User.objects.create(telegram_id=999)
+        self.client.get("/api/orders/stats/?telegram_id=999")
+        user.is_active = False
+        user.save()
+        self.assertIsNone(identity._cache.get(("telegram_id", 999)))
+
+    def test_user_change_reaches_other_processes(self):
+        user = User.objects.create(telegram_id=999)
+        self.client.get("/api/orders/stats/?telegram_id=999")
+        # Запись в кэше другого процесса: локальный сброс до нее не доходит
+        entry = identity._cache.get(("telegram_id", 999))
+        user.is_active = False
+        user.save()
+        identity._cache.set(("telegram_id", 999), entry)
+
+        self.assertFalse(identity.user_for_telegram_id(999).is_active)
+        with self.assertNumQueries(0):
+            self.assertFalse(identity.user_for_telegram_id(999).is_active)
+
+
+class TTLCacheTests(CatalogTestCase):
+    def test_evicts_least_recently_used(self):
+        cache = identity.TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(len(cache), 2)
+
+    def test_entries_expire(self):
+        cache = identity.TTLCache(maxsize=2, ttl=60)
+        with mock.patch("users.identity.time.monotonic", return_value=1000):
+            cache.set("a", 1)
+        with mock.patch("users.identity.time.monotonic", return_value=1061):
+            self.assertIsNone(cache.get("a"))
@@ -112,6 +112,15 @@ const AppContent: React.FC = () => {
     const handleProductClick = (product: Product) => {
         setSelectedProduct(product);
         setIsProductModalOpen(true);
+
+        // В сетке только поля карточки (fields=card), полный товар догружаем
+        if (product.description === undefined) {
+            apiService.getProduct(product.id)
+                .then(fullProduct => setSelectedProduct(current =>
+                    current?.id === fullProduct.id ? fullProduct : current
+                ))
+                .catch(error => console.error('Ошибка загрузки продукта:', error));
+        }
     };
 
     const closeProductModal = () => {
@@ -1,6 +1,9 @@
 import React from 'react';
 import { Product } from '../services/api';
 
+// Ширина карточки по колонкам сетки (см. ProductGrid): браузер берет нужную копию
+const CARD_SIZES = '(min-width: 1280px) 25vw, (min-width: 1024px) 33vw, (min-width: 640px) 50vw, 100vw';
+
 interface ProductCardProps {
     product: Product;
     onClick: () => void;
@@ -16,6 +19,8 @@ export const ProductCard: React.FC<ProductCardProps> = ({
     onToggleFavorite,
     isFavorite
 }) => {
+    const cover = product.images[0];
+
     const handleAddToCart = (e: React.MouseEvent) => {
         e.stopPropagation();
         onAddToCart(product);
@@ -32,12 +37,36 @@ export const ProductCard: React.FC<ProductCardProps> = ({
             onClick={onClick}
         >
             {/* Image */}
-            <div className="relative aspect-square overflow-hidden">
-                <img
-                    src={product.images[0]?.image_url || '/placeholder-image.jpg'}
-                    alt={product.name}
-                    className="w-full h-full object-cover transition-transform duration-300 hover:scale-105"
-                />
+            <div
+                className="relative aspect-square overflow-hidden"
+                style={{ backgroundColor: cover?.dominant_color || undefined }}
+            >
+                {/* Размытая заглушка из ответа API, пока грузится фото */}
+                {cover?.placeholder && (
+                    <div
+                        aria-hidden="true"
+                        className="absolute inset-0 scale-110 blur-lg bg-cover bg-center"
+                        style={{ backgroundImage: `url(${cover.placeholder})` }}
+                    />
+                )}
+                <picture>
+                    {cover?.srcset?.avif && (
+                        <source type="image/avif" srcSet={cover.srcset.avif} sizes={CARD_SIZES} />
+                    )}
+                    {cover?.srcset?.webp && (
+                        <source type="image/webp" srcSet={cover.srcset.webp} sizes={CARD_SIZES} />
+                    )}
+                    <img
+                        src={cover?.image_url || '/placeholder-image.jpg'}
+                        srcSet={cover?.srcset?.jpeg}
+                        sizes={CARD_SIZES}
+                        width={cover?.width ?? undefined}
+                        height={cover?.height ?? undefined}
+                        alt={product.name}
+                        loading="lazy"
+                        className="relative w-full h-full object-cover transition-transform duration-300 hover:scale-105"
+                    />
+                </picture>
 
                 {/* Badges */}
                 <div className="absolute top-2 left-2 flex flex-col gap-1">
@@ -31,6 +31,13 @@ export interface Product {
         id: number;
         image: string;
         image_url: string;
+        // Уменьшенные копии по форматам: "url 200w, url 400w"
+        srcset?: Partial<Record<'avif' | 'webp' | 'jpeg', string>>;
+        // Размеры, основной цвет и крошечная заглушка (data URI) до загрузки фото
+        width?: number | null;
+        height?: number | null;
+        dominant_color?: string;
+        placeholder?: string;
         created_at: string;
     }>;
     images_count: number;
@@ -47,6 +54,8 @@ export interface FilterOptions {
     season: string[];
     condition: string[];
     size: string[];
+    counts?: Record<keyof Filters, Array<{ value: string; count: number }>>;
+    version?: number;
 }
 
 export interface Filters {
@@ -67,6 +76,13 @@ export interface CartItem {
     updated_at: string;
 }
 
+export interface CartOperation {
+    op: 'add' | 'increment' | 'set' | 'remove';
+    product: number;
+    selected_size: string;
+    quantity?: number;
+}
+
 export interface Favorite {
     id: number;
     product: Product;
@@ -100,12 +116,15 @@ class ApiService {
         options: RequestInit = {}
     ): Promise<T> {
         const url = `${API_BASE_URL}${endpoint}`;
+        // Подписанная initData Telegram: по ней сервер определяет пользователя
+        const initData = window.Telegram?.WebApp?.initData;
         const response = await fetch(url, {
+            ...options,
             headers: {
                 'Content-Type': 'application/json',
+                ...(initData ? { Authorization: `tma ${initData}` } : {}),
                 ...options.headers,
             },
-            ...options,
         });
 
         if (!response.ok) {
@@ -115,6 +134,26 @@ class ApiService {
         return response.json();
     }
 
+    // POST с заголовком Idempotency-Key: при сетевой ошибке запрос повторяется
+    // с тем же ключом, и сервер возвращает первый ответ, не выполняя его заново
+    private async postIdempotent<T>(endpoint: string, body: unknown, retries = 2): Promise<T> {
+        const idempotencyKey = crypto.randomUUID();
+        for (let attempt = 0; ; attempt++) {
+            try {
+                return await this.request<T>(endpoint, {
+                    method: 'POST',
+                    body: JSON.stringify(body),
+                    headers: { 'Idempotency-Key': idempotencyKey },
+                });
+            } catch (error) {
+                // fetch бросает TypeError, только если ответ не получен
+                if (!(error instanceof TypeError) || attempt >= retries) {
+                    throw error;
+                }
+            }
+        }
+    }
+
     // Продукты
     async getProducts(filters?: Partial<Filters>, search?: string): Promise<Product[]> {
         try {
@@ -162,6 +201,8 @@ class ApiService {
             }
 
             if (search) params.append('search', search);
+            // Сетке нужны только поля карточки; полный товар грузит getProduct
+            params.append('fields', 'card');
 
             const queryString = params.toString();
             const endpoint = `/products/${queryString ? `?${queryString}` : ''}`;
@@ -190,7 +231,7 @@ class ApiService {
                 return [];
             }
 
-            return this.request<CartItem[]>(`/cart/by_telegram_id/?telegram_id=${telegramId}`);
+            return this.request<CartItem[]>(`/cart/by_telegram_id/?telegram_id=${telegramId}&fields=card`);
         } catch (error) {
             console.error('Error fetching cart:', error);
             return [];
@@ -243,14 +284,11 @@ class ApiService {
                 return mockCartItem;
             }
 
-            return this.request<CartItem>('/cart/', {
-                method: 'POST',
-                body: JSON.stringify({
-                    telegram_id: telegramId,
-                    product: productId,
-                    quantity,
-                    selected_size: selectedSize,
-                }),
+            return this.postIdempotent<CartItem>('/cart/', {
+                telegram_id: telegramId,
+                product: productId,
+                quantity,
+                selected_size: selectedSize,
             });
         } catch (error) {
             console.error('Error adding to cart:', error);
@@ -271,6 +309,17 @@ class ApiService {
         });
     }
 
+    // Несколько изменений корзины одним запросом; ответ — новая корзина и ее версия
+    async batchCart(
+        telegramId: number,
+        operations: CartOperation[]
+    ): Promise<{ version: number; items: CartItem[] }> {
+        return this.postIdempotent<{ version: number; items: CartItem[] }>('/cart/batch/', {
+            telegram_id: telegramId,
+            operations,
+        });
+    }
+
     async clearCart(telegramId: number): Promise<void> {
         return this.request<void>(`/cart/clear/?telegram_id=${telegramId}`, {
             method: 'DELETE',
@@ -286,7 +335,7 @@ class ApiService {
                 return [];
             }
 
-            return this.request<Favorite[]>(`/favorites/by_telegram_id/?telegram_id=${telegramId}`);
+            return this.request<Favorite[]>(`/favorites/by_telegram_id/?telegram_id=${telegramId}&fields=card`);
         } catch (error) {
             console.error('Error fetching favorites:', error);
             return [];
@@ -336,12 +385,9 @@ class ApiService {
                 return mockFavorite;
             }
 
-            return this.request<Favorite>('/favorites/', {
-                method: 'POST',
-                body: JSON.stringify({
-                    telegram_id: telegramId,
-                    product: productId,
-                }),
+            return this.postIdempotent<Favorite>('/favorites/', {
+                telegram_id: telegramId,
+                product: productId,
             });
         } catch (error) {
             console.error('Error adding to favorites:', error);
@@ -359,6 +405,20 @@ class ApiService {
         return this.request<{ is_favorite: boolean }>(`/favorites/${productId}/check/?telegram_id=${telegramId}`);
     }
 
+    // id избранных товаров с версией (для отметок на карточках без вложенных товаров)
+    async getFavoriteIds(telegramId: number): Promise<{ version: string; ids: number[] }> {
+        return this.request<{ version: string; ids: number[] }>(`/favorites/ids/?telegram_id=${telegramId}`);
+    }
+
+    async checkFavorites(
+        telegramId: number,
+        productIds: number[]
+    ): Promise<{ version: string; favorites: Record<string, boolean> }> {
+        return this.request<{ version: string; favorites: Record<string, boolean> }>(
+            `/favorites/check_many/?telegram_id=${telegramId}&product_ids=${productIds.join(',')}`
+        );
+    }
+
     // Заказы
     async createOrder(telegramId: number, shippingAddress: string, phoneNumber: string, notes?: string): Promise<Order> {
         try {
@@ -383,14 +443,11 @@ class ApiService {
                 return mockOrder;
             }
 
-            return this.request<Order>('/orders/create_from_cart/', {
-                method: 'POST',
-                body: JSON.stringify({
-                    telegram_id: telegramId,
-                    shipping_address: shippingAddress,
-                    phone_number: phoneNumber,
-                    notes: notes || '',
-                }),
+            return this.postIdempotent<Order>('/orders/create_from_cart/', {
+                telegram_id: telegramId,
+                shipping_address: shippingAddress,
+                phone_number: phoneNumber,
+                notes: notes || '',
             });
         } catch (error) {
             console.error('Error creating order:', error);
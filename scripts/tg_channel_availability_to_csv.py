@@ -1,14 +1,48 @@
 """
 Парсит посты из канала rooneyform_warehouse, сохраняет данные в CSV и фотографии постов с UUID.
 Добавляет ссылку на пост и дату публикации.
+
+Синхронизация инкрементальная: в sync_state.json хранятся id последнего
+обработанного поста и хэши содержимого постов. Отметка не заходит за пост
+с несохраненными фото, а файл пишется только после прогона целиком.
+Повторный запуск запрашивает только посты новее (min_id) и перепроверяет
+последние --recheck постов на правки; фото, уже лежащие на диске, не
+скачиваются. CSV собирается из состояния, а не из одного прогона. --full —
+полная пересинхронизация.
+
+Альбомы собираются по grouped_id из того же прохода iter_messages, поэтому
+каждое сообщение запрашивается один раз; соседи дочитываются отдельным
+запросом по id только у альбомов на границах прохода. В конце выводится
+число запросов к API за прогон.
+
+Скачивание фото — конвейер на asyncio: посты читаются и разбираются, а фото
+ставятся в ограниченную очередь, которую разбирают --workers загрузчиков.
+Полная очередь приостанавливает чтение канала (backpressure). FloodWait
+останавливает всех загрузчиков на указанное Telegram время со случайной
+добавкой, сетевые ошибки повторяются с экспоненциальной паузой со
+случайным разбросом. Прогресс печатается раз в --progress-interval секунд.
+--fake N прогоняет конвейер на канале в памяти (tg_fake_client.py) без сети.
+
+Колонка «Статус» отражает состояние поста в канале: «в наличии», «продано»
+(в тексте есть отметка «продано») или «удален» (поста больше нет среди
+перечитанных). По ней наличие в магазине сверяет команда
+reconcile_availability.
 """
 
-from telethon.sync import TelegramClient
-from telethon.tl.types import Message, MessageMediaPhoto
+from telethon import TelegramClient
+from telethon.errors import FloodWaitError
 import pandas as pd
+import argparse
+import asyncio
+import hashlib
+import json
+import random
 import re
 import os
+import tempfile
+import time
 import uuid
+from collections import Counter
 from datetime import datetime
 
 # Данные для доступа к Telegram API: https://my.telegram.org/apps
@@ -19,6 +53,46 @@ channel_username = "rooneyform_warehouse"  # Имя канала для парс
 
 # Папка для сохранения фотографий
 PHOTOS_DIR = "photos"
+CSV_PATH = "football_jerseys.csv"
+# Состояние инкрементальной синхронизации
+STATE_PATH = "sync_state.json"
+# Сколько постов читать при первом (или полном) прогоне
+FULL_SYNC_LIMIT = 1000
+# Сколько последних уже обработанных постов перепроверять на правки
+RECHECK_LIMIT = 200
+# Больше сообщений в альбоме Telegram не бывает
+ALBUM_MAX_SIZE = 10
+# Параллельные загрузки фото и очередь на каждого загрузчика
+DOWNLOAD_WORKERS = 4
+QUEUE_PER_WORKER = 4
+# Повторы загрузки: пауза BACKOFF_BASE * 2^попытка со случайным разбросом
+DOWNLOAD_ATTEMPTS = 5
+BACKOFF_BASE = 1.0
+# Случайная добавка к FloodWait, чтобы загрузчики не проснулись разом
+FLOOD_JITTER = 3.0
+PROGRESS_INTERVAL = 5.0
+# Значения колонки «Статус»
+STATUS_AVAILABLE = "в наличии"
+STATUS_SOLD = "продано"
+STATUS_DELETED = "удален"
+# Отметка о продаже, которую админ канала дописывает в пост
+SOLD_RE = re.compile(r"\bпродан[аоы]?\b", re.IGNORECASE)
+
+
+class CountingTelegramClient(TelegramClient):
+    """Клиент со счетчиком запросов к API (включая запросы частей файлов)"""
+
+    api_calls = 0
+
+    async def _call(self, sender, request, ordered=False, flood_sleep_threshold=None):
+        # Все запросы клиента, в том числе из iter_messages и download_media
+        self.api_calls += len(request) if isinstance(request, list) else 1
+        return await super()._call(
+            sender,
+            request,
+            ordered=ordered,
+            flood_sleep_threshold=flood_sleep_threshold,
+        )
 
 
 # Функция для извлечения данных из текста поста
@@ -114,120 +188,477 @@ def generate_product_uuid(data):
     return str(uuid.uuid5(uuid.NAMESPACE_DNS, base))
 
 
-# Функция для сохранения всех фотографий из поста (альбома или одиночных)
-def save_photos(client, message, product_uuid):
+def post_url(message_id):
+    return f"https://t.me/{channel_username}/{message_id}"
+
+
+def generate_photo_uuid(message_id):
+    """UUID фото по посту: повторный прогон находит уже скачанный файл"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, post_url(message_id)))
+
+
+def content_hash(messages):
+    """Хэш текста и фото поста: по нему находятся отредактированные посты"""
+    text = next((message.text for message in messages if post_text(message)), "")
+    photos = [
+        str(message.photo.id) for message in messages if getattr(message, "photo", None)
+    ]
+    content = f"{text}|{','.join(photos)}"
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def post_text(message):
+    # У служебных сообщений канала текста нет
+    return getattr(message, "text", None)
+
+
+def same_album(group, message):
+    grouped_id = getattr(message, "grouped_id", None)
+    return bool(grouped_id) and grouped_id == getattr(group[0], "grouped_id", None)
+
+
+def iter_groups(messages):
     """
-    Исправлено: теперь сохраняет абсолютно все фотографии, связанные с постом, включая альбомы.
+    Посты из одного прохода iter_messages: сообщения альбома идут подряд и
+    собираются в одну группу по grouped_id, одиночные посты — группы из одного.
     """
-    photo_uuids = []
-    if not os.path.exists(PHOTOS_DIR):
-        os.makedirs(PHOTOS_DIR)
-    product_dir = os.path.join(PHOTOS_DIR, product_uuid)
-    if not os.path.exists(product_dir):
-        os.makedirs(product_dir)
-
-    # Список для хранения id сообщений, чтобы не сохранять одну и ту же фотографию дважды
-    saved_message_ids = set()
-
-    # Если это альбом (группа сообщений)
-    if hasattr(message, "grouped_id") and message.grouped_id:
-        # Получаем все сообщения с тем же grouped_id (альбом)
-        # Важно: reverse=False, чтобы идти от старых к новым (правильный порядок)
-        for msg in client.iter_messages(
-            channel_username, min_id=0, max_id=message.id + 20, reverse=False
-        ):
-            if getattr(msg, "grouped_id", None) == message.grouped_id:
-                if msg.media and isinstance(msg.media, MessageMediaPhoto):
-                    if msg.id not in saved_message_ids:
-                        photo_uuid = str(uuid.uuid4())
-                        file_path = os.path.join(product_dir, f"{photo_uuid}.jpg")
-                        client.download_media(msg, file=file_path)
-                        photo_uuids.append(photo_uuid)
-                        saved_message_ids.add(msg.id)
-            # Останавливаемся, если id сообщения больше, чем у текущей группы (оптимизация)
-            if getattr(msg, "id", 0) > message.id + 20:
-                break
-
-    # Также проверяем текущее сообщение (на случай если оно не в альбоме или не было обработано)
-    if message.media and isinstance(message.media, MessageMediaPhoto):
-        if message.id not in saved_message_ids:
-            photo_uuid = str(uuid.uuid4())
-            file_path = os.path.join(product_dir, f"{photo_uuid}.jpg")
-            client.download_media(message, file=file_path)
-            photo_uuids.append(photo_uuid)
-            saved_message_ids.add(message.id)
-    elif hasattr(message, "photo") and message.photo:
-        if message.id not in saved_message_ids:
-            photo_uuid = str(uuid.uuid4())
-            file_path = os.path.join(product_dir, f"{photo_uuid}.jpg")
-            client.download_media(message, file=file_path)
-            photo_uuids.append(photo_uuid)
-            saved_message_ids.add(message.id)
-    elif (
-        hasattr(message, "media")
-        and hasattr(message.media, "webpage")
-        and hasattr(message.media.webpage, "photo")
-    ):
-        photo_uuid = str(uuid.uuid4())
-        file_path = os.path.join(product_dir, f"{photo_uuid}.jpg")
-        client.download_media(message.media.webpage.photo, file=file_path)
-        photo_uuids.append(photo_uuid)
-
-    return photo_uuids
+    group = []
+    for message in messages:
+        if group and not same_album(group, message):
+            yield group
+            group = []
+        group.append(message)
+    if group:
+        yield group
 
 
-# Основная функция парсинга
-def parse_telegram_channel():
-    with TelegramClient("session_name", api_id, api_hash) as client:
-        posts_data = []
-
-        # Получаем последние 1000 постов (можно увеличить)
-        for message in client.iter_messages(channel_username, limit=1000):
-            if isinstance(message, Message) and message.text:
-                post_data = parse_post(message.text)
-                product_uuid = generate_product_uuid(post_data)
-                post_data["UUID"] = product_uuid
-
-                # Сохраняем фотографии и получаем их UUID
-                photo_uuids = save_photos(client, message, product_uuid)
-                post_data["UUID_фотографий"] = (
-                    ",".join(photo_uuids) if photo_uuids else ""
-                )
+async def complete_album(client, group):
+    """
+    Дочитать альбом, разрезанный границей прохода (limit, min_id, max_id):
+    один запрос по диапазону id вокруг уже известных сообщений.
+    """
+    grouped_id = getattr(group[0], "grouped_id", None)
+    if not grouped_id:
+        return group
+    known = {message.id for message in group}
+    ids = [
+        message_id
+        for message_id in range(
+            max(1, min(known) - ALBUM_MAX_SIZE + 1), max(known) + ALBUM_MAX_SIZE
+        )
+        if message_id not in known
+    ]
+    siblings = [
+        message
+        for message in await client.get_messages(channel_username, ids=ids)
+        if message is not None and getattr(message, "grouped_id", None) == grouped_id
+    ]
+    return group + siblings
+
+
+def by_id(group):
+    return sorted(group, key=lambda message: message.id)
+
+
+async def read_posts(client, messages):
+    """
+    Группы сообщений прохода (как iter_groups), от старых к новым внутри
+    альбома. Группа отдается, как только прочитано следующее за ней
+    сообщение: пока потребитель ждет места в очереди загрузок, следующие
+    страницы канала не запрашиваются.
+    """
+    group, first = [], True
+    async for message in messages:
+        if group and not same_album(group, message):
+            if first:
+                # Разрезанными могут оказаться только крайние альбомы прохода
+                group = await complete_album(client, group)
+                first = False
+            yield by_id(group)
+            group = []
+        group.append(message)
+    if group:
+        yield by_id(await complete_album(client, group))
+
+
+def photo_media(message):
+    """Что скачивать для сообщения: само фото, фото превью ссылки или None"""
+    if getattr(message, "photo", None):
+        return message
+    webpage = getattr(getattr(message, "media", None), "webpage", None)
+    return getattr(webpage, "photo", None)
+
+
+def build_row(message, photo_uuids):
+    """Строка CSV по посту"""
+    post_data = parse_post(message.text)
+    post_data["UUID"] = generate_product_uuid(post_data)
+    post_data["UUID_фотографий"] = ",".join(photo_uuids) if photo_uuids else ""
+
+    # Добавляем ссылку на пост
+    post_data["Ссылка на пост"] = post_url(message.id)
+    post_data["Статус"] = (
+        STATUS_SOLD if SOLD_RE.search(message.text) else STATUS_AVAILABLE
+    )
 
-                # Добавляем ссылку на пост
-                try:
-                    post_data["Ссылка на пост"] = (
-                        f"https://t.me/{channel_username}/{message.id}"
-                    )
-                except Exception:
-                    post_data["Ссылка на пост"] = ""
-
-                # Добавляем дату публикации поста
-                try:
-                    if hasattr(message, "date") and message.date:
-                        # Приводим к строке в формате YYYY-MM-DD HH:MM:SS
-                        post_data["Дата публикации"] = message.date.strftime(
-                            "%Y-%m-%d %H:%M:%S"
-                        )
-                    else:
-                        post_data["Дата публикации"] = ""
-                except Exception:
-                    post_data["Дата публикации"] = ""
-
-                posts_data.append(post_data)
-
-        # Создаем DataFrame и сохраняем в CSV
-        df = pd.DataFrame(posts_data)
+    # Добавляем дату публикации поста
+    try:
+        if hasattr(message, "date") and message.date:
+            # Приводим к строке в формате YYYY-MM-DD HH:MM:SS
+            post_data["Дата публикации"] = message.date.strftime("%Y-%m-%d %H:%M:%S")
+        else:
+            post_data["Дата публикации"] = ""
+    except Exception:
+        post_data["Дата публикации"] = ""
+    return post_data
+
+
+class Metrics:
+    """Счетчики прогона для строки прогресса и итога"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.posts = Counter()
+        self.queued = 0
+        self.downloaded = 0
+        self.skipped = 0
+        self.failed = 0
+        self.bytes = 0
+        self.retries = 0
+        self.flood_waits = 0
+
+    def progress(self, queue_size, api_calls):
+        elapsed = time.perf_counter() - self.started
+        rate = self.downloaded / elapsed if elapsed else 0
+        return (
+            f"[{elapsed:6.1f} с] постов: {self.posts['new']} новых, "
+            f"{self.posts['edited']} измененных, {self.posts['deleted']} удаленных; "
+            f"фото: {self.downloaded}/"
+            f"{self.queued} ({rate:.1f}/с, {self.bytes / 2**20:.1f} МБ), "
+            f"уже на диске: {self.skipped}, ошибок: {self.failed}, "
+            f"в очереди: {queue_size}, повторов: {self.retries} "
+            f"(FloodWait: {self.flood_waits}), запросов к API: {api_calls}"
+        )
+
+
+class ChannelSync:
+    """
+    Один прогон синхронизации: чтение постов (производитель) и пул
+    загрузчиков фото, связанные ограниченной очередью.
+    """
 
+    def __init__(self, client, state, photos_dir=PHOTOS_DIR, workers=DOWNLOAD_WORKERS):
+        self.client = client
+        self.state = state
+        self.photos_dir = photos_dir
+        self.workers = workers
+        self.metrics = Metrics()
+        self.queue = asyncio.Queue(maxsize=workers * QUEUE_PER_WORKER)
+        # До этого момента (time.monotonic) загрузки стоят из-за FloodWait
+        self.resume_at = 0.0
+        # Посты с несохраненными фото: их хэш сбрасывается до следующего прогона
+        self.incomplete = set()
+
+    async def run(self, full, limit, recheck, progress_interval=PROGRESS_INTERVAL):
+        if full:
+            # Все посты разбираются заново; исчезнувшие останутся со статусом
+            # «удален», а не пропадут из выгрузки молча
+            self.state["last_message_id"] = 0
+            for post in self.state["posts"].values():
+                post["hash"] = None
+        last_message_id = self.state["last_message_id"]
+        downloaders = [
+            asyncio.create_task(self.download_worker()) for _ in range(self.workers)
+        ]
+        reporter = asyncio.create_task(self.report(progress_interval))
+        try:
+            if last_message_id:
+                # Только посты новее уже обработанного
+                messages = self.client.iter_messages(
+                    channel_username, min_id=last_message_id
+                )
+            else:
+                # Получаем последние посты (можно увеличить через --limit)
+                messages = self.client.iter_messages(channel_username, limit=limit)
+            seen = set()
+            async for group in read_posts(self.client, messages):
+                seen.update(message.id for message in group)
+                # Дочитанные соседи альбома могут быть старше прошлой отметки
+                newest = max(message.id for message in group)
+                self.state["last_message_id"] = max(
+                    self.state["last_message_id"], newest
+                )
+                await self.process_post(group)
+            if not last_message_id:
+                self.mark_deleted(seen, self.state["last_message_id"])
+
+            if last_message_id and recheck:
+                # Правки старых постов min_id не возвращает: сверяем хэши последних
+                messages = self.client.iter_messages(
+                    channel_username, max_id=last_message_id + 1, limit=recheck
+                )
+                seen = set()
+                async for group in read_posts(self.client, messages):
+                    seen.update(message.id for message in group)
+                    await self.process_post(group)
+                self.mark_deleted(seen, last_message_id)
+
+            await self.queue.join()
+        finally:
+            for task in [*downloaders, reporter]:
+                task.cancel()
+            await asyncio.gather(*downloaders, reporter, return_exceptions=True)
+        for key in self.incomplete:
+            self.state["posts"][key]["hash"] = None
+        if self.incomplete:
+            # Отметка не заходит за пост с несохраненными фото: следующий
+            # прогон прочитает его по min_id снова и докачает недостающее
+            self.state["last_message_id"] = min(
+                self.state["last_message_id"],
+                min(int(key) for key in self.incomplete) - 1,
+            )
+        return self.metrics
+
+    def mark_deleted(self, seen, newest):
+        """
+        Пометить удаленными посты из состояния, которых нет среди
+        перечитанных (seen — id сообщений прохода): от самого старого
+        прочитанного сообщения до newest.
+        """
+        if not seen:
+            return
+        oldest = min(seen)
+        for key, post in self.state["posts"].items():
+            message_id = int(key)
+            if not oldest <= message_id <= newest or message_id in seen:
+                continue
+            if post["row"].get("Статус") != STATUS_DELETED:
+                post["row"]["Статус"] = STATUS_DELETED
+                self.metrics.posts["deleted"] += 1
+
+    async def process_post(self, messages):
+        """Разобрать пост, если он новый или изменился, и поставить фото в очередь"""
+        # Текст альбома — подпись одного из его сообщений
+        message = next((message for message in messages if post_text(message)), None)
+        if message is None:
+            return
+        key = str(message.id)
+        digest = content_hash(messages)
+        known = self.state["posts"].get(key)
+        if known and known["hash"] == digest:
+            return
+
+        photo_uuids = []
+        product_uuid = generate_product_uuid(parse_post(message.text))
+        product_dir = os.path.join(self.photos_dir, product_uuid)
+        os.makedirs(product_dir, exist_ok=True)
+        for photo_message in messages:
+            media = photo_media(photo_message)
+            if media is None:
+                continue
+            photo_uuid = generate_photo_uuid(photo_message.id)
+            photo_uuids.append(photo_uuid)
+            path = os.path.join(product_dir, f"{photo_uuid}.jpg")
+            if os.path.exists(path):
+                self.metrics.skipped += 1
+                continue
+            self.metrics.queued += 1
+            # Полная очередь приостанавливает чтение канала
+            await self.queue.put((key, media, path))
+
+        self.state["posts"][key] = {
+            "hash": digest,
+            "row": build_row(message, photo_uuids),
+        }
+        self.metrics.posts["edited" if known else "new"] += 1
+
+    async def download_worker(self):
+        while True:
+            key, media, path = await self.queue.get()
+            try:
+                await self.download(media, path)
+                self.metrics.downloaded += 1
+                self.metrics.bytes += os.path.getsize(path)
+            except Exception as e:
+                self.metrics.failed += 1
+                self.incomplete.add(key)
+                print(f"Фото {path} не скачано: {type(e).__name__}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def download(self, media, path):
+        """Скачать фото с повторами; файл появляется только целиком"""
+        part_path = f"{path}.part"
+        for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+            delay = self.resume_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                await self.client.download_media(media, file=part_path)
+                os.replace(part_path, path)
+                return
+            except FloodWaitError as e:
+                if attempt == DOWNLOAD_ATTEMPTS:
+                    raise
+                # Ограничение на весь аккаунт: ждут все загрузчики
+                self.metrics.flood_waits += 1
+                self.resume_at = max(
+                    self.resume_at,
+                    time.monotonic() + e.seconds + random.uniform(0, FLOOD_JITTER),
+                )
+            except (ConnectionError, TimeoutError):
+                if attempt == DOWNLOAD_ATTEMPTS:
+                    raise
+                await asyncio.sleep(random.uniform(0, BACKOFF_BASE * 2**attempt))
+            self.metrics.retries += 1
+
+    async def report(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            print(self.progress())
+
+    def progress(self):
+        return self.metrics.progress(
+            self.queue.qsize(), getattr(self.client, "api_calls", 0)
+        )
+
+
+def load_state(path):
+    """Состояние прошлого прогона или пустое, если его нет"""
+    if not os.path.exists(path):
+        return {"channel": channel_username, "last_message_id": 0, "posts": {}}
+    with open(path, encoding="utf-8") as file:
+        state = json.load(file)
+    if state.get("channel") != channel_username:
+        # Состояние другого канала не подходит: полная синхронизация
+        return {"channel": channel_username, "last_message_id": 0, "posts": {}}
+    return state
+
+
+def save_state(state, path):
+    # Запись через временный файл: прерванный прогон не портит состояние
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(state, file, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def write_csv(state, path):
+    # Новые посты первыми, как в ленте канала
+    rows = [
+        post["row"]
+        for _, post in sorted(
+            state["posts"].items(), key=lambda item: int(item[0]), reverse=True
+        )
+    ]
+    df = pd.DataFrame(rows)
+    if not df.empty:
         # Удаляем дубликаты (если есть повторяющиеся посты)
         df = df.drop_duplicates(subset=["Команда", "Сезон", "Тип формы"], keep="first")
+    df.to_csv(path, index=False, encoding="utf-8-sig")
+    return len(df)
 
-        # Сохраняем в CSV
-        df.to_csv("football_jerseys.csv", index=False, encoding="utf-8-sig")
-        print(f"Данные сохранены в football_jerseys.csv. Найдено {len(df)} записей.")
-        print(f"Фотографии сохранены в папке {PHOTOS_DIR}/<UUID товара>/")
+
+async def sync_channel(client, state_path, csv_path, photos_dir, **options):
+    state = load_state(state_path)
+    sync = ChannelSync(
+        client, state, photos_dir=photos_dir, workers=options.pop("workers")
+    )
+    async with client:
+        await sync.run(**options)
+        save_state(state, state_path)
+        total = write_csv(state, csv_path)
+        print(sync.progress())
+    print(f"Данные сохранены в {csv_path}. Найдено {total} записей.")
+    print(f"Фотографии сохранены в папке {photos_dir}/<UUID товара>/")
+
+
+# Основная функция парсинга
+def parse_telegram_channel(
+    full=False,
+    limit=FULL_SYNC_LIMIT,
+    recheck=RECHECK_LIMIT,
+    state_path=STATE_PATH,
+    csv_path=CSV_PATH,
+    photos_dir=PHOTOS_DIR,
+    workers=DOWNLOAD_WORKERS,
+    progress_interval=PROGRESS_INTERVAL,
+    client=None,
+):
+    if client is None:
+        client = CountingTelegramClient("session_name", api_id, api_hash)
+    asyncio.run(
+        sync_channel(
+            client,
+            state_path,
+            csv_path,
+            photos_dir,
+            full=full,
+            limit=limit,
+            recheck=recheck,
+            workers=workers,
+            progress_interval=progress_interval,
+        )
+    )
 
 
 # Запуск парсера
 if __name__ == "__main__":
-    parse_telegram_channel()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Полная пересинхронизация без учета сохраненного состояния",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=FULL_SYNC_LIMIT,
+        help="Сколько последних постов читать при полной синхронизации",
+    )
+    parser.add_argument(
+        "--recheck",
+        type=int,
+        default=RECHECK_LIMIT,
+        help="Сколько последних обработанных постов сверять на правки (0 — не сверять)",
+    )
+    parser.add_argument("--state", default=STATE_PATH, help="Файл состояния")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DOWNLOAD_WORKERS,
+        help="Одновременных загрузок фото",
+    )
+    parser.add_argument(
+        "--progress-interval",
+        type=float,
+        default=PROGRESS_INTERVAL,
+        help="Как часто печатать прогресс, секунд",
+    )
+    parser.add_argument(
+        "--fake",
+        type=int,
+        metavar="POSTS",
+        help="Прогнать на канале в памяти из POSTS постов (без сети, во временной папке)",
+    )
+    args = parser.parse_args()
+    options = {
+        "full": args.full,
+        "limit": args.limit,
+        "recheck": args.recheck,
+        "workers": args.workers,
+        "progress_interval": args.progress_interval,
+    }
+    if args.fake:
+        from tg_fake_client import FakeTelegramClient
+
+        with tempfile.TemporaryDirectory() as directory:
+            parse_telegram_channel(
+                state_path=os.path.join(directory, STATE_PATH),
+                csv_path=os.path.join(directory, CSV_PATH),
+                photos_dir=os.path.join(directory, PHOTOS_DIR),
+                client=FakeTelegramClient.generate(args.fake),
+                **options,
+            )
+    else:
+        parse_telegram_channel(state_path=args.state, **options)
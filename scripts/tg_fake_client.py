@@ -0,0 +1,139 @@
+"""
+Канал Telegram в памяти для проверки tg_channel_availability_to_csv.py без сети.
+
+FakeTelegramClient повторяет используемую скрапером часть TelegramClient
+(iter_messages, get_messages, download_media, async with) и отдает заранее
+заданные сообщения и байты фото. Задержка загрузки и периодический
+FloodWaitError позволяют проверить пул загрузчиков и повторы:
+
+    python tg_channel_availability_to_csv.py --fake 300 --workers 8
+"""
+
+import asyncio
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+from telethon.errors import FloodWaitError
+
+POST_TEMPLATE = (
+    "Продается футболка «{team}» {season} {kit} от {brand}. Состояние {condition}. "
+    "Цена {price} р. Размер {size}. #{league} #{size}"
+)
+TEAMS = ["Арсенал", "Челси", "Ипсвич", "Манчестер Юнайтед", "Ливерпуль", "Эвертон"]
+BRANDS = ["Adidas", "Nike", "Umbro", "Puma", "Kappa"]
+KITS = ["домашняя", "гостевая", "третья"]
+SIZES = ["S", "M", "L", "XL"]
+
+
+class FakePhoto:
+    def __init__(self, photo_id):
+        self.id = photo_id
+
+
+class FakeMessage:
+    """Сообщение канала с полями, которые читает скрапер"""
+
+    def __init__(self, message_id, text="", photo=None, grouped_id=None, date=None):
+        self.id = message_id
+        self.text = text
+        self.photo = photo
+        self.media = None
+        self.grouped_id = grouped_id
+        self.date = date
+
+
+class FakeTelegramClient:
+    def __init__(self, messages, photos, latency=0.02, flood_every=0, flood_seconds=1):
+        """
+        messages — сообщения канала, photos — {id фото: байты}; каждый
+        flood_every-й вызов download_media отвечает FloodWait на flood_seconds.
+        """
+        self.messages = sorted(messages, key=lambda message: message.id)
+        self.photos = photos
+        self.latency = latency
+        self.flood_every = flood_every
+        self.flood_seconds = flood_seconds
+        self.api_calls = 0
+        # Сколько сообщений отдал iter_messages: по нему видно, читается ли
+        # канал дальше, пока очередь загрузок полна
+        self.messages_read = 0
+        self.downloads = 0
+        self.active_downloads = 0
+        self.max_active_downloads = 0
+
+    @classmethod
+    def generate(cls, posts, album_size=4, seed=0, **kwargs):
+        """Канал из posts альбомов по album_size фото со случайными байтами"""
+        rng = random.Random(seed)
+        messages, photos = [], {}
+        started = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        message_id = 1
+        for post in range(posts):
+            text = POST_TEMPLATE.format(
+                team=f"{rng.choice(TEAMS)} {post}",
+                season=f"{rng.randint(1995, 2024)}/{rng.randint(0, 99):02d}",
+                kit=rng.choice(KITS),
+                brand=rng.choice(BRANDS),
+                condition=f"{rng.randint(3, 5)}/5",
+                price=rng.randrange(2000, 15000, 100),
+                size=rng.choice(SIZES),
+                league="АПЛ",
+            )
+            date = started + timedelta(hours=post)
+            for index in range(album_size):
+                photos[message_id] = rng.randbytes(rng.randint(20_000, 60_000))
+                messages.append(
+                    FakeMessage(
+                        message_id,
+                        text=text if index == 0 else "",
+                        photo=FakePhoto(message_id),
+                        grouped_id=10_000 + post if album_size > 1 else None,
+                        date=date,
+                    )
+                )
+                message_id += 1
+        return cls(messages, photos, **kwargs)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def iter_messages(self, channel, limit=None, min_id=0, max_id=0):
+        """От новых к старым, страницами по 100 (как запросы GetHistory)"""
+        selected = [
+            message
+            for message in reversed(self.messages)
+            if message.id > min_id and (not max_id or message.id < max_id)
+        ][:limit]
+        for index, message in enumerate(selected):
+            if index % 100 == 0:
+                self.api_calls += 1
+                await asyncio.sleep(0)
+            self.messages_read += 1
+            yield message
+
+    async def get_messages(self, channel, ids):
+        self.api_calls += 1
+        by_id = {message.id: message for message in self.messages}
+        return [by_id.get(message_id) for message_id in ids]
+
+    async def download_media(self, message, file):
+        self.api_calls += 1
+        self.downloads += 1
+        if self.flood_every and self.downloads % self.flood_every == 0:
+            raise FloodWaitError(request=None, capture=self.flood_seconds)
+        self.active_downloads += 1
+        self.max_active_downloads = max(
+            self.max_active_downloads, self.active_downloads
+        )
+        try:
+            await asyncio.sleep(self.latency)
+            os.makedirs(os.path.dirname(file) or ".", exist_ok=True)
+            with open(file, "wb") as output:
+                output.write(self.photos[message.photo.id])
+        finally:
+            self.active_downloads -= 1
+        return file